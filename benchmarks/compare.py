@@ -0,0 +1,55 @@
+import sys
+import json
+import argparse
+
+# Returns (name, stage, baseline, current, ratio) for every stage whose time
+# grew by more than its threshold. Stages missing from either run are skipped.
+def findRegressions(baseline: dict, current: dict, threshold: float, stageThresholds: dict[str, float],
+                    minTime: float = 0.0) -> list[tuple[str, str, float, float, float]]:
+    regressions = []
+    for name, result in current['results'].items():
+        if name not in baseline['results']:
+            continue
+        base = baseline['results'][name]
+        stages = [(stage, t, base['timings'].get(stage)) for stage, t in result['timings'].items()]
+        stages += [(f'pass:{stage}', t, base['passes'].get(stage)) for stage, t in result['passes'].items()]
+        for stage, t, baseT in stages:
+            if baseT is None or max(t, baseT) < minTime:
+                continue
+            ratio = t / baseT if baseT > 0 else float('inf')
+            if ratio > 1 + stageThresholds.get(stage, threshold):
+                regressions.append((name, stage, baseT, t, ratio))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare two benchmark result files and report regressions')
+    parser.add_argument('baseline', type=str, help='Results of the baseline commit')
+    parser.add_argument('current', type=str, help='Results of the commit under test')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Allowed relative slowdown per stage (default: 0.10)')
+    parser.add_argument('--stage-threshold', type=str, action='append', default=[], metavar='STAGE=RATIO',
+                        help='Override the threshold for one stage, e.g. codegen=0.25 or pass:Dead Code Elimination=0.5')
+    parser.add_argument('--min-time', type=float, default=0.001, help='Ignore stages faster than this many seconds in both runs')
+    args = parser.parse_args()
+
+    stageThresholds = {}
+    for override in args.stage_threshold:
+        stage, _, ratio = override.rpartition('=')
+        if not stage:
+            parser.error(f'Invalid --stage-threshold: {override}')
+        stageThresholds[stage] = float(ratio)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    regressions = findRegressions(baseline, current, args.threshold, stageThresholds, args.min_time)
+    for name, stage, baseT, t, ratio in regressions:
+        print(f'{name} {stage}: {baseT * 1000:.2f}ms -> {t * 1000:.2f}ms ({(ratio - 1) * 100:+.1f}%)')
+    if regressions:
+        print(f'{len(regressions)} regression{"s" if len(regressions) != 1 else ""} found.')
+        sys.exit(1)
+    print('No regressions found.')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+import os
+import sys
+import bz2
+import json
+import gzip
+import lzma
+import time
+import functools
+import shutil
+import argparse
+import platform
+import tempfile
+import peekle
+from .corpus import CASES, PROTOCOLS, generateCorpus
+
+CODECS = {
+    'gzip': (gzip.compress, gzip.open),
+    'bz2': (bz2.compress, bz2.open),
+    'xz': (lzma.compress, lzma.open),
+    'lzma': (functools.partial(lzma.compress, format=lzma.FORMAT_ALONE), lzma.open),
+}
+
+# Decompresses to a temporary file first, then disassembles that file. This is
+# what running peekle on compressed pickles took before streaming support.
+def decompressFirst(path: str, codec: str, scratch: str):
+    with CODECS[codec][1](path, 'rb') as src, tempfile.NamedTemporaryFile(dir=scratch) as tmp:
+        shutil.copyfileobj(src, tmp, 1 << 20)
+        tmp.flush()
+        tmp.seek(0)
+        return peekle.disassemble(tmp)
+
+# Disassembles straight from the compressed file.
+def streaming(path: str, codec: str, scratch: str):
+    with open(path, 'rb') as f:
+        return peekle.disassemble(f)
+
+def _best(func, repeat: int, *args) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        t = time.perf_counter() - start
+        best = t if best is None else min(best, t)
+    return best
+
+def benchmarkCase(data: bytes, codecs: list[str], repeat: int, scratch: str) -> dict:
+    result = {'size': len(data)}
+    for codec in codecs:
+        compressed = CODECS[codec][0](data)
+        with tempfile.NamedTemporaryFile(dir=scratch, suffix=f'.{codec}', delete=False) as f:
+            f.write(compressed)
+        try:
+            timings = {name: _best(func, repeat, f.name, codec, scratch)
+                       for name, func in [('decompressFirst', decompressFirst), ('streaming', streaming)]}
+        finally:
+            os.unlink(f.name)
+
+        result[codec] = {
+            'compressedSize': len(compressed),
+            'timings': timings,
+            # Throughput in uncompressed MB/s
+            'throughput': {name: len(data) / t / 1e6 for name, t in timings.items()},
+            'speedup': timings['decompressFirst'] / timings['streaming'],
+        }
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare disassembling compressed pickles directly against decompressing them to disk first')
+    parser.add_argument('-o', '--output', type=str, default=None, help='File to write the JSON results to (default: stdout)')
+    parser.add_argument('--scale', type=int, default=1, help='Size multiplier for every corpus case')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs per approach, the best one is reported')
+    parser.add_argument('--case', type=str, action='append', choices=list(CASES), help='Only run the given case (may be repeated)')
+    parser.add_argument('--protocol', type=int, action='append', choices=list(PROTOCOLS), help='Only run the given protocol (may be repeated, default: 4)')
+    parser.add_argument('--codec', type=str, action='append', choices=list(CODECS), help='Only run the given codec (may be repeated)')
+    parser.add_argument('--scratch', type=str, default=None, help='Directory for the compressed inputs and decompressed temporary files')
+    args = parser.parse_args()
+
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 20000))
+
+    codecs = args.codec or list(CODECS)
+    results = {}
+    for name, data in generateCorpus(args.scale, args.case, args.protocol or [4]):
+        results[name] = benchmarkCase(data, codecs, args.repeat, args.scratch)
+        summary = {codec: f'{results[name][codec]["speedup"]:.2f}x' for codec in codecs}
+        print(f'{name}: streaming speedup {summary}', file=sys.stderr)
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'scale': args.scale,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+import os
+import math
+import pickle
+import random
+import string
+import operator
+import argparse
+import datetime
+import collections
+
+PROTOCOLS = range(0, pickle.HIGHEST_PROTOCOL + 1)
+
+class Point:
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+    def __reduce__(self):
+        return (Point, (self.x, self.y))
+
+class Record:
+    def __init__(self, name, tags, score):
+        self.name = name
+        self.tags = tags
+        self.score = score
+
+# Objects referenced many times, so the memo (PUT/GET) does most of the work.
+def memoHeavy(scale: int):
+    rng = random.Random(0)
+    shared = [{'id': i, 'name': f'node{i}'} for i in range(100 * scale)]
+    edges = [[rng.choice(shared) for _ in range(8)] for _ in range(500 * scale)]
+    return {'nodes': shared, 'edges': edges}
+
+def deepNesting(scale: int):
+    obj = [0]
+    for i in range(min(50 * scale, 400)):
+        obj = [i, obj, {'depth': i}]
+    return obj
+
+def wideList(scale: int):
+    return list(range(50000 * scale))
+
+def wideDict(scale: int):
+    return {f'key{i}': i for i in range(20000 * scale)}
+
+def largeBytes(scale: int):
+    rng = random.Random(0)
+    return [rng.randbytes(1 << 20) for _ in range(4 * scale)]
+
+# Distinct globals from a handful of stdlib modules.
+def manyGlobals(scale: int):
+    globals_ = []
+    for module in [math, operator, string, os.path, collections, datetime]:
+        for name in sorted(dir(module)):
+            obj = getattr(module, name)
+            if not name.startswith('_') and callable(obj):
+                try:
+                    pickle.dumps(obj)
+                except Exception:
+                    continue
+                globals_.append(obj)
+    return globals_ * scale
+
+def reduceHeavy(scale: int):
+    rng = random.Random(0)
+    points = [Point(rng.random(), rng.random()) for _ in range(5000 * scale)]
+    records = [Record(f'r{i}', ('a', 'b'), i * 0.5) for i in range(2000 * scale)]
+    return {'points': points, 'records': records}
+
+CASES = {
+    'memo_heavy': memoHeavy,
+    'deep_nesting': deepNesting,
+    'wide_list': wideList,
+    'wide_dict': wideDict,
+    'large_bytes': largeBytes,
+    'many_globals': manyGlobals,
+    'reduce_heavy': reduceHeavy,
+}
+
+# Returns (name, pickle bytes) for every case and protocol.
+def generateCorpus(scale: int = 1, cases: list[str] | None = None, protocols=PROTOCOLS):
+    for case, factory in CASES.items():
+        if cases is not None and case not in cases:
+            continue
+        obj = factory(scale)
+        for protocol in protocols:
+            yield f'{case}.p{protocol}', pickle.dumps(obj, protocol=protocol)
+
+def main():
+    parser = argparse.ArgumentParser(description='Write the synthetic benchmark corpus to a directory')
+    parser.add_argument('output', type=str, help='Directory to write the .pkl files to')
+    parser.add_argument('--scale', type=int, default=1, help='Size multiplier for every case')
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    for name, data in generateCorpus(args.scale):
+        with open(os.path.join(args.output, name + '.pkl'), 'wb') as f:
+            f.write(data)
+
+if __name__ == '__main__':
+    main()
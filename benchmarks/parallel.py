@@ -0,0 +1,103 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import collections
+import peekle
+from .corpus import CASES, PROTOCOLS, generateCorpus
+
+# Every stage is timed on its own, from the same input, serially and with the
+# given number of workers. Each returns something that must be the same either
+# way, so that a speedup is never reported for a run that changed the output.
+def _disassemble(data: bytes, workers: int | None):
+    start = time.perf_counter()
+    program = peekle.disassemble(data, workers=workers)
+    t = time.perf_counter() - start
+    return t, str(program)
+
+def _analyze(data: bytes, workers: int | None):
+    program = peekle.disassemble(data)
+    start = time.perf_counter()
+    peekle.analyze(program, workers=workers)
+    t = time.perf_counter() - start
+    # Variables created in workers are named differently, so only the
+    # instructions are compared
+    return t, collections.Counter(insn.op.name for insn in program)
+
+def _codegen(data: bytes, workers: int | None):
+    program = peekle.disassemble(data)
+    peekle.analyze(program)
+    start = time.perf_counter()
+    source = peekle.codegen.CodeGenerator().generateSource(program, workers=workers)
+    t = time.perf_counter() - start
+    # Import lines follow set iteration order
+    lines = source.splitlines()
+    return t, (sorted(line for line in lines if line.startswith('import ')),
+               [line for line in lines if not line.startswith('import ')])
+
+STAGES = {
+    'disassemble': _disassemble,
+    'analyze': _analyze,
+    'codegen': _codegen,
+}
+
+def benchmarkCase(data: bytes, stages: list[str], workers: int, repeat: int) -> dict:
+    result = {'size': len(data)}
+    for name in stages:
+        stage = STAGES[name]
+        timings = {}
+        outputs = {}
+        for label, n in [('serial', None), ('parallel', workers)]:
+            best = None
+            for _ in range(repeat):
+                t, outputs[label] = stage(data, n)
+                best = t if best is None else min(best, t)
+            timings[label] = best
+        result[name] = {
+            'timings': timings,
+            'speedup': timings['serial'] / timings['parallel'],
+            'sameOutput': outputs['serial'] == outputs['parallel'],
+        }
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the parallel pipeline stages against serial runs')
+    parser.add_argument('-o', '--output', type=str, default=None, help='File to write the JSON results to (default: stdout)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes (default: CPU count)')
+    parser.add_argument('--scale', type=int, default=20, help='Size multiplier for every corpus case, large enough to be split')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs per stage, the best one is reported')
+    parser.add_argument('--case', type=str, action='append', choices=list(CASES), help='Only run the given case (may be repeated, default: reduce_heavy and memo_heavy)')
+    parser.add_argument('--protocol', type=int, action='append', choices=list(PROTOCOLS), help='Only run the given protocol (may be repeated, default: 4)')
+    parser.add_argument('--stage', type=str, action='append', choices=list(STAGES), help='Only run the given stage (may be repeated)')
+    args = parser.parse_args()
+
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 20000))
+
+    stages = args.stage or list(STAGES)
+    results = {}
+    for name, data in generateCorpus(args.scale, args.case or ['reduce_heavy', 'memo_heavy'], args.protocol or [4]):
+        results[name] = benchmarkCase(data, stages, args.workers, args.repeat)
+        summary = {stage: f'{results[name][stage]["speedup"]:.2f}x' for stage in stages}
+        print(f'{name}: speedup with {args.workers} workers {summary}', file=sys.stderr)
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'workers': args.workers,
+            'scale': args.scale,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == '__main__':
+    main()
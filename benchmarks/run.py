@@ -0,0 +1,86 @@
+import io
+import sys
+import json
+import time
+import pickle
+import platform
+import argparse
+import pickletools
+import peekle
+from .corpus import CASES, PROTOCOLS, generateCorpus
+
+def _time(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+# Times every pipeline stage for a single pickle, taking the best of `repeat`
+# runs for each stage. pickle.loads and pickletools.dis are the baselines.
+def benchmarkPickle(data: bytes, repeat: int) -> dict:
+    best: dict[str, float] = {}
+    bestPasses: dict[str, float] = {}
+
+    def record(timings: dict, stage: str, t: float):
+        timings[stage] = min(timings.get(stage, t), t)
+
+    result = {'size': len(data)}
+    for _ in range(repeat):
+        record(best, 'pickle.loads', _time(pickle.loads, data)[0])
+        record(best, 'pickletools.dis', _time(pickletools.dis, data, io.StringIO())[0])
+
+        t, program = _time(peekle.disassemble, data)
+        record(best, 'disassemble', t)
+
+        passes = {}
+        transform = peekle.transform.createDefaultTransformManager()
+        t, n = _time(transform.run, program, peekle.transform.DEFAULT_MAX_PASSES, passes)
+        record(best, 'transform', t)
+        for name, t in passes.items():
+            record(bestPasses, name, t)
+
+        t, src = _time(peekle.codegen.CodeGenerator().generateSource, program)
+        record(best, 'codegen', t)
+
+        result['poisoned'] = program.poison
+        result['rounds'] = n
+        result['instructions'] = sum(1 for _ in program)
+        result['outputSize'] = len(src)
+
+    result['timings'] = best
+    result['passes'] = bestPasses
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark each peekle pipeline stage over a synthetic corpus')
+    parser.add_argument('-o', '--output', type=str, default=None, help='File to write the JSON results to (default: stdout)')
+    parser.add_argument('--scale', type=int, default=1, help='Size multiplier for every corpus case')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs per stage, the best one is reported')
+    parser.add_argument('--case', type=str, action='append', choices=list(CASES), help='Only run the given case (may be repeated)')
+    parser.add_argument('--protocol', type=int, action='append', choices=list(PROTOCOLS), help='Only run the given protocol (may be repeated)')
+    args = parser.parse_args()
+
+    # Deeply nested programs recurse through the IL and the AST
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 20000))
+
+    results = {}
+    for name, data in generateCorpus(args.scale, args.case, args.protocol or PROTOCOLS):
+        results[name] = benchmarkPickle(data, args.repeat)
+        print(f'{name}: {results[name]["timings"]}', file=sys.stderr)
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'scale': args.scale,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -1,48 +1,412 @@
+import os
+import sys
+import time
+import json
+import signal
 import argparse
+import contextlib
 import peekle
 
+# Opens the pickle to read from an input file, which may also be a torch
+# checkpoint. Yields the pickle stream and the archive, if any. A zip that is
+# not a checkpoint is reported as a usage error.
+@contextlib.contextmanager
+def openInput(parser, path):
+    if peekle.archive.isArchive(path):
+        try:
+            archive = peekle.TorchArchive(path)
+        except ValueError as e:
+            parser.error(str(e))
+        with archive, archive.openPickle() as f:
+            yield f, archive
+    else:
+        with open(path, 'rb') as f:
+            yield f, None
+
+# Output kinds that --emit accepts, and what producing each of them does
+OUTPUT_ACTIONS = {
+    'stats': 'collected statistics for',
+    'cost': 'estimated the load cost of',
+    'raw-il': 'disassembled',
+    'il': 'disassembled',
+    'raw-il-bin': 'disassembled',
+    'il-bin': 'disassembled',
+    'source': 'decompiled',
+    'pyc': 'decompiled',
+    'pickle': 're-serialized',
+}
+
+def parseEmit(value):
+    kind, sep, path = value.partition('=')
+    if not sep or not path or kind not in OUTPUT_ACTIONS:
+        raise argparse.ArgumentTypeError(f'expected KIND=PATH with KIND one of {", ".join(OUTPUT_ACTIONS)}, got {value!r}')
+    return kind, path
+
+# Writes IL one instruction at a time, so a large program is never rendered
+# into a single string
+def writeIL(program, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        for i, insn in enumerate(program):
+            if i:
+                f.write('\n')
+            f.write(insn.stringifyInsn())
+
+def saveIL(program, path):
+    with open(path, 'wb') as f:
+        program.save(f)
+
+def writeBytes(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def formatSize(n):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if n < 1024 or unit == 'GB':
+            return f'{n:.1f} {unit}' if unit != 'B' else f'{n} B'
+        n /= 1024
+
+# Draws a progress bar with the throughput of the current stage on stderr.
+# Ctrl-C asks the pipeline to stop at its next report, and the outputs are
+# written from what it got to, a second Ctrl-C interrupts.
+class ProgressBar:
+    WIDTH = 30
+
+    def __init__(self, stream=sys.stderr):
+        self.stream = stream
+        self.stage = None
+        self.start = self.last = time.perf_counter()
+        self.lineLength = 0
+        self.cancelRequested = False
+
+    def __call__(self, event):
+        now = time.perf_counter()
+        if event.stage != self.stage:
+            # A stage starts reporting after its first interval, which is
+            # timed from the previous report
+            self.finish()
+            self.stage = event.stage
+            self.start = self.last
+        self.last = now
+        rate = event.done / max(now - self.start, 1e-6)
+
+        if event.total:
+            filled = min(self.WIDTH, self.WIDTH * event.done // event.total)
+            bar = f'[{"#" * filled}{"." * (self.WIDTH - filled)}] {100 * event.done // event.total:3d}%'
+        else:
+            bar = f'{event.done} {event.unit}'
+        if event.unit == 'bytes':
+            throughput = f'{formatSize(rate)}/s'
+        else:
+            throughput = f'{rate:.0f} {event.unit}/s'
+        detail = f' {event.detail}' if event.detail is not None else ''
+        self._write(f'{event.stage:<11} {bar} {throughput}{detail}')
+        return self.cancelRequested
+
+    def _write(self, line):
+        self.stream.write(f'\r{line}{" " * max(0, self.lineLength - len(line))}')
+        self.stream.flush()
+        self.lineLength = len(line)
+
+    def finish(self):
+        if self.lineLength:
+            self.stream.write('\n')
+            self.stream.flush()
+            self.lineLength = 0
+
+    def interrupt(self, signum, frame):
+        self.cancelRequested = True
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+def runBatch(args):
+    summary = peekle.batch.runBatch(args.input, args.output, workers=args.workers, chunkSize=args.chunk_size,
+                                    il=args.il, analysis=not args.no_analysis, poolConstants=args.pool_constants)
+
+    summaryPath = args.summary or os.path.join(args.output, 'summary.json')
+    os.makedirs(os.path.dirname(summaryPath) or '.', exist_ok=True)
+    with open(summaryPath, 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    print(f'Processed {summary["total"]} file{"s" if summary["total"] != 1 else ""} in {summary["elapsed"]:.2f}s '
+          f'({summary["ok"]} ok, {summary["poisoned"]} poisoned, {summary["error"]} failed).')
+    print(f'Summary written to {summaryPath}.')
+
+def writeImports(parser, args):
+    with openInput(parser, args.input) as (f, _):
+        result = peekle.scanImports(f, classify=args.classify)
+
+    for entry in result['imports']:
+        label = f' [{entry["class"]}]' if 'class' in entry else ''
+        print(f'{entry["module"]}.{entry["name"]}: {entry["references"]} references, {entry["calls"]} calls{label}')
+    if result['dynamicGlobals']:
+        print(f'{result["dynamicGlobals"]} globals with names computed at runtime or unknown extension codes.')
+
+    with open(args.output, 'w') as f:
+        json.dump(result, f, indent=2)
+
+    if result['error'] is not None:
+        print(f'Scanned imports, stopped early: {result["error"]}')
+    else:
+        print('Successfully scanned imports. Happy reversing!')
+
+def writeDiff(parser, args):
+    old, new = args.input
+    with openInput(parser, old) as (f, _):
+        oldProgram = peekle.disassemble(f)
+    with openInput(parser, new) as (f, _):
+        newProgram = peekle.disassemble(f)
+    result = peekle.diff.diffPrograms(oldProgram, newProgram, snippets=not args.no_snippets)
+
+    print(result)
+    with open(args.output, 'w') as f:
+        json.dump(result.toDict(), f, indent=2)
+
+def serve(args):
+    memoryLimit = args.memory_limit * 1024 * 1024 if args.memory_limit is not None else None
+    server = peekle.server.DecompileServer(args.serve, workers=args.workers, timeout=args.timeout, memoryLimit=memoryLimit)
+    print(f'Listening on {args.serve}.')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
 def main():
     parser = argparse.ArgumentParser(prog='Peekle CLI', description='Disassemble and decompile pickle files')
-    parser.add_argument('input', type=str, help='The input file to disassemble/decompile')
-    parser.add_argument('output', type=str, help='The output file to write the disassemble/decompiled code to')
+    parser.add_argument('paths', type=str, nargs='*', metavar='input ... output',
+                        help='The input file (a pickle, optionally gzip/bz2/xz compressed, a torch zip checkpoint, or IL saved with --emit il-bin) to disassemble/decompile, followed by the output file to write the disassembled/decompiled code to '
+                             '(optional with --emit; with --batch: input files, directories or glob patterns, followed by the output directory)')
     parser.add_argument('--il', action='store_true', help='Output the disassembled IL instead of decompiling')
+    parser.add_argument('--stats', action='store_true', help='Output opcode and memo statistics as JSON instead of decompiling')
+    parser.add_argument('--cost', action='store_true', help='Output an estimate of the memory loading the pickle takes, by type, as JSON instead of decompiling')
+    parser.add_argument('--imports', action='store_true', help='Only scan for the globals the pickle imports and calls, output as JSON')
+    parser.add_argument('--classify', action='store_true', help='Classify scanned globals as pure, constructor, impure or unresolved (with --imports)')
+    parser.add_argument('--purity', type=str, action='append', default=[], metavar='PATH',
+                        help='Load side-effect summaries from a JSON file of {module: {name: "pure" | "constructor" | "impure"}}, "*" naming the rest of a module (repeatable)')
+    parser.add_argument('--diff', action='store_true', help='Compare two pickles structurally and output the paths that differ as JSON (input: the old and the new pickle)')
+    parser.add_argument('--no-snippets', action='store_true', help='Do not decompile the differing values (with --diff)')
+    parser.add_argument('--pyc', action='store_true', help='Output the decompiled code as a compiled .pyc file instead of source')
+    parser.add_argument('--emit', type=parseEmit, action='append', default=[], metavar='KIND=PATH',
+                        help=f'Also write the given output to PATH, from the same disassembly (repeatable, KIND: {", ".join(OUTPUT_ACTIONS)}; '
+                             'raw-il is the IL before analysis, il-bin and raw-il-bin save it in the binary IL format, which can be read back as input)')
+    parser.add_argument('--pickle', action='store_true', help='Output an optimized pickle re-serialized from the analyzed IL instead of decompiling')
+    parser.add_argument('--protocol', type=int, choices=[4, 5], default=4, help='Pickle protocol to write (with --pickle, default: 4)')
+    parser.add_argument('--cache', type=str, metavar='DIR', help='Directory to cache compiled code in, keyed on the input hash (requires --pyc)')
+    parser.add_argument('--query', type=str, metavar='PATH', help="Only decompile the value at the given path, e.g. \"['state_dict']['encoder.weight']\"")
     parser.add_argument('--no-analysis', action='store_true', help='Do not run any analysis passes')
+    parser.add_argument('--pool-constants', action='store_true', help='Bind repeated constants to a name once instead of inlining every occurrence')
+    parser.add_argument('--sidecar-dir', type=str, metavar='DIR', help='Write large numpy arrays to .npy files in DIR and memory-map them instead of inlining their data')
+    parser.add_argument('--progress', action='store_true', help='Show a progress bar on stderr, Ctrl-C then stops early and writes what was decompiled so far')
+    parser.add_argument('--memory', action='store_true', help='Report peak and retained memory and the top allocation sites for each stage')
+    parser.add_argument('--memory-json', type=str, metavar='PATH', help='Write the memory report as JSON to PATH (implies --memory)')
+    parser.add_argument('--batch', action='store_true', help='Decompile many files over a process pool into an output directory')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes in batch and server mode (default: CPU count), and for the --parallel stages of a single large pickle (default: none)')
+    parser.add_argument('--parallel', type=str, action='append', choices=list(peekle.PARALLEL_STAGES), metavar='STAGE',
+                        help=f'Run this stage of a single pickle on the --workers processes (may be repeated, default: {", ".join(sorted(peekle.DEFAULT_PARALLEL_STAGES))})')
+    parser.add_argument('--chunk-size', type=int, default=1, help='Number of files handed to a worker at a time in batch mode')
+    parser.add_argument('--summary', type=str, metavar='PATH', help='Where to write the JSON batch summary (default: <output>/summary.json)')
+    parser.add_argument('--serve', type=str, metavar='SOCKET', help='Run a persistent decompile server on the given UNIX socket')
+    parser.add_argument('--timeout', type=float, default=None, help='Per-request time limit in seconds in server mode')
+    parser.add_argument('--memory-limit', type=int, default=None, metavar='MB', help='Per-worker memory limit in megabytes in server mode')
 
     args = parser.parse_args()
+    for path in args.purity:
+        try:
+            peekle.transform.loadPurityConfig(path)
+        except (OSError, ValueError) as e:
+            parser.error(f'--purity: {e}')
 
-    with open(args.input, 'rb') as f:
-        disassembler = peekle.dis.Disassembler(f)
-        program = disassembler.disassemble()
-
-    if not args.no_analysis:
-        transform = peekle.transform.TransformManager()
-        transform.add(peekle.transform.ConstantValuePass())
-        transform.add(peekle.transform.ConstantGlobalPass())
-        transform.add(peekle.transform.ConstantGetItemPass())
-        transform.add(peekle.transform.InlineMutableConstantPass())
-        transform.add(peekle.transform.DeadCodePass())
-        transform.add(peekle.transform.GlobalCallPass())
-        transform.add(peekle.transform.InstanceDunderPass())
-        transform.add(peekle.transform.ImportToGlobalPass())
-        transform.add(peekle.transform.GlobalReductionPass())
-        transform.add(peekle.transform.LocalsPass())
-        n = transform.run(program, maxPasses=20)
-        print(f'Analysis passes ran {n} time{"s" if n != 1 else ""}.')
+    if args.serve is not None:
+        if args.paths:
+            parser.error('--serve does not take input or output paths')
+        serve(args)
+        return
 
-    if args.il:
-        src = str(program)
+    if len(args.paths) < (1 if args.emit else 2):
+        parser.error('the following arguments are required: input, output')
+    if args.emit and len(args.paths) == 1:
+        args.input, args.output = args.paths, None
     else:
-        codegen = peekle.codegen.CodeGenerator()
-        src = codegen.generateSource(program)
+        args.input, args.output = args.paths[:-1], args.paths[-1]
+
+    if args.batch:
+        if args.pyc:
+            parser.error('--pyc is not supported in batch mode')
+        if args.emit:
+            parser.error('--emit is not supported in batch mode')
+        runBatch(args)
+        return
+
+    if args.no_snippets and not args.diff:
+        parser.error('--no-snippets requires --diff')
+    if args.diff:
+        if len(args.input) != 2 or args.output is None:
+            parser.error('--diff requires an old and a new input and an output')
+        if args.emit or args.query is not None:
+            parser.error('--diff cannot be combined with --emit or --query')
+        writeDiff(parser, args)
+        return
+
+    if len(args.input) != 1:
+        parser.error('multiple inputs require --batch')
+    args.input = args.input[0]
+
+    if args.query is not None and args.imports:
+        parser.error('--query cannot be combined with --imports')
+    if sum([args.il, args.pyc, args.pickle, args.stats, args.cost, args.imports]) > 1:
+        parser.error('--il, --pyc, --pickle, --stats, --cost and --imports are mutually exclusive')
+    if args.classify and not args.imports:
+        parser.error('--classify requires --imports')
+
+    if args.imports:
+        if args.emit:
+            parser.error('--emit cannot be combined with --imports')
+        writeImports(parser, args)
+        return
+
+    # Every output is served from a single disassembly (and analysis)
+    targets = list(args.emit)
+    if args.output is not None:
+        kind = 'il' if args.il else 'pyc' if args.pyc else 'pickle' if args.pickle else 'stats' if args.stats else 'cost' if args.cost else 'source'
+        targets.insert(0, (kind, args.output))
+    kinds = set(kind for kind, _ in targets)
+    if args.cache is not None and 'pyc' not in kinds:
+        parser.error('--cache requires --pyc')
+
+    key = None
+    cache = None
+    if 'pyc' in kinds:
+        with open(args.input, 'rb') as f:
+            key = peekle.codegen.hashInput(f, f'no-analysis={args.no_analysis}', f'pool-constants={args.pool_constants}',
+                                           f'query={args.query}', f'sidecar-dir={args.sidecar_dir}',
+                                           f'purity={peekle.transform.purityFingerprint()}')
+        if args.cache is not None:
+            cache = peekle.codegen.CodeCache(args.cache)
+            code = cache.get(key)
+            if code is not None:
+                for kind, path in targets:
+                    if kind == 'pyc':
+                        writeBytes(path, peekle.codegen.codeToPyc(code, bytes.fromhex(key)))
+                targets = [(kind, path) for kind, path in targets if kind != 'pyc']
+                if not targets:
+                    print('Loaded compiled code from cache. Happy reversing!')
+                    return
+                print('Loaded compiled code from cache.')
+
+    parallelStages = set(args.parallel) if args.parallel else peekle.DEFAULT_PARALLEL_STAGES
+    stageWorkers = {name: args.workers if name in parallelStages else None for name in peekle.PARALLEL_STAGES}
+
+    memory = peekle.MemoryProfiler() if args.memory or args.memory_json is not None else None
+    stage = memory.stage if memory is not None else lambda name: contextlib.nullcontext()
 
-    with open(args.output, 'wb') as f:
-        f.write(src.encode('utf-8'))
+    bar = None
+    progress = None
+    if args.progress:
+        bar = ProgressBar()
+        progress = peekle.Progress(bar)
+        signal.signal(signal.SIGINT, bar.interrupt)
 
-    action = 'disassembled' if args.il else 'decompiled'
-    if program.poison:
-        print(f'{action.capitalize()} pickle file, some errors encountered.')
+    with stage('disassemble'), openInput(parser, args.input) as (f, archive):
+        if archive is None and peekle.il.isSavedProgram(f.peek(len(peekle.il.IL_MAGIC))):
+            if 'stats' in kinds:
+                parser.error('--stats requires a pickle input')
+            try:
+                program = peekle.il.Program.load(f)
+            except ValueError as e:
+                parser.error(f'cannot load IL program: {e}')
+        else:
+            disassembler = peekle.dis.Disassembler(f, collectStats='stats' in kinds, progress=progress, workers=stageWorkers['disassemble'])
+            program = disassembler.disassemble()
+    if bar is not None:
+        bar.finish()
+
+    for kind, path in targets:
+        if kind == 'stats':
+            print(disassembler.stats)
+            with open(path, 'w') as f:
+                json.dump(disassembler.stats.toDict(), f, indent=2)
+        elif kind == 'cost':
+            # Estimated on the whole program, before any query or analysis
+            cost = peekle.transform.estimateLoadCost(program)
+            print(cost)
+            with open(path, 'w') as f:
+                json.dump(cost.toDict(), f, indent=2)
+
+    if args.query is not None:
+        with stage('query'):
+            try:
+                peekle.transform.sliceProgram(program, args.query)
+            except ValueError as e:
+                parser.error(str(e))
+
+    for kind, path in targets:
+        if kind == 'raw-il':
+            writeIL(program, path)
+        elif kind == 'raw-il-bin':
+            saveIL(program, path)
+
+    # Outputs that are produced after analysis
+    analyzed = [(kind, path) for kind, path in targets if kind not in ('stats', 'cost', 'raw-il', 'raw-il-bin')]
+    if analyzed and not args.no_analysis and not (progress is not None and progress.cancelled):
+        with stage('transform'):
+            n = peekle.analyze(program, workers=stageWorkers['analyze'], progress=progress)
+        if bar is not None:
+            bar.finish()
+        print(f'Analysis passes ran {n} time{"s" if n != 1 else ""}.')
+
+    # Once cancelled, the outputs are written from the partial program without
+    # stopping again
+    if progress is not None and progress.cancelled:
+        progress = None
+
+    if memory is not None:
+        memory.recordProgram(program)
+
+    sidecar = peekle.codegen.SidecarWriter(args.sidecar_dir) if args.sidecar_dir is not None else None
+    with stage('codegen'):
+        for kind, path in analyzed:
+            if kind == 'il':
+                writeIL(program, path)
+            elif kind == 'il-bin':
+                saveIL(program, path)
+            elif kind == 'pickle':
+                try:
+                    writeBytes(path, peekle.codegen.PickleGenerator(protocol=args.protocol).generate(program))
+                except (ValueError, NotImplementedError) as e:
+                    parser.error(f'cannot re-serialize pickle: {e}')
+            elif kind == 'pyc':
+                codegen = peekle.codegen.CodeGenerator(poolConstants=args.pool_constants, sidecar=sidecar, archive=archive)
+                code = codegen.generateCode(program, args.input)
+                if cache is not None:
+                    cache.put(key, code)
+                writeBytes(path, peekle.codegen.codeToPyc(code, bytes.fromhex(key)))
+            else:
+                codegen = peekle.codegen.CodeGenerator(poolConstants=args.pool_constants, sidecar=sidecar, archive=archive,
+                                                       progress=progress)
+                writeBytes(path, codegen.generateSource(program, workers=stageWorkers['codegen']).encode('utf-8'))
+    if bar is not None:
+        bar.finish()
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    if sidecar is not None and sidecar.written:
+        print(f'Wrote {len(sidecar.written)} array{"s" if len(sidecar.written) != 1 else ""} to {args.sidecar_dir}.')
+
+    if memory is not None:
+        print(memory)
+        if args.memory_json is not None:
+            with open(args.memory_json, 'w') as f:
+                json.dump(memory.report(), f, indent=2)
+
+    if len(targets) == 1:
+        action = f'{OUTPUT_ACTIONS[targets[0][0]]} pickle file'
+    else:
+        action = f'wrote {len(targets)} outputs for pickle file'
+    if bar is not None and bar.cancelRequested:
+        print(f'{action[0].upper()}{action[1:]}, cancelled before finishing.')
+    elif program.poison:
+        print(f'{action[0].upper()}{action[1:]}, some errors encountered.')
     else:
-        print(f'Successfully {action} pickle file. Happy reversing!')
+        print(f'Successfully {action}. Happy reversing!')
 
 if __name__ == '__main__':
     main()
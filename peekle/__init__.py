@@ -1,3 +1,12 @@
+from .version import __version__
 from . import codegen
 from .il import dis
 from . import transform
+from . import batch
+from . import server
+from .memory import MemoryProfiler
+from .progress import Progress, ProgressEvent, Cancelled
+from .archive import TorchArchive
+from .diff import StructuralDiff, Change
+from .api import disassemble, analyze, decompile, repickle, estimateLoadCost, diffPickles, scanImports, disassembleAsync, decompileAsync, \
+    PARALLEL_STAGES, DEFAULT_PARALLEL_STAGES
@@ -0,0 +1,260 @@
+import io
+import asyncio
+import inspect
+import functools
+import contextlib
+import concurrent.futures
+from typing import IO, Collection
+from concurrent.futures import Executor, ProcessPoolExecutor
+from . import il
+from .il import dis
+from .il import scan
+from . import transform
+from . import codegen
+from .memory import MemoryProfiler
+from .archive import TorchArchive
+from .progress import Progress, Cancelled
+from .diff import StructuralDiff, diffPrograms
+
+READ_CHUNK_SIZE = 1 << 20
+# Seconds between checks of the event loop while an executor thread waits for
+# an async stream
+BRIDGE_POLL_INTERVAL = 0.1
+
+# Stages decompile can run on several worker processes
+PARALLEL_STAGES = ('disassemble', 'analyze', 'codegen')
+# Stages it runs on the workers unless told otherwise. Parallel disassembly
+# and partitioned analysis send their results back to this process, and have
+# not been measured to be faster than a serial run (see benchmarks/parallel.py),
+# so they are only used when asked for.
+DEFAULT_PARALLEL_STAGES = frozenset(['codegen'])
+
+# Disassemble a pickle into IL. A torch checkpoint's pickle is streamed from the
+# archive. If cancelled through progress, the program read so far is returned,
+# ending in a POISON instruction. With several workers, large framed pickles are
+# decoded in parallel worker processes.
+def disassemble(data: bytes | bytearray | IO[bytes] | TorchArchive, progress: Progress | None = None,
+                workers: int | None = None) -> il.Program:
+    if isinstance(data, TorchArchive):
+        with data.openPickle() as f:
+            return dis.Disassembler(f, progress=progress, workers=workers).disassemble()
+    return dis.Disassembler(data, progress=progress, workers=workers).disassemble()
+
+# Run the default analysis passes over a program in place, returns the number
+# of rounds that ran. With several workers, independent parts of large programs
+# are analyzed in parallel worker processes.
+def analyze(program: il.Program, maxPasses: int = transform.DEFAULT_MAX_PASSES, workers: int | None = None,
+            progress: Progress | None = None) -> int:
+    return transform.createDefaultTransformManager().run(program, maxPasses=maxPasses, workers=workers, progress=progress)
+
+def _noStage(name: str):
+    return contextlib.nullcontext()
+
+# Decompile a pickle into Python source. If a query path is given (e.g.
+# "['state_dict']['encoder.weight']"), only the value at that path is decompiled.
+# If a memory profiler is given, peak and retained memory are recorded for each
+# stage. If a sidecar directory is given, large numpy arrays are written there as
+# .npy files and memory-mapped by the generated code. Storages of a torch
+# checkpoint are memory-mapped from the archive. With several workers, the
+# stages in parallelStages run on a process pool for large pickles. Progress
+# is reported for every stage. If cancelled before code generation, Cancelled is
+# raised with the partial program, after that the source ends with a raise.
+def decompile(data: bytes | bytearray | IO[bytes] | TorchArchive, analysis: bool = True, poolConstants: bool = False,
+              query: str | None = None, memory: MemoryProfiler | None = None, sidecarDir: str | None = None,
+              workers: int | None = None, progress: Progress | None = None,
+              parallelStages: Collection[str] = DEFAULT_PARALLEL_STAGES) -> str:
+    unknown = set(parallelStages) - set(PARALLEL_STAGES)
+    if unknown:
+        raise ValueError(f'Unknown parallel stages: {", ".join(sorted(unknown))}')
+    stageWorkers = {name: workers if name in parallelStages else None for name in PARALLEL_STAGES}
+
+    stage = memory.stage if memory is not None else _noStage
+    with stage('disassemble'):
+        program = disassemble(data, progress=progress, workers=stageWorkers['disassemble'])
+    if progress is not None and progress.cancelled:
+        raise Cancelled(program=program)
+    if query is not None:
+        with stage('query'):
+            transform.sliceProgram(program, query)
+    if analysis:
+        with stage('transform'):
+            analyze(program, workers=stageWorkers['analyze'], progress=progress)
+    if progress is not None and progress.cancelled:
+        raise Cancelled(program=program)
+    if memory is not None:
+        memory.recordProgram(program)
+    sidecar = codegen.SidecarWriter(sidecarDir) if sidecarDir is not None else None
+    with stage('codegen'):
+        archive = data if isinstance(data, TorchArchive) else None
+        generator = codegen.CodeGenerator(poolConstants=poolConstants, sidecar=sidecar, archive=archive, progress=progress)
+        return generator.generateSource(program, workers=stageWorkers['codegen'])
+
+# Re-serializes a pickle from its (analyzed) IL as a framed protocol 4 or 5
+# pickle that loads to the same value. Storages of a torch checkpoint are written
+# back as persistent ids, so the result replaces the checkpoint's data.pkl.
+def repickle(data: bytes | bytearray | IO[bytes] | TorchArchive, analysis: bool = True, protocol: int = 4) -> bytes:
+    program = disassemble(data)
+    if analysis:
+        analyze(program)
+    return codegen.PickleGenerator(protocol=protocol).generate(program)
+
+# Estimates the memory loading a pickle would take and which globals it goes
+# to, without executing anything. See transform.LoadCostEstimator.
+def estimateLoadCost(data: bytes | bytearray | IO[bytes] | TorchArchive) -> transform.LoadCost:
+    return transform.estimateLoadCost(disassemble(data))
+
+# Compares the objects two pickles reconstruct, reporting the paths from the
+# root that differ, with decompiled snippets of both sides unless disabled.
+# See diff.StructuralDiffer.
+def diffPickles(old: bytes | bytearray | IO[bytes] | TorchArchive, new: bytes | bytearray | IO[bytes] | TorchArchive,
+                snippets: bool = True, maxChanges: int | None = None) -> StructuralDiff:
+    return diffPrograms(disassemble(old), disassemble(new), snippets=snippets, maxChanges=maxChanges)
+
+# Lists the globals a pickle references and how often each is called, in a
+# single streaming pass that never builds IL. With classify, every global is
+# also labelled by analysis.classifyGlobal. Globals whose name is computed at
+# runtime, or given by an extension code missing from the copyreg registry, are
+# counted as dynamicGlobals. A malformed pickle still reports the globals found
+# before the error.
+def scanImports(data: bytes | bytearray | IO[bytes], classify: bool = False) -> dict:
+    scanner = scan.ImportScanner(data)
+    imports = []
+    for (module, name), (references, calls) in scanner.scan().items():
+        entry = {'module': module, 'name': name, 'references': references, 'calls': calls}
+        if classify:
+            entry['class'] = transform.analysis.classifyGlobal(module, name)
+        imports.append(entry)
+    return {'imports': imports, 'dynamicGlobals': scanner.dynamicGlobals, 'error': scanner.error}
+
+def _isAsyncStream(data) -> bool:
+    return not isinstance(data, (bytes, bytearray)) and inspect.iscoroutinefunction(getattr(data, 'read', None))
+
+# Reads an async stream (anything with a coroutine read(n), e.g. an
+# asyncio.StreamReader or an aiohttp response body) into memory without
+# blocking the event loop. Bytes and synchronous file objects are returned
+# unchanged.
+async def _readInput(data, chunkSize: int = READ_CHUNK_SIZE):
+    if not _isAsyncStream(data):
+        return data
+
+    buf = bytearray()
+    while True:
+        chunk = await data.read(chunkSize)
+        if not chunk:
+            break
+        buf += chunk
+    return buf
+
+# Blocking file object over an async stream, read from an executor thread: each
+# read waits for the stream's read coroutine to run on the event loop, so the
+# pickle is disassembled as it arrives instead of after it was read in full.
+# A read gives up once the task is cancelled or the loop stops running, rather
+# than waiting for a read coroutine that will never complete. An error reading
+# the stream is kept, to be raised once disassembly stops.
+class _AsyncStreamBridge(io.RawIOBase):
+    def __init__(self, stream, loop: asyncio.AbstractEventLoop):
+        self.stream = stream
+        self.loop = loop
+        self.error = None
+        self.cancelled = False
+
+    def readable(self) -> bool:
+        return True
+
+    def _read(self, n: int) -> bytes:
+        future = asyncio.run_coroutine_threadsafe(self.stream.read(n), self.loop)
+        while True:
+            try:
+                return future.result(BRIDGE_POLL_INTERVAL)
+            except concurrent.futures.TimeoutError:
+                if self.cancelled:
+                    future.cancel()
+                    raise asyncio.CancelledError()
+                if self.loop.is_closed() or not self.loop.is_running():
+                    future.cancel()
+                    raise RuntimeError('Event loop stopped while reading the stream')
+
+    def readinto(self, b) -> int:
+        try:
+            chunk = self._read(len(b))
+        except BaseException as e:
+            self.error = e
+            raise
+        n = len(chunk)
+        b[:n] = chunk
+        return n
+
+def _disassembleBridged(bridge: _AsyncStreamBridge) -> il.Program:
+    program = disassemble(io.BufferedReader(bridge, READ_CHUNK_SIZE))
+    if bridge.error is not None:
+        raise bridge.error
+    return program
+
+# Disassembles on the executor, streaming async input through a bridge. The
+# bridge stops reading when the task is cancelled, the executor thread would
+# otherwise go on waiting for the stream.
+async def _disassembleInput(executor: Executor | None, data) -> il.Program:
+    if not _isAsyncStream(data):
+        return await _runStage(executor, disassemble, data)
+    bridge = _AsyncStreamBridge(data, asyncio.get_running_loop())
+    try:
+        return await _runStage(executor, _disassembleBridged, bridge)
+    except asyncio.CancelledError:
+        bridge.cancelled = True
+        raise
+
+# Reads async streams and file objects into memory to be sent to a process
+# executor. Archives cannot be sent, their path is.
+async def _processInput(data):
+    data = await _readInput(data)
+    if isinstance(data, TorchArchive):
+        return data.path
+    if not isinstance(data, (bytes, bytearray)):
+        data = await _runStage(None, data.read)
+    return data
+
+# Decompiles in a worker process, where archives are opened again from their path
+def _decompileInProcess(data: bytes | bytearray | str, isArchive: bool, analysis: bool, poolConstants: bool) -> str:
+    if not isArchive:
+        return decompile(data, analysis, poolConstants)
+    with TorchArchive(data) as archive:
+        return decompile(archive, analysis, poolConstants)
+
+def _disassembleInProcess(data: bytes | bytearray | str, isArchive: bool) -> il.Program:
+    if not isArchive:
+        return disassemble(data)
+    with TorchArchive(data) as archive:
+        return disassemble(archive)
+
+async def _runStage(executor: Executor | None, func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args))
+
+# Asynchronous disassembly on the given executor (the loop's default executor if
+# None). Async streams are disassembled while they are read. On process
+# executors the input is read into memory first, and the program is pickled
+# back from the worker.
+async def disassembleAsync(data, executor: Executor | None = None) -> il.Program:
+    if isinstance(executor, ProcessPoolExecutor):
+        return await _runStage(executor, _disassembleInProcess, await _processInput(data), isinstance(data, TorchArchive))
+
+    return await _disassembleInput(executor, data)
+
+# Asynchronous decompilation on the given executor (the loop's default executor
+# if None). On thread executors every stage is a separate job, so cancelling the
+# task stops the pipeline at the next stage boundary, and async streams are
+# disassembled while they are read. On process executors the whole pipeline runs
+# as a single job, so that the program is not pickled between the stages, and
+# the input is read into memory first. Storages of a torch checkpoint are
+# memory-mapped from the archive.
+async def decompileAsync(data, executor: Executor | None = None, analysis: bool = True, poolConstants: bool = False) -> str:
+    if isinstance(executor, ProcessPoolExecutor):
+        return await _runStage(executor, _decompileInProcess, await _processInput(data), isinstance(data, TorchArchive),
+                               analysis, poolConstants)
+
+    program = await _disassembleInput(executor, data)
+    if analysis:
+        await _runStage(executor, analyze, program)
+    archive = data if isinstance(data, TorchArchive) else None
+    generator = codegen.CodeGenerator(poolConstants=poolConstants, archive=archive)
+    return await _runStage(executor, generator.generateSource, program)
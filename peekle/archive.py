@@ -0,0 +1,42 @@
+import zipfile
+from typing import IO
+
+def isArchive(path: str) -> bool:
+    return zipfile.is_zipfile(path)
+
+# A torch.save-style zip checkpoint: a top-level directory holding data.pkl,
+# with the raw bytes of every storage under data/. The pickle is streamed
+# straight from the zip entry, nothing is extracted to disk.
+class TorchArchive:
+    PICKLE_NAME = 'data.pkl'
+
+    def __init__(self, path: str):
+        self.path = path
+        self.zip = zipfile.ZipFile(path)
+
+        candidates = [name for name in self.zip.namelist()
+                      if name == self.PICKLE_NAME or name.endswith('/' + self.PICKLE_NAME)]
+        if not candidates:
+            self.zip.close()
+            raise ValueError(f'{path} does not contain a {self.PICKLE_NAME}')
+        # Prefer the shallowest pickle, nested archives may contain their own
+        self.pickleEntry = min(candidates, key=lambda name: name.count('/'))
+        self.prefix = self.pickleEntry[:-len(self.PICKLE_NAME)]
+
+    # Opens the embedded pickle as a stream
+    def openPickle(self) -> IO[bytes]:
+        return self.zip.open(self.pickleEntry)
+
+    # Returns the full name of an entry given relative to the directory of
+    # data.pkl, as recorded by STORAGE instructions
+    def entry(self, name: str) -> str:
+        return self.prefix + name
+
+    def close(self):
+        self.zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
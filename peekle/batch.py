@@ -0,0 +1,185 @@
+import os
+import glob
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor, BrokenExecutor, wait, FIRST_COMPLETED
+from .il import dis
+from . import transform
+from . import codegen
+
+# Per-process pipeline, created once by the pool initializer and reused for
+# every file the worker handles.
+class BatchWorker:
+    def __init__(self, il: bool = False, analysis: bool = True, poolConstants: bool = False):
+        self.il = il
+        self.transform = transform.createDefaultTransformManager() if analysis else None
+        self.codegen = None if il else codegen.CodeGenerator(poolConstants=poolConstants)
+
+    def run(self, inputPath: str, outputPath: str) -> dict:
+        result = {
+            'input': inputPath,
+            'output': outputPath,
+        }
+        timings = {}
+        try:
+            result['inputSize'] = os.path.getsize(inputPath)
+            start = time.perf_counter()
+            with open(inputPath, 'rb') as f:
+                program = dis.Disassembler(f).disassemble()
+            timings['disassemble'] = time.perf_counter() - start
+
+            if self.transform is not None:
+                start = time.perf_counter()
+                result['passes'] = self.transform.run(program, maxPasses=transform.DEFAULT_MAX_PASSES)
+                timings['transform'] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            src = str(program) if self.il else self.codegen.generateSource(program)
+            out = src.encode('utf-8')
+            timings['codegen'] = time.perf_counter() - start
+
+            os.makedirs(os.path.dirname(outputPath) or '.', exist_ok=True)
+            with open(outputPath, 'wb') as f:
+                f.write(out)
+
+            result['status'] = 'poisoned' if program.poison else 'ok'
+            result['outputSize'] = len(out)
+        except Exception as e:
+            result['status'] = 'error'
+            result['error'] = f'{type(e).__name__}: {e}'
+        result['timings'] = timings
+        return result
+
+_worker: BatchWorker | None = None
+
+def _initWorker(il: bool, analysis: bool, poolConstants: bool):
+    global _worker
+    _worker = BatchWorker(il, analysis, poolConstants)
+
+def _runJobs(jobs: list[tuple[str, str]]) -> list[dict]:
+    return [_worker.run(*job) for job in jobs]
+
+# Chunks of jobs submitted per worker ahead of the results
+CHUNKS_AHEAD = 2
+
+# Runs chunks of job indices on a fresh pool, storing every result in files.
+# Returns the chunks that were lost when a worker died, those running at the
+# time, and the ones that were never submitted.
+def _runPool(jobs: list[tuple[str, str]], chunks: list[list[int]], files: list[dict | None],
+             workers: int, initargs: tuple) -> tuple[list[list[int]], list[list[int]]]:
+    pending = deque(chunks)
+    running = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_initWorker, initargs=initargs) as executor:
+        try:
+            while pending or running:
+                while pending and len(running) < workers * CHUNKS_AHEAD:
+                    chunk = pending.popleft()
+                    running[executor.submit(_runJobs, [jobs[i] for i in chunk])] = chunk
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results = future.result()
+                    for i, result in zip(running.pop(future), results):
+                        files[i] = result
+        except BrokenExecutor:
+            return list(running.values()), list(pending)
+    return [], []
+
+def _failedResult(job: tuple[str, str], error: str) -> dict:
+    return {
+        'input': job[0],
+        'output': job[1],
+        'status': 'error',
+        'error': error,
+        'timings': {},
+    }
+
+def _globRoot(pattern: str) -> str:
+    parts = []
+    for part in pattern.split(os.sep):
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return os.sep.join(parts) or '.'
+
+# Expands directories (recursively) and glob patterns into a list of
+# (input path, path relative to its root) pairs.
+def collectInputs(patterns: list[str]) -> list[tuple[str, str]]:
+    inputs = []
+    seen = set()
+
+    def add(path: str, root: str):
+        key = os.path.abspath(path)
+        if key in seen:
+            return
+        seen.add(key)
+        inputs.append((path, os.path.relpath(path, root)))
+
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for dirpath, dirnames, filenames in os.walk(pattern):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    add(os.path.join(dirpath, filename), pattern)
+        elif glob.has_magic(pattern):
+            root = _globRoot(pattern)
+            for path in sorted(glob.glob(pattern, recursive=True)):
+                if os.path.isfile(path):
+                    add(path, root)
+        else:
+            add(pattern, os.path.dirname(pattern) or '.')
+    return inputs
+
+# Returns the output path of every input, its path relative to its root with
+# the extension replaced by suffix. Inputs that would share an output keep their
+# extension (a.pkl.py and a.pickle.py), and any that still collide, e.g. the
+# same relative path under two roots, are numbered (a.pkl.1.py).
+def outputPaths(inputs: list[tuple[str, str]], outputDir: str, suffix: str) -> list[str]:
+    stems = [os.path.normpath(os.path.splitext(rel)[0]) for _, rel in inputs]
+    counts = Counter(stems)
+    used = set()
+    paths = []
+    for stem, (_, rel) in zip(stems, inputs):
+        name = stem if counts[stem] == 1 else os.path.normpath(rel)
+        candidate, n = name, 0
+        while candidate in used:
+            n += 1
+            candidate = f'{name}.{n}'
+        used.add(candidate)
+        paths.append(os.path.join(outputDir, candidate + suffix))
+    return paths
+
+# Decompiles many pickle files over a process pool, mirroring the input layout
+# under outputDir. Returns a summary with per-file status, timings and sizes.
+# When a worker dies (a crash or the out-of-memory killer), the rest of the
+# files go on in a fresh pool. Each file that was being worked on is then run
+# again in a pool of its own, and the ones that kill it are reported as errors.
+def runBatch(patterns: list[str], outputDir: str, workers: int | None = None, chunkSize: int = 1,
+             il: bool = False, analysis: bool = True, poolConstants: bool = False) -> dict:
+    suffix = '.il' if il else '.py'
+    inputs = collectInputs(patterns)
+    jobs = list(zip([path for path, _ in inputs], outputPaths(inputs, outputDir, suffix)))
+
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    initargs = (il, analysis, poolConstants)
+    files: list[dict | None] = [None] * len(jobs)
+    pending = [list(range(i, min(i + chunkSize, len(jobs)))) for i in range(0, len(jobs), chunkSize)]
+    while pending:
+        lost, pending = _runPool(jobs, pending, files, workers, initargs)
+        for i in [i for chunk in lost for i in chunk if files[i] is None]:
+            isolated, _ = _runPool(jobs, [[i]], files, 1, initargs)
+            if isolated:
+                files[i] = _failedResult(jobs[i], 'BrokenProcessPool: the worker process died')
+
+    counts = {'ok': 0, 'poisoned': 0, 'error': 0}
+    for result in files:
+        counts[result['status']] += 1
+
+    return {
+        'workers': workers,
+        'chunkSize': chunkSize,
+        'elapsed': time.perf_counter() - start,
+        'total': len(files),
+        **counts,
+        'files': files,
+    }
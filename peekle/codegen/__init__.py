@@ -1 +1,5 @@
 from .codegen import *
+from .constant_pool import *
+from .bytecode import *
+from .sidecar import *
+from .pickler import *
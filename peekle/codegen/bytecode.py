@@ -0,0 +1,55 @@
+import os
+import hashlib
+import marshal
+import importlib.util
+from types import CodeType
+from typing import IO
+from ..version import __version__
+
+# Hash-based pyc flags (see PEP 552), the source hash is the hash of the input
+# pickle rather than of Python source, so it is never checked against a file.
+PYC_FLAGS_HASH_BASED = 0b01
+
+# The peekle version is part of the hash, so that code cached by another
+# release is never reused
+def hashInput(f: IO[bytes], *options: str) -> str:
+    h = hashlib.sha256(f'peekle={__version__}'.encode('utf-8'))
+    for chunk in iter(lambda: f.read(1 << 20), b''):
+        h.update(chunk)
+    for option in options:
+        h.update(b'\0' + option.encode('utf-8'))
+    return h.hexdigest()
+
+def codeToPyc(code: CodeType, sourceHash: bytes = b'\0' * 8) -> bytes:
+    header = importlib.util.MAGIC_NUMBER + PYC_FLAGS_HASH_BASED.to_bytes(4, 'little') + sourceHash[:8]
+    return header + marshal.dumps(code)
+
+def pycToCode(data: bytes) -> CodeType:
+    if data[:4] != importlib.util.MAGIC_NUMBER:
+        raise ValueError('Bad magic number in pyc data')
+    return marshal.loads(data[16:])
+
+# On-disk cache of compiled code objects keyed on the hash of the input pickle,
+# so repeat runs skip disassembly, analysis and compilation entirely.
+class CodeCache:
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + '.pyc')
+
+    def get(self, key: str) -> CodeType | None:
+        try:
+            with open(self._path(key), 'rb') as f:
+                return pycToCode(f.read())
+        except (OSError, ValueError, EOFError, TypeError):
+            # Missing, truncated or written by another Python version
+            return None
+
+    def put(self, key: str, code: CodeType):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(codeToPyc(code, bytes.fromhex(key)))
+        os.replace(tmp, path)
@@ -2,8 +2,14 @@ from typing import cast
 import sys
 import ast
 import functools
+from types import CodeType
 from .. import il
 from ..transform import analysis
+from .constant_pool import ConstantPool
+from .sidecar import SidecarWriter
+from ..archive import TorchArchive
+from ..progress import Progress
+from .parallel import generateSharded
 
 class CodeGenerator:
     STOP = ast.parse('''
@@ -31,9 +37,67 @@ def build(obj, args: dict):
         obj.__dict__.update(args)
 ''', mode='exec').body[0]
 
+    PERSISTENT_LOAD = ast.parse('''
+def persistent_load(pid):
+    'auto-generated by peekle'
+    raise pickle.UnpicklingError(f'unsupported persistent id: {pid!r}')
+''', mode='exec').body[0]
+
+    # The map of each file, and the archive read from it, are opened once and
+    # shared by all the storages in it. closeStorages() closes the archives and
+    # drops the maps, each of which is unmapped once the storages in it are freed.
+    LOAD_STORAGE = ast.parse('''
+openedStorages = {}
+
+def loadStorage(archive: str | None, entry: str, dtype, numel: int):
+    'auto-generated by peekle'
+    if numel == 0:
+        return torch.storage.TypedStorage(dtype=dtype, device='cpu', _internal=True)
+    path = entry if archive is None else archive
+    if path not in openedStorages:
+        with open(path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        openedStorages[path] = (data, None if archive is None else zipfile.ZipFile(archive))
+    data, z = openedStorages[path]
+    offset = 0
+    if z is not None:
+        info = z.getinfo(entry)
+        if info.compress_type != zipfile.ZIP_STORED:
+            raise ValueError(f'{entry} is compressed and cannot be memory-mapped')
+        header = data[info.header_offset:info.header_offset + 30]
+        offset = info.header_offset + 30 + int.from_bytes(header[26:28], 'little') + int.from_bytes(header[28:30], 'little')
+    storage = torch.frombuffer(data, dtype=torch.uint8, count=numel * dtype.itemsize, offset=offset).untyped_storage()
+    return torch.storage.TypedStorage(wrap_storage=storage, dtype=dtype, _internal=True)
+
+def closeStorages():
+    'auto-generated by peekle'
+    for _, z in openedStorages.values():
+        if z is not None:
+            z.close()
+    openedStorages.clear()
+''', mode='exec').body
+
     dispatch = {}
 
-    def __init__(self):
+    # If a sidecar writer is given, the data of large numpy arrays is written to
+    # .npy files and memory-mapped by the generated code instead of inlined.
+    # If the program was read from a torch checkpoint, storages are mapped from
+    # the archive, otherwise from files relative to the working directory.
+    # With progress, every progress.interval instructions are reported, and
+    # cancelling ends the code generated so far with a raise.
+    def __init__(self, poolConstants: bool = False, poolThreshold: int = 64, sidecar: SidecarWriter | None = None,
+                 archive: TorchArchive | None = None, progress: Progress | None = None):
+        self.poolConstants = poolConstants
+        self.poolThreshold = poolThreshold
+        self.sidecar = sidecar
+        self.archive = archive
+        self.progress = progress
+        self._reset()
+
+    # Clears all per-program state so that a generator can be reused
+    def _reset(self):
+        self.constantPool: ConstantPool | None = None
+
         self.program: il.Program = None
         self.statements: list[ast.stmt] = []
 
@@ -45,6 +109,8 @@ def build(obj, args: dict):
         self.needsStop = False
         self.needsFindClass = False
         self.needsBuild = False
+        self.needsPersistentLoad = False
+        self.needsLoadStorage = False
 
     def _generateConstantGlobalValue(self, value: il.ConstantGlobal) -> ast.expr:
         needsModule = True
@@ -63,7 +129,8 @@ def build(obj, args: dict):
                         break
 
                     global_ = getattr(global_, nameComponents[i])
-                    if global_ in analysis.BUILTIN_CALLS:
+                    # Some module attributes cannot be hashed, e.g. os.environ
+                    if getattr(type(global_), '__hash__', None) is not None and global_ in analysis.BUILTIN_CALLS:
                         needsModule = False
                         nameComponents = nameComponents[i:]
                     i += 1
@@ -83,7 +150,15 @@ def build(obj, args: dict):
         return v
 
     def _generateValue(self, value: il.Value) -> ast.expr:
+        if self.constantPool is not None:
+            name = self.constantPool.lookup(value)
+            if name is not None:
+                return ast.Name(id=name, ctx=ast.Load())
+
         if isinstance(value, il.ConstantValue):
+            # Only unparsing accepts bytearray constants, compiling does not
+            if type(value.value) is bytearray:
+                return ast.Call(func=ast.Name(id='bytearray', ctx=ast.Load()), args=[ast.Constant(value=bytes(value.value))], keywords=[])
             return ast.Constant(value=value.value)
         elif isinstance(value, il.ConstantTuple):
             return ast.Tuple(elts=[self._generateValue(v) for v in value.values], ctx=ast.Load())
@@ -223,6 +298,49 @@ def build(obj, args: dict):
     dispatch[il.InsnType.LSHIFT] = functools.partial(_generateBinExpr, op=ast.LShift())
     dispatch[il.InsnType.RSHIFT] = functools.partial(_generateBinExpr, op=ast.RShift())
 
+    def _generateNdarrayExpr(self, insn: il.Insn):
+        self.imports.add('numpy')
+        numpy = ast.Name(id='numpy', ctx=ast.Load())
+        descr, shape, order, data = insn.args
+
+        path = None
+        if self.sidecar is not None:
+            shapeValue = tuple(cast(il.ConstantValue, v).value for v in cast(il.ConstantTuple, shape).values)
+            path = self.sidecar.write(cast(il.VariableInsn, insn).name, descr.value, shapeValue, order.value, data.value)
+        if path is not None:
+            # Copy-on-write mapping, the array stays writable without touching the file
+            return ast.Call(func=ast.Attribute(value=numpy, attr='load', ctx=ast.Load()), args=[ast.Constant(value=path)],
+                            keywords=[ast.keyword(arg='mmap_mode', value=ast.Constant(value='c'))])
+
+        # frombuffer shares the memory of the bytes literal, which leaves the
+        # array read-only unless the data was pickled as a bytearray
+        array = ast.Call(func=ast.Attribute(value=numpy, attr='frombuffer', ctx=ast.Load()), args=[self._generateValue(data)],
+                         keywords=[ast.keyword(arg='dtype', value=self._generateValue(descr))])
+        return ast.Call(func=ast.Attribute(value=array, attr='reshape', ctx=ast.Load()), args=[self._generateValue(shape)],
+                        keywords=[ast.keyword(arg='order', value=self._generateValue(order))])
+    dispatch[il.InsnType.NDARRAY] = _generateNdarrayExpr
+
+    def _generatePersistentLoadExpr(self, insn: il.Insn):
+        self.needsPersistentLoad = True
+        self.imports.add('pickle')
+        args = [self._generateValue(v) for v in insn.args]
+        return ast.Call(func=ast.Name(id='persistent_load', ctx=ast.Load()), args=args, keywords=[])
+    dispatch[il.InsnType.PERSISTENT_LOAD] = _generatePersistentLoadExpr
+
+    def _generateStorageExpr(self, insn: il.Insn):
+        self.needsLoadStorage = True
+        self.imports.update(['mmap', 'zipfile', 'torch'])
+        entry, dtype, numel = insn.args
+        if self.archive is not None:
+            archive = ast.Constant(value=self.archive.path)
+            entry = ast.Constant(value=self.archive.entry(cast(il.ConstantValue, entry).value))
+        else:
+            archive = ast.Constant(value=None)
+            entry = self._generateValue(entry)
+        args = [archive, entry, self._generateValue(dtype), self._generateValue(numel)]
+        return ast.Call(func=ast.Name(id='loadStorage', ctx=ast.Load()), args=args, keywords=[])
+    dispatch[il.InsnType.STORAGE] = _generateStorageExpr
+
     def _generatePoisonExpr(self, insn: il.Insn):
         self.imports.add('pickle')
         error = ast.Attribute(value=ast.Name(id='pickle', ctx=ast.Load()), attr='UnpicklingError', ctx=ast.Load())
@@ -272,9 +390,46 @@ def build(obj, args: dict):
             raise ValueError('Code generator already has a program')
 
         self.program = program
-        for insn in program:
-            self._emitInsn(insn)
+        try:
+            return self._generateModule()
+        finally:
+            self._reset()
+
+    def _generateModule(self) -> ast.Module:
+        self._buildConstantPool()
+
+        if self.progress is None:
+            for insn in self.program:
+                self._emitInsn(insn)
+        else:
+            self._emitReported(self.progress)
+
+        self.statements = self._generatePrelude() + self.statements
+
+        return ast.Module(body=self.statements, type_ignores=[])
 
+    def _emitReported(self, progress: Progress):
+        total = sum(len(insns) for insns in self.program.index.values())
+        for i, insn in enumerate(self.program, 1):
+            self._emitInsn(insn)
+            if i % progress.interval == 0 and \
+                    progress.report('codegen', 'instructions', i, total, f'{len(self.statements)} statements'):
+                self._emitCancelled(f'Cancelled after {i} of {total} instructions')
+                return
+        progress.report('codegen', 'instructions', total, total, f'{len(self.statements)} statements')
+
+    # Ends cancelled code with the error a POISON instruction raises
+    def _emitCancelled(self, message: str):
+        self._emitInsn(il.Insn(il.InsnType.POISON, [il.ConstantValue(message)]))
+
+    def _buildConstantPool(self):
+        if self.poolConstants:
+            self.constantPool = ConstantPool(self.poolThreshold)
+            self.constantPool.build(self.program)
+
+    # Imports, helper functions and pooled constants needed by the statements
+    # generated so far
+    def _generatePrelude(self) -> list[ast.stmt]:
         prefixStmts = []
         if self.needsFindClass:
             self.imports.add('sys')
@@ -288,17 +443,43 @@ def build(obj, args: dict):
             prefixStmts.append(self.FIND_CLASS)
         if self.needsBuild:
             prefixStmts.append(self.BUILD)
-
-        self.statements = prefixStmts + self.statements
-
-        module = ast.Module(body=self.statements, type_ignores=[])
-
-        self.program = None
-        self.statements = []
-        self.ilMap = {}
-
-        return module
+        if self.needsPersistentLoad:
+            prefixStmts.append(self.PERSISTENT_LOAD)
+        if self.needsLoadStorage:
+            prefixStmts.extend(self.LOAD_STORAGE)
+
+        if self.constantPool is not None:
+            for name, value in self.constantPool.definitions():
+                if isinstance(value, il.ConstantTuple):
+                    expr = ast.Tuple(elts=[self._generateValue(v) for v in value.values], ctx=ast.Load())
+                else:
+                    expr = ast.Constant(value=value.value)
+                prefixStmts.append(ast.Assign(targets=[ast.Name(id=name, ctx=ast.Store())], value=expr, lineno=0))
+        return prefixStmts
     
-    # Generate Python source code for the given IL program
-    def generateSource(self, program: il.Program) -> str:
+    # Generate Python source code for the given IL program. With more than one
+    # worker, large programs are generated in shards on a process pool, see
+    # generateSharded.
+    def generateSource(self, program: il.Program, workers: int | None = None) -> str:
+        if workers is not None and workers > 1:
+            return generateSharded(self, program, workers)
         return ast.unparse(self.generate(program))
+
+    # Generate Python source that assigns the value the given IL program stops
+    # with to a name instead of passing it to stop(), e.g. for a snippet of a
+    # larger program. Without helpers, the definitions of build() and the other
+    # helper functions are left out.
+    def generateBinding(self, program: il.Program, name: str = 'value', helpers: bool = True) -> str:
+        omitted = [self.STOP] if helpers else [self.STOP, self.FIND_CLASS, self.BUILD, self.PERSISTENT_LOAD, *self.LOAD_STORAGE]
+        body = [stmt for stmt in self.generate(program).body if not any(stmt is helper for helper in omitted)]
+        last = body[-1] if body else None
+        if isinstance(last, ast.Expr) and isinstance(last.value, ast.Call) and \
+            isinstance(last.value.func, ast.Name) and last.value.func.id == 'stop':
+            body[-1] = ast.Assign(targets=[ast.Name(id=name, ctx=ast.Store())], value=last.value.args[0], lineno=0)
+        return ast.unparse(ast.Module(body=body, type_ignores=[]))
+
+    # Compile the given IL program straight to a code object, skipping the round
+    # trip through source text
+    def generateCode(self, program: il.Program, filename: str = '<peekle>') -> CodeType:
+        module = ast.fix_missing_locations(self.generate(program))
+        return compile(module, filename, 'exec')
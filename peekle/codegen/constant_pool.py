@@ -0,0 +1,117 @@
+from .. import il
+
+# Arguments that the code generator renders as identifiers rather than literals,
+# so they never benefit from pooling.
+IDENTIFIER_ARGS = {
+    il.InsnType.GET_ATTR: 1,
+    il.InsnType.SET_ATTR: 1,
+    il.InsnType.LOCAL: 0,
+}
+
+# Finds immutable constant subtrees (ConstantValue and ConstantTuple) that are
+# repeated across a program, so that they can be bound once to a named constant
+# and referenced by name afterwards.
+class ConstantPool:
+    def __init__(self, threshold: int = 64, prefix: str = 'c'):
+        self.threshold = threshold
+        self.prefix = prefix
+
+        # Keys are cached by node id, the program keeps the nodes alive while
+        # the pool is in use
+        self.keys: dict[int, tuple] = {}
+        self.counts: dict[tuple, int] = {}
+        self.sizes: dict[tuple, int] = {}
+        self.values: dict[tuple, il.Value] = {}
+        self.names: dict[tuple, str] = {}
+
+    # Returns a structural key for a poolable constant, or None if the value
+    # cannot be pooled.
+    def _key(self, value: il.Value) -> tuple | None:
+        if id(value) in self.keys:
+            return self.keys[id(value)]
+
+        key = None
+        if isinstance(value, il.ConstantValue):
+            v = value.value
+            # bytearray is mutable, and None/bool are singletons anyway
+            if isinstance(v, (str, bytes, int, float)) and not isinstance(v, bool):
+                # Floats are keyed by repr to keep 0.0/-0.0 and nan apart
+                key = (type(v), repr(v) if isinstance(v, float) else v)
+                if key not in self.sizes:
+                    if isinstance(v, (str, bytes)):
+                        self.sizes[key] = len(v) + 2
+                    elif isinstance(v, int):
+                        self.sizes[key] = v.bit_length() // 3 + 1
+                    else:
+                        self.sizes[key] = len(key[1])
+        elif isinstance(value, il.ConstantTuple):
+            children = [self._key(v) for v in value.values]
+            if all(child is not None for child in children):
+                key = (tuple, tuple(children))
+                if key not in self.sizes:
+                    self.sizes[key] = 2 + sum(self.sizes[child] + 2 for child in children)
+
+        self.keys[id(value)] = key
+        if key is not None and key not in self.values:
+            self.values[key] = value
+        return key
+
+    def _count(self, value: il.Value, literal: bool = True):
+        if isinstance(value, il.VariableInsn):
+            return
+
+        if isinstance(value, (il.ConstantValue, il.ConstantTuple)):
+            key = self._key(value)
+            if key is not None and literal:
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+        if isinstance(value, il.ConstantDict):
+            for k, v in value.values:
+                self._count(k)
+                self._count(v)
+        elif isinstance(value, (il.ConstantTuple, il.ConstantList, il.ConstantSet, il.ConstantFrozenSet)):
+            for v in value.values:
+                self._count(v)
+
+    def _discount(self, key: tuple, n: int):
+        if key[0] is not tuple:
+            return
+        for child in key[1]:
+            self.counts[child] -= n
+            self._discount(child, n)
+
+    # Counts every constant subtree of the program and picks the ones whose
+    # size × repetitions is above the threshold.
+    def build(self, program: il.Program):
+        for insn in program:
+            identifierArg = IDENTIFIER_ARGS.get(insn.op)
+            for i, arg in enumerate(insn.args):
+                # Call arguments are unpacked into the call expression, so the
+                # tuple itself is never emitted as a literal
+                literal = i != identifierArg and not (insn.op == il.InsnType.CALL and i == 1)
+                self._count(arg, literal)
+
+        # Pick larger subtrees first, a pooled tuple emits its children only
+        # once so their counts drop accordingly
+        candidates = sorted(self.counts, key=lambda key: self.sizes[key], reverse=True)
+        for key in candidates:
+            count = self.counts[key]
+            size = self.sizes[key]
+            if count < 2 or size <= len(self.prefix) + 2 or size * (count - 1) < self.threshold:
+                continue
+
+            self.names[key] = f'{self.prefix}{len(self.names)}'
+            self._discount(key, count - 1)
+
+    # Returns the pooled name of a value, if it has one.
+    def lookup(self, value: il.Value) -> str | None:
+        key = self.keys.get(id(value))
+        if key is None:
+            return None
+        return self.names.get(key)
+
+    # Returns the pooled (name, value) pairs, ordered so that each constant is
+    # defined after the constants it contains.
+    def definitions(self) -> list[tuple[str, il.Value]]:
+        keys = sorted(self.names, key=lambda key: self.sizes[key])
+        return [(self.names[key], self.values[key]) for key in keys]
@@ -0,0 +1,129 @@
+from __future__ import annotations
+import gc
+import ast
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, BrokenExecutor
+from .. import il
+from ..transform import analysis
+
+# Programs smaller than this are always generated serially
+MIN_PARALLEL_SIZE = 20000
+# Smallest number of instructions handed to a worker at a time
+MIN_SHARD_SIZE = 2000
+
+# Per-program flags of the code generator that shards report back, so that the
+# prelude includes every helper any shard needed
+PRELUDE_FLAGS = ['needsStop', 'needsFindClass', 'needsBuild', 'needsPersistentLoad', 'needsLoadStorage']
+
+# Splits a program into runs of at least shardSize instructions, each ending
+# with an instruction that has side effects. The code generator emits every
+# pending temporary at such an instruction, so no expression is inlined across
+# shards and variables of earlier shards are always assigned by name.
+def findShards(insns: list[il.Insn], shardSize: int) -> list[list[il.Insn]]:
+    shards: list[list[il.Insn]] = [[]]
+    for insn in insns:
+        shards[-1].append(insn)
+        if len(shards[-1]) >= shardSize and analysis.hasSideEffects(insn):
+            shards.append([])
+    if not shards[-1]:
+        shards.pop()
+    return shards
+
+_generator = None
+_shards: list[list[il.Insn]] = []
+
+def _initWorker(generator, shards: list[list[il.Insn]]):
+    global _generator, _shards
+    _generator = generator
+    _shards = shards
+
+def _generateShard(i: int) -> tuple[str, set[str], list[bool], list[str]]:
+    generator = _generator
+    program, constantPool = generator.program, generator.constantPool
+    generator._reset()
+    generator.program, generator.constantPool = program, constantPool
+    if generator.sidecar is not None:
+        generator.sidecar.written = []
+
+    shard = _shards[i]
+    members = set(shard)
+    generator.validVariables = {def_ for insn in shard for def_ in insn.defs if def_ not in members}
+    for insn in shard:
+        generator._emitInsn(insn)
+
+    text = ast.unparse(ast.Module(body=generator.statements, type_ignores=[]))
+    flags = [getattr(generator, name) for name in PRELUDE_FLAGS]
+    written = generator.sidecar.written if generator.sidecar is not None else []
+    return text, generator.imports, flags, written
+
+# Reports every shard as it is done, in order. Cancelling stops at the next
+# shard, and shards that have not started are dropped.
+def _reportShards(generator, executor, results, shards: list[list[il.Insn]], total: int):
+    done = 0
+    for i, result in enumerate(results):
+        yield result
+        done += len(shards[i])
+        if generator.progress.report('codegen', 'instructions', done, total, f'shard {i + 1}/{len(shards)}'):
+            executor.shutdown(wait=False, cancel_futures=True)
+            return
+
+# Generates Python source for a program on a pool of worker processes. The
+# program is split into shards at side effects, each shard is unparsed by a
+# worker, and the text is concatenated in order after a single prelude of the
+# imports and helpers all shards needed. The output is the same as that of
+# generateSource. Small programs and programs that do not split are generated
+# serially. Workers are forked, so that the program and the generator are not
+# pickled into each of them: where fork is not available, or the pool fails,
+# the source is generated serially as well.
+def generateSharded(generator, program: il.Program, workers: int, shardSize: int | None = None) -> str:
+    insns = list(program)
+    if workers < 2 or len(insns) < MIN_PARALLEL_SIZE or 'fork' not in multiprocessing.get_all_start_methods():
+        return ast.unparse(generator.generate(program))
+    shards = findShards(insns, shardSize or max(MIN_SHARD_SIZE, len(insns) // (workers * 4)))
+    if len(shards) < 2:
+        return ast.unparse(generator.generate(program))
+
+    if generator.program is not None:
+        raise ValueError('Code generator already has a program')
+    generator.program = program
+    try:
+        # The constant pool covers the whole program, workers inherit it
+        generator._buildConstantPool()
+
+        # Workers are forked with the whole program in memory, which their
+        # garbage collector would otherwise traverse, and copy
+        gc.freeze()
+        try:
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'),
+                                     initializer=_initWorker, initargs=(generator, shards)) as executor:
+                results = executor.map(_generateShard, range(len(shards)))
+                if generator.progress is not None:
+                    results = _reportShards(generator, executor, results, shards, len(insns))
+                results = list(results)
+        except (BrokenExecutor, OSError):
+            results = None
+        finally:
+            gc.unfreeze()
+        if results is None:
+            generator._reset()
+            return ast.unparse(generator.generate(program))
+
+        texts = []
+        for text, imports, flags, written in results:
+            generator.imports.update(imports)
+            for name, needed in zip(PRELUDE_FLAGS, flags):
+                if needed:
+                    setattr(generator, name, True)
+            if generator.sidecar is not None:
+                generator.sidecar.written.extend(written)
+            if text:
+                texts.append(text)
+        if len(results) < len(shards):
+            done = sum(len(shard) for shard in shards[:len(results)])
+            generator._emitCancelled(f'Cancelled after {done} of {len(insns)} instructions')
+            texts.append(ast.unparse(ast.Module(body=generator.statements, type_ignores=[])))
+
+        prelude = ast.unparse(ast.Module(body=generator._generatePrelude(), type_ignores=[]))
+        return '\n'.join(([prelude] if prelude else []) + texts)
+    finally:
+        generator._reset()
@@ -0,0 +1,579 @@
+import io
+import pickle
+import struct
+from typing import cast
+from .. import il
+from ..transform import analysis
+from ..transform.torch_storage import STORAGE_DTYPES
+
+# Functions that stand in for IL operations that have no opcode of their own
+OPERATOR_GLOBALS = {
+    il.InsnType.GET_ATTR: ('builtins', 'getattr'),
+    il.InsnType.SET_ATTR: ('builtins', 'setattr'),
+    il.InsnType.GET_ITEM: ('operator', 'getitem'),
+    il.InsnType.LEN: ('builtins', 'len'),
+    il.InsnType.EQUALS: ('operator', 'eq'),
+    il.InsnType.NOT_EQUALS: ('operator', 'ne'),
+    il.InsnType.LESS_THAN: ('operator', 'lt'),
+    il.InsnType.LESS_EQUALS: ('operator', 'le'),
+    il.InsnType.GREATER_THAN: ('operator', 'gt'),
+    il.InsnType.GREATER_EQUALS: ('operator', 'ge'),
+    il.InsnType.ADD: ('operator', 'add'),
+    il.InsnType.SUB: ('operator', 'sub'),
+    il.InsnType.MUL: ('operator', 'mul'),
+    il.InsnType.FLOOR_DIV: ('operator', 'floordiv'),
+    il.InsnType.TRUE_DIV: ('operator', 'truediv'),
+    il.InsnType.MOD: ('operator', 'mod'),
+    il.InsnType.POW: ('operator', 'pow'),
+    il.InsnType.BITWISE_AND: ('operator', 'and_'),
+    il.InsnType.BITWISE_OR: ('operator', 'or_'),
+    il.InsnType.BITWISE_XOR: ('operator', 'xor'),
+    il.InsnType.LSHIFT: ('operator', 'lshift'),
+    il.InsnType.RSHIFT: ('operator', 'rshift'),
+}
+
+# The functions NEWOBJ and NEWOBJ_EX are disassembled to, which are written
+# back as those opcodes
+NEWOBJ_GLOBAL = ('copyreg', '__newobj__')
+NEWOBJ_EX_GLOBAL = ('copyreg', '__newobj_ex__')
+
+# Instructions that create a fresh object without reading any mutable state,
+# so they can be moved freely
+STATE_FREE_INSNS = set([
+    il.InsnType.MUTABLE_CONSTANT,
+    il.InsnType.NDARRAY,
+    il.InsnType.STORAGE,
+])
+
+# Mutations that may fill a container as part of creating it
+FILL_INSNS = set([
+    il.InsnType.SET_ITEM,
+    il.InsnType.EXTEND,
+])
+
+SMALL_TUPLES = {1: pickle.TUPLE1, 2: pickle.TUPLE2, 3: pickle.TUPLE3}
+
+# Legacy storage class to write back for each dtype, the first listed wins
+STORAGE_CLASSES = {dtype: storageClass for storageClass, dtype in reversed(STORAGE_DTYPES.items())}
+
+# A hashable key for a non-empty tuple of immutable constants, or None if the
+# tuple holds anything that must not be shared
+def _constantKey(value: il.Value):
+    if isinstance(value, il.ConstantValue):
+        v = value.value
+        if type(v) is bytearray:
+            return None
+        # Floats and complex numbers are keyed by repr to keep 0.0/-0.0 apart
+        return (type(v), repr(v) if isinstance(v, (float, complex)) else v)
+    if isinstance(value, il.ConstantGlobal):
+        return ('global', value.module, value.name)
+    if isinstance(value, il.ConstantTuple) and value.values:
+        keys = tuple(_constantKey(v) for v in value.values)
+        return None if None in keys else ('tuple', keys)
+    return None
+
+# Writes opcodes in frames of about FRAME_SIZE_TARGET bytes, large payloads are
+# written outside of frames, as pickle does.
+class _Framer:
+    FRAME_SIZE_TARGET = 64 * 1024
+    FRAME_SIZE_MIN = 4
+
+    def __init__(self, file: io.BytesIO):
+        self.file = file
+        self.frame = bytearray()
+
+    def commit(self, force: bool = False):
+        if not self.frame or (len(self.frame) < self.FRAME_SIZE_TARGET and not force):
+            return
+        if len(self.frame) >= self.FRAME_SIZE_MIN:
+            self.file.write(pickle.FRAME + struct.pack('<Q', len(self.frame)))
+        self.file.write(self.frame)
+        self.frame = bytearray()
+
+    def write(self, data: bytes):
+        self.frame += data
+        self.commit()
+
+    def writeLarge(self, header: bytes, payload: bytes | bytearray):
+        self.commit(force=True)
+        self.file.write(header)
+        self.file.write(payload)
+
+# Serializes an IL program back into a protocol 4 or 5 pickle.
+#
+# Values are memoized only if they are referenced more than once. Containers
+# are created together with the SET_ITEM/EXTEND instructions that fill them
+# (and objects with the BUILD that follows them), and values with a single
+# use are inlined into it when that does not reorder any side effects.
+class PickleGenerator:
+    # Strings and bytes up to this size are memoized when they repeat
+    MAX_MEMO_CONSTANT = 256
+    # How far apart a value and its use may be for the value to be inlined
+    MAX_DEFER_DISTANCE = 256
+    # Largest number of items in a single SETITEMS/APPENDS
+    BATCH_SIZE = 1000
+
+    def __init__(self, protocol: int = 4):
+        if protocol not in (4, 5):
+            raise ValueError(f'Unsupported pickle protocol {protocol}, only 4 and 5 are supported')
+        self.protocol = protocol
+        self._reset()
+
+    def _reset(self):
+        self.program: il.Program = None
+        self.framer: _Framer = None
+
+        self.positions: dict[il.Insn, int] = {}
+        self.references: dict[il.VariableInsn, int] = {}
+        self.constantReferences: dict[tuple, int] = {}
+        self.fills: dict[il.VariableInsn, list[il.Insn]] = {}
+        self.fillOf: dict[il.Insn, il.VariableInsn] = {}
+        self.deferred: set[il.VariableInsn] = set()
+        self.emitAt: dict[il.VariableInsn, int] = {}
+
+        self.memo: dict[il.VariableInsn | tuple, int] = {}
+
+    # Counts how often every variable, global and small constant is referenced
+    def _countReferences(self, value: il.Value):
+        if isinstance(value, il.VariableInsn):
+            self.references[value] = self.references.get(value, 0) + 1
+        elif isinstance(value, il.ConstantGlobal):
+            key = ('global', value.module, value.name)
+            self.constantReferences[key] = self.constantReferences.get(key, 0) + 1
+        elif isinstance(value, il.ConstantValue):
+            v = value.value
+            if type(v) in (str, bytes) and len(v) <= self.MAX_MEMO_CONSTANT:
+                key = (type(v), v)
+                self.constantReferences[key] = self.constantReferences.get(key, 0) + 1
+        elif isinstance(value, il.ConstantTuple) and _constantKey(value) is not None:
+            key = _constantKey(value)
+            self.constantReferences[key] = self.constantReferences.get(key, 0) + 1
+        elif isinstance(value, il.ConstantDict):
+            for k, v in value.values:
+                self._countReferences(k)
+                self._countReferences(v)
+        elif hasattr(value, 'values'):
+            for v in value.values:
+                self._countReferences(v)
+
+    def _sortedUses(self, insn: il.VariableInsn) -> list[il.Insn]:
+        return sorted(insn.uses, key=lambda use: self.positions[use])
+
+    # The leading uses of a freshly created value that fill it in
+    def _collectFills(self, insn: il.VariableInsn, ops: set[il.InsnType]) -> list[il.Insn]:
+        fills = []
+        for use in self._sortedUses(insn):
+            if use.op not in ops or use.args[0] is not insn or \
+                any(insn in arg.valueDefs() for arg in use.args[1:]):
+                break
+            fills.append(use)
+        return fills
+
+    # Instructions that may be emitted out of order around anything that does
+    # not reference them
+    def _isHarmless(self, insn: il.Insn) -> bool:
+        return insn.op in STATE_FREE_INSNS or \
+            (insn in self.fillOf and self.fillOf[insn].op in STATE_FREE_INSNS)
+
+    # Whether the instructions in program positions (start, end) can all be
+    # emitted before the value computed at start without changing the result
+    def _canReorder(self, pure: bool, start: int, end: int, order: list[il.Insn]) -> bool:
+        if end - start > self.MAX_DEFER_DISTANCE:
+            return False
+        for insn in order[start + 1:end]:
+            if self._isHarmless(insn):
+                continue
+            if not pure or analysis.hasSideEffects(insn):
+                return False
+        return True
+
+    def _emitPosition(self, insn: il.Insn) -> int:
+        return self.emitAt.get(insn, self.positions[insn])
+
+    def _otherUse(self, insn: il.VariableInsn) -> il.Insn:
+        fills = self.fills.get(insn, [])
+        return next(use for use in insn.uses if use not in fills)
+
+    # Where the value of an instruction is actually emitted, following
+    # inlined values and fills to the value they end up in. Returns None if
+    # the final position is not known yet.
+    def _finalPosition(self, insn: il.Insn) -> int | None:
+        while True:
+            if insn in self.fillOf:
+                insn = self.fillOf[insn]
+                if insn.op not in STATE_FREE_INSNS:
+                    return None
+            elif isinstance(insn, il.VariableInsn) and insn in self.deferred:
+                insn = self._otherUse(insn)
+            else:
+                return self._emitPosition(insn)
+
+    def _addFills(self, insn: il.VariableInsn, fills: list[il.Insn]):
+        self.fills[insn] = fills
+        self.emitAt[insn] = self.positions[fills[-1]]
+        for fill in fills:
+            self.fillOf[fill] = insn
+
+    def _analyze(self, program: il.Program):
+        order = list(program)
+        self.positions = {insn: i for i, insn in enumerate(order)}
+        for insn in order:
+            for arg in insn.args:
+                self._countReferences(arg)
+
+        # Containers are filled wherever they are created, nothing else can
+        # see them in the meantime
+        for insn in order:
+            if insn.op == il.InsnType.MUTABLE_CONSTANT and isinstance(insn, il.VariableInsn):
+                fills = self._collectFills(insn, FILL_INSNS)
+                if fills:
+                    self._addFills(insn, fills)
+
+        # Objects are created together with their BUILD if nothing in between
+        # can observe the difference
+        for insn in order:
+            if insn.op == il.InsnType.CALL and isinstance(insn, il.VariableInsn):
+                fills = self._collectFills(insn, FILL_INSNS | set([il.InsnType.BUILD]))
+                if fills and self._canReorder(False, self.positions[insn], self.positions[fills[-1]], order):
+                    self._addFills(insn, fills)
+
+        # Values with a single other use are inlined into it, deciding later
+        # instructions first. Inlining only ever moves a value later, so fresh
+        # containers can be inlined as long as their fills are not moved
+        # earlier.
+        candidates = [insn for insn in reversed(order) if isinstance(insn, il.VariableInsn) and
+                      self.references.get(insn, 0) - len(self.fills.get(insn, [])) == 1]
+        for insn in candidates:
+            if insn.op in STATE_FREE_INSNS:
+                use = self._otherUse(insn)
+                owner = self.fillOf.get(use, use)
+                if insn not in self.fills or self._emitPosition(insn) <= self._emitPosition(owner):
+                    self.deferred.add(insn)
+
+        # Anything else may only move past instructions that cannot observe it
+        for insn in candidates:
+            if insn.op in STATE_FREE_INSNS:
+                continue
+            position = self._finalPosition(self._otherUse(insn))
+            pure = not analysis.hasSideEffects(insn) and insn not in self.fills
+            if position is not None and self._canReorder(pure, self._emitPosition(insn), position, order):
+                self.deferred.add(insn)
+
+    def _write(self, data: bytes):
+        self.framer.write(data)
+
+    def _memoize(self, key: il.VariableInsn | tuple):
+        self.memo[key] = len(self.memo)
+        self._write(pickle.MEMOIZE)
+
+    def _get(self, key: il.VariableInsn | tuple):
+        index = self.memo[key]
+        if index < 256:
+            self._write(pickle.BINGET + bytes([index]))
+        else:
+            self._write(pickle.LONG_BINGET + struct.pack('<I', index))
+
+    def _emitInt(self, value: int):
+        if 0 <= value < 256:
+            self._write(pickle.BININT1 + bytes([value]))
+        elif 0 <= value < 65536:
+            self._write(pickle.BININT2 + struct.pack('<H', value))
+        elif -0x80000000 <= value <= 0x7fffffff:
+            self._write(pickle.BININT + struct.pack('<i', value))
+        else:
+            data = pickle.encode_long(value)
+            if len(data) < 256:
+                self._write(pickle.LONG1 + bytes([len(data)]) + data)
+            else:
+                self._write(pickle.LONG4 + struct.pack('<i', len(data)) + data)
+
+    def _emitSized(self, data: bytes | bytearray, short: bytes, medium: bytes, long: bytes):
+        n = len(data)
+        if short is not None and n < 256:
+            header = short + bytes([n])
+        elif medium is not None and n <= 0xffffffff:
+            header = medium + struct.pack('<I', n)
+        else:
+            header = long + struct.pack('<Q', n)
+        if n >= self.framer.FRAME_SIZE_TARGET:
+            self.framer.writeLarge(header, data)
+        else:
+            self._write(header + data)
+
+    def _emitConstant(self, value):
+        t = type(value)
+        key = (t, value) if t in (str, bytes) and len(value) <= self.MAX_MEMO_CONSTANT else None
+        if key is not None and key in self.memo:
+            self._get(key)
+            return
+
+        if value is None:
+            self._write(pickle.NONE)
+        elif t is bool:
+            self._write(pickle.NEWTRUE if value else pickle.NEWFALSE)
+        elif t is int:
+            self._emitInt(value)
+        elif t is float:
+            self._write(pickle.BINFLOAT + struct.pack('>d', value))
+        elif t is str:
+            self._emitSized(value.encode('utf-8', 'surrogatepass'), pickle.SHORT_BINUNICODE, pickle.BINUNICODE, pickle.BINUNICODE8)
+        elif t is bytes:
+            self._emitSized(value, pickle.SHORT_BINBYTES, pickle.BINBYTES, pickle.BINBYTES8)
+        elif t is bytearray:
+            if self.protocol >= 5:
+                self._emitSized(value, None, None, pickle.BYTEARRAY8)
+            else:
+                self._emitCall(('builtins', 'bytearray'), [il.ConstantValue(bytes(value))])
+        else:
+            raise ValueError(f'Cannot serialize constant of type {t.__name__}')
+
+        # Memoizing only pays off if the GETs are shorter than the constant
+        if key is not None and (self.constantReferences.get(key, 0) - 1) * len(value) > 1:
+            self._memoize(key)
+
+    def _emitGlobal(self, module: str, name: str | None):
+        key = ('global', module, name)
+        if key in self.memo:
+            self._get(key)
+            return
+
+        if name is None:
+            self._emitCall(('importlib', 'import_module'), [il.ConstantValue(module)])
+        else:
+            # Protocol 4 unpicklers no longer map Python 2 names
+            module, name = analysis.normalizeGlobal(module, name)
+            self._emitConstant(module)
+            self._emitConstant(name)
+            self._write(pickle.STACK_GLOBAL)
+        if self.constantReferences.get(key, 0) > 1:
+            self._memoize(key)
+
+    def _emitCall(self, callee: tuple[str, str], args: list[il.Value]):
+        self._emitGlobal(*callee)
+        self._emitTuple(args)
+        self._write(pickle.REDUCE)
+
+    # Tuples made up of constants only are memoized when they repeat
+    def _emitConstantTuple(self, value: il.ConstantTuple):
+        key = _constantKey(value)
+        if key is not None and key in self.memo:
+            self._get(key)
+            return
+        self._emitTuple(value.values)
+        if key is not None and self.constantReferences.get(key, 0) > 1:
+            self._memoize(key)
+
+    def _emitTuple(self, values: list[il.Value]):
+        if not values:
+            self._write(pickle.EMPTY_TUPLE)
+            return
+        if len(values) > 3:
+            self._write(pickle.MARK)
+        for v in values:
+            self._emitValue(v)
+        self._write(SMALL_TUPLES.get(len(values), pickle.TUPLE))
+
+    def _emitSetItems(self, items: list[tuple[il.Value, il.Value]]):
+        for i in range(0, len(items), self.BATCH_SIZE):
+            batch = items[i:i + self.BATCH_SIZE]
+            if len(batch) > 1:
+                self._write(pickle.MARK)
+            for k, v in batch:
+                self._emitValue(k)
+                self._emitValue(v)
+            self._write(pickle.SETITEMS if len(batch) > 1 else pickle.SETITEM)
+
+    def _emitAppends(self, values: list[il.Value], op: bytes = pickle.APPENDS):
+        for i in range(0, len(values), self.BATCH_SIZE):
+            batch = values[i:i + self.BATCH_SIZE]
+            if len(batch) == 1 and op == pickle.APPENDS:
+                self._emitValue(batch[0])
+                self._write(pickle.APPEND)
+                continue
+            self._write(pickle.MARK)
+            for v in batch:
+                self._emitValue(v)
+            self._write(op)
+
+    # Emits the mutations that fill the value on top of the stack, merging
+    # consecutive ones into a single SETITEMS/APPENDS
+    def _emitFills(self, fills: list[il.Insn]):
+        i = 0
+        while i < len(fills):
+            op = fills[i].op
+            j = i
+            while j < len(fills) and fills[j].op == op and op != il.InsnType.BUILD:
+                j += 1
+            if op == il.InsnType.SET_ITEM:
+                self._emitSetItems([(fill.args[1], fill.args[2]) for fill in fills[i:j]])
+            elif op == il.InsnType.EXTEND:
+                values = []
+                for fill in fills[i:j]:
+                    values.extend(cast(il.ConstantList, fill.args[1]).values)
+                self._emitAppends(values)
+            else:
+                self._emitValue(fills[i].args[1])
+                self._write(pickle.BUILD)
+                j = i + 1
+            i = j
+
+    def _emitContainer(self, value: il.Value):
+        if isinstance(value, il.ConstantTuple):
+            self._emitConstantTuple(value)
+        elif isinstance(value, il.ConstantList):
+            self._write(pickle.EMPTY_LIST)
+            if value.values:
+                self._emitAppends(value.values)
+        elif isinstance(value, il.ConstantDict):
+            self._write(pickle.EMPTY_DICT)
+            if value.values:
+                self._emitSetItems(value.values)
+        elif isinstance(value, il.ConstantSet):
+            self._write(pickle.EMPTY_SET)
+            if value.values:
+                self._emitAppends(value.values, pickle.ADDITEMS)
+        elif isinstance(value, il.ConstantFrozenSet):
+            self._write(pickle.MARK)
+            for v in value.values:
+                self._emitValue(v)
+            self._write(pickle.FROZENSET)
+        else:
+            raise NotImplementedError(f'Unsupported value type: {value}')
+
+    def _emitValue(self, value: il.Value):
+        if isinstance(value, il.VariableInsn):
+            if value in self.memo:
+                self._get(value)
+            elif value in self.deferred:
+                self._emitVarInsn(value)
+            else:
+                raise ValueError(f'Variable {value.name} is used before it is defined')
+        elif isinstance(value, il.ConstantValue):
+            self._emitConstant(value.value)
+        elif isinstance(value, il.ConstantGlobal):
+            self._emitGlobal(value.module, value.name)
+        else:
+            self._emitContainer(value)
+
+    # Pushes the value of an instruction onto the stack
+    def _emitExpr(self, insn: il.Insn):
+        op = insn.op
+        if op == il.InsnType.CALL:
+            callee, args = insn.args
+            key = (callee.module, callee.name) if isinstance(callee, il.ConstantGlobal) else None
+            if key == NEWOBJ_GLOBAL and isinstance(args, il.ConstantTuple) and args.values:
+                self._emitValue(args.values[0])
+                self._emitTuple(args.values[1:])
+                self._write(pickle.NEWOBJ)
+                return
+            if key == NEWOBJ_EX_GLOBAL and isinstance(args, il.ConstantTuple) and len(args.values) == 3:
+                for value in args.values:
+                    self._emitValue(value)
+                self._write(pickle.NEWOBJ_EX)
+                return
+            self._emitValue(callee)
+            self._emitValue(args)
+            self._write(pickle.REDUCE)
+        elif op == il.InsnType.GLOBAL:
+            self._emitValue(insn.args[0])
+            self._emitValue(insn.args[1])
+            self._write(pickle.STACK_GLOBAL)
+        elif op == il.InsnType.MUTABLE_CONSTANT:
+            self._emitContainer(insn.args[0])
+        elif op == il.InsnType.LOCAL:
+            self._emitGlobal('operator', 'getitem')
+            self._emitCall(('builtins', 'locals'), [])
+            self._emitValue(insn.args[0])
+            self._write(pickle.TUPLE2 + pickle.REDUCE)
+        elif op == il.InsnType.NDARRAY:
+            descr, shape, order, data = insn.args
+            self._emitGlobal('numpy.core.numeric', '_frombuffer')
+            self._write(pickle.MARK)
+            self._emitValue(data)
+            self._emitCall(('numpy', 'dtype'), [descr])
+            self._emitValue(shape)
+            self._emitValue(order)
+            self._write(pickle.TUPLE + pickle.REDUCE)
+        elif op == il.InsnType.PERSISTENT_LOAD:
+            self._emitValue(insn.args[0])
+            self._write(pickle.BINPERSID)
+        elif op == il.InsnType.STORAGE:
+            entry, dtype, numel = insn.args
+            key = cast(il.ConstantValue, entry).value.removeprefix('data/')
+            storageClass = STORAGE_CLASSES[cast(il.ConstantGlobal, dtype).name]
+            self._emitTuple([il.ConstantValue('storage'), il.ConstantGlobal('torch', storageClass),
+                             il.ConstantValue(key), il.ConstantValue('cpu'), numel])
+            self._write(pickle.BINPERSID)
+        elif op in OPERATOR_GLOBALS:
+            self._emitCall(OPERATOR_GLOBALS[op], insn.args)
+        elif op == il.InsnType.POISON:
+            raise ValueError(f'Cannot serialize a program that failed to disassemble: {insn.args[0].stringifyValue()}')
+        else:
+            raise NotImplementedError(f'Unsupported instruction: {insn.stringifyInsn()}')
+
+    def _emitVarInsn(self, insn: il.VariableInsn):
+        self._emitExpr(insn)
+        self._emitFills(self.fills.get(insn, []))
+
+    # Emits an instruction that is not part of creating another value
+    def _emitInsn(self, insn: il.Insn):
+        op = insn.op
+        if isinstance(insn, il.VariableInsn):
+            if insn in self.deferred:
+                return
+            uses = self.references.get(insn, 0) - len(self.fills.get(insn, []))
+            if uses == 0 and insn.op in STATE_FREE_INSNS:
+                return
+            self._emitVarInsn(insn)
+            if uses > 0:
+                self._memoize(insn)
+            self._write(pickle.POP)
+        elif op == il.InsnType.STOP:
+            self._emitValue(insn.args[0])
+            self._write(pickle.STOP)
+        elif op == il.InsnType.SET_ITEM:
+            self._emitValue(insn.args[0])
+            self._emitSetItems([(insn.args[1], insn.args[2])])
+            self._write(pickle.POP)
+        elif op == il.InsnType.EXTEND:
+            self._emitValue(insn.args[0])
+            self._emitAppends(cast(il.ConstantList, insn.args[1]).values)
+            self._write(pickle.POP)
+        elif op == il.InsnType.BUILD:
+            self._emitValue(insn.args[0])
+            self._emitValue(insn.args[1])
+            self._write(pickle.BUILD + pickle.POP)
+        else:
+            self._emitExpr(insn)
+            self._write(pickle.POP)
+
+    # Serialize the given IL program into pickle data
+    def generate(self, program: il.Program) -> bytes:
+        if self.program is not None:
+            raise ValueError('Pickle generator already has a program')
+        if program.poison:
+            raise ValueError('Cannot serialize a program that failed to disassemble')
+        if program.end is None or program.end.op != il.InsnType.STOP:
+            raise ValueError('Cannot serialize a program that does not end in STOP')
+
+        self.program = program
+        try:
+            self._analyze(program)
+
+            out = io.BytesIO()
+            out.write(pickle.PROTO + bytes([self.protocol]))
+            self.framer = _Framer(out)
+
+            scheduled: dict[int, list[il.VariableInsn]] = {}
+            for insn, position in self.emitAt.items():
+                scheduled.setdefault(position, []).append(insn)
+            for insn in program:
+                if insn not in self.fillOf and self.emitAt.get(insn, self.positions[insn]) == self.positions[insn]:
+                    self._emitInsn(insn)
+                for moved in scheduled.get(self.positions[insn], []):
+                    self._emitInsn(moved)
+
+            self.framer.commit(force=True)
+            return out.getvalue()
+        finally:
+            self._reset()
@@ -0,0 +1,44 @@
+import os
+import struct
+
+NPY_MAGIC = b'\x93NUMPY'
+
+# Writes raw array data as a .npy file (see numpy.lib.format), so that the
+# generated code can memory-map it with numpy.load. numpy itself is not needed
+# to write the file.
+def writeNpy(path: str, descr: str, shape: tuple[int, ...], fortranOrder: bool, data: bytes | bytearray):
+    header = repr({'descr': descr, 'fortran_order': fortranOrder, 'shape': tuple(shape)})
+    # The header is padded with spaces so that the data starts on a 64 byte
+    # boundary, and always ends in a newline. Version 2 only widens the length.
+    for version, lengthFormat in [(1, '<H'), (2, '<I')]:
+        prefixSize = len(NPY_MAGIC) + 2 + struct.calcsize(lengthFormat)
+        padded = header + ' ' * (-(prefixSize + len(header) + 1) % 64) + '\n'
+        if len(padded) < 1 << (8 * struct.calcsize(lengthFormat)):
+            break
+
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(NPY_MAGIC + bytes([version, 0]) + struct.pack(lengthFormat, len(padded)))
+        f.write(padded.encode('latin-1'))
+        f.write(data)
+    os.replace(tmp, path)
+
+# Writes the data of large arrays to .npy files in a directory, named after the
+# IL variable they were recognized from.
+class SidecarWriter:
+    def __init__(self, directory: str, threshold: int = 1 << 16):
+        self.directory = directory
+        self.threshold = threshold
+        self.written: list[str] = []
+
+    # Returns the path the data was written to, or None if the array is small
+    # enough to be inlined.
+    def write(self, name: str, descr: str, shape: tuple[int, ...], order: str, data: bytes | bytearray) -> str | None:
+        if len(data) < self.threshold or len(data) == 0:
+            return None
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'{name}.npy')
+        writeNpy(path, descr, shape, order == 'F', data)
+        self.written.append(path)
+        return path
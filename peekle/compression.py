@@ -0,0 +1,114 @@
+import io
+import bz2
+import gzip
+import lzma
+from typing import IO
+
+# Size of the buffer kept in front of a decompressor. The pickle parsers read a
+# few bytes at a time, this turns that into large reads of decompressed data
+# while bounding how far ahead of the parser decompression runs.
+READ_AHEAD = 1 << 16
+
+# Leading bytes of every supported format. None of them can start a pickle.
+MAGIC = {
+    b'\x1f\x8b': 'gzip',
+    b'BZh': 'bz2',
+    b'\xfd7zXZ\x00': 'xz',
+}
+
+# Legacy .lzma files (FORMAT_ALONE) have no magic bytes, only a header of the
+# properties byte, the dictionary size and the uncompressed size. They are
+# recognized like xz does, by a dictionary size of 2^n or 2^n + 2^(n-1) and a
+# size that is unknown or below 256 GiB, and only with the default properties
+# (lc=3, lp=0, pb=2) that every common encoder writes. That byte is the
+# EMPTY_LIST opcode, but a dictionary of at least 4 KiB makes the next byte
+# zero, which is not an opcode, so no pickle starts like this.
+LZMA_ALONE_HEADER_SIZE = 13
+LZMA_ALONE_PROPERTIES = 0x5d
+LZMA_ALONE_MIN_DICT_SIZE = 1 << 12
+LZMA_ALONE_UNKNOWN_SIZE = (1 << 64) - 1
+
+MAGIC_SIZE = max(LZMA_ALONE_HEADER_SIZE, *map(len, MAGIC))
+
+def _isLzmaAlone(head: bytes) -> bool:
+    if len(head) < LZMA_ALONE_HEADER_SIZE or head[0] != LZMA_ALONE_PROPERTIES:
+        return False
+    dictSize = int.from_bytes(head[1:5], 'little')
+    low = dictSize & -dictSize
+    if dictSize < LZMA_ALONE_MIN_DICT_SIZE or dictSize not in (low, low * 3):
+        return False
+    size = int.from_bytes(head[5:13], 'little')
+    return size == LZMA_ALONE_UNKNOWN_SIZE or size < 1 << 38
+
+def detectCompression(head: bytes) -> str | None:
+    for magic, name in MAGIC.items():
+        if head.startswith(magic):
+            return name
+    if _isLzmaAlone(head):
+        return 'lzma'
+    return None
+
+# Exposes a stream as a raw stream that keeps track of its own position,
+# optionally replaying bytes already read from its start. The disassembler asks
+# for the position of every opcode, which pipes cannot report and decompressors
+# only compute through several layers of buffering.
+class _PositionedStream(io.RawIOBase):
+    def __init__(self, file: IO[bytes], head: bytes = b''):
+        self.file = file
+        self.head = head
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b) -> int:
+        if self.head:
+            n = min(len(b), len(self.head))
+            b[:n] = self.head[:n]
+            self.head = self.head[n:]
+        else:
+            n = self.file.readinto(b)
+        self.pos += n
+        return n
+
+    def tell(self) -> int:
+        return self.pos
+
+def _peek(file: IO[bytes]) -> tuple[bytes, IO[bytes]]:
+    if file.seekable():
+        pos = file.tell()
+        head = file.read(MAGIC_SIZE)
+        file.seek(pos)
+        return head, file
+    # Files that cannot seek back are read through a stream that replays the
+    # bytes consumed here
+    head = file.read(MAGIC_SIZE)
+    return head, io.BufferedReader(_PositionedStream(file, head), READ_AHEAD)
+
+def _open(name: str, file: IO[bytes]) -> IO[bytes]:
+    if name == 'gzip':
+        return gzip.GzipFile(fileobj=file, mode='rb')
+    if name == 'bz2':
+        return bz2.BZ2File(file, mode='rb')
+    if name == 'lzma':
+        return lzma.LZMAFile(file, mode='rb', format=lzma.FORMAT_ALONE)
+    return lzma.LZMAFile(file, mode='rb', format=lzma.FORMAT_XZ)
+
+# Returns pickle input ready for parsing: gzip, bz2, xz and legacy lzma
+# compressed data is recognized by its header and decompressed on the fly,
+# anything else is returned as is. Compressed bytes are decompressed while
+# parsing as well, so the uncompressed pickle never has to be held in memory or
+# written to disk.
+def decompressed(obj: bytes | bytearray | IO[bytes]) -> bytes | bytearray | IO[bytes]:
+    if isinstance(obj, (bytes, bytearray)):
+        name = detectCompression(bytes(obj[:MAGIC_SIZE]))
+        if name is None:
+            return obj
+        file = io.BytesIO(obj)
+    else:
+        head, file = _peek(obj)
+        name = detectCompression(head)
+        if name is None:
+            return file
+
+    return io.BufferedReader(_PositionedStream(_open(name, file)), READ_AHEAD)
@@ -0,0 +1,388 @@
+import hashlib
+from typing import cast
+from . import il
+from . import transform
+from . import codegen
+from .transform import analysis
+from .transform.query import MUTATING_INSNS, isMethodLookup, backwardSlice
+
+DIGEST_SIZE = 16
+# Digest standing in for a reference back to an object whose digest is being
+# computed, which closes a cycle
+CYCLE_DIGEST = hashlib.blake2b(b'cycle', digest_size=DIGEST_SIZE).digest()
+
+# Snippets of values whose slice has more instructions than this are not
+# generated
+MAX_SNIPPET_INSNS = 10000
+# Longer snippets are cut off
+MAX_SNIPPET_LENGTH = 4000
+
+def _digest(parts: list[bytes], sort: bool = False) -> bytes:
+    h = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    for part in sorted(parts) if sort else parts:
+        h.update(len(part).to_bytes(4, 'little'))
+        h.update(part)
+    return h.digest()
+
+def _encodeConstant(value) -> bytes:
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value)
+    if isinstance(value, str):
+        return value.encode('utf-8', 'surrogatepass')
+    return repr(value).encode('utf-8', 'backslashreplace')
+
+def _globalDigest(module: str, name: str | None) -> bytes:
+    module, name = analysis.normalizeGlobal(module, name)
+    return _digest([b'global', module.encode('utf-8'), b'' if name is None else name.encode('utf-8')])
+
+# Returns the parts of a container's items, each list item as b'i' and the
+# item, each dict item as b'k', the key and the value
+def _itemParts(value: il.Value) -> list[bytes | il.Value] | None:
+    if isinstance(value, il.ConstantList):
+        return [part for v in value.values for part in (b'i', v)]
+    if isinstance(value, il.ConstantDict):
+        return [part for k, v in value.values for part in (b'k', k, v)]
+    return None
+
+def _isPlainDict(value: il.Value) -> bool:
+    return isinstance(value, il.ConstantDict) or (isinstance(value, il.VariableInsn) and
+        value.op == il.InsnType.MUTABLE_CONSTANT and isinstance(value.args[0], il.ConstantDict))
+
+# Reorders the encoded parts of a dict by key digest, keeping the last value
+# set for each key
+def _sortItems(encoded: list[bytes]) -> list[bytes]:
+    items: dict[bytes, bytes] = {}
+    rest = []
+    i = 1
+    while i < len(encoded):
+        if encoded[i] == b'k':
+            items[encoded[i + 1]] = encoded[i + 2]
+            i += 3
+        else:
+            rest.append(encoded[i])
+            i += 1
+    return encoded[:1] + [part for key in sorted(items) for part in (b'k', key, items[key])] + rest
+
+# Merkle hashes of the values of a program, computed bottom-up. Constants are
+# hashed from their contents and globals from their Python 3 names. A variable
+# is hashed from its instruction and arguments, followed by the instructions
+# that fill it in place (SET_ITEM, EXTEND, BUILD, SET_ATTR) and methods called
+# on it, in program order, so that equal digests mean equal reconstructed
+# objects. The items of lists and dicts are hashed one by one, however they
+# were batched into the pickle, so that e.g. protocol 0 and 2 pickles of a dict
+# hash the same. The items of plain dicts are hashed in the order of their key
+# digests, as dicts compare equal whatever order they were filled in, while
+# those of other objects (e.g. an OrderedDict) stay in program order. Whether two references share an object is not hashed, and the
+# reference that closes a cycle is hashed as CYCLE_DIGEST.
+class MerkleHasher:
+    def __init__(self):
+        # Digests by id of the value, the program must outlive the hasher
+        self.digests: dict[int, bytes] = {}
+
+    def _leaf(self, value: il.Value) -> bytes | None:
+        if isinstance(value, il.ConstantValue):
+            return _digest([b'const', type(value.value).__name__.encode('utf-8'), _encodeConstant(value.value)])
+        if isinstance(value, il.ConstantGlobal):
+            return _globalDigest(value.module, value.name)
+        if isinstance(value, il.VariableInsn) and value.op == il.InsnType.GLOBAL and \
+            all(isinstance(arg, il.ConstantValue) and type(arg.value) is str for arg in value.args):
+            module, name = (cast(il.ConstantValue, arg).value for arg in value.args)
+            return _globalDigest(module, name)
+        return None
+
+    # Returns the labels and children a value is hashed from, in order
+    def _parts(self, value: il.Value) -> list[bytes | il.Value]:
+        if not isinstance(value, il.VariableInsn):
+            items = _itemParts(value)
+            return [type(value).__name__.encode('utf-8')] + (items if items is not None else value.values)
+
+        items = _itemParts(value.args[0]) if value.op == il.InsnType.MUTABLE_CONSTANT else None
+        if items is not None:
+            # The same as a constant container of the same items
+            parts = [type(value.args[0]).__name__.encode('utf-8')] + items
+        else:
+            parts = [value.op.name.encode('utf-8')] + value.args
+
+        fills = [use for use in value.uses if use.op in MUTATING_INSNS and use.args[0] is value]
+        for lookup in value.uses:
+            if isMethodLookup(lookup, value):
+                fills += [call for call in lookup.uses if call.op == il.InsnType.CALL and call.args[0] is lookup]
+        for fill in sorted(fills, key=lambda insn: insn.order):
+            if fill.op == il.InsnType.SET_ITEM:
+                parts += [b'k'] + fill.args[1:]
+            elif fill.op == il.InsnType.EXTEND and isinstance(fill.args[1], il.ConstantList):
+                parts += _itemParts(fill.args[1])
+            elif fill.op in MUTATING_INSNS:
+                parts += [fill.op.name.encode('utf-8')] + fill.args[1:]
+            else:
+                lookup = fill.args[0]
+                name = lookup.args[1] if lookup.op == il.InsnType.GET_ATTR else lookup.args[1].values[1]
+                parts += [b'method', name, fill.args[1]]
+        return parts
+
+    def digest(self, value: il.Value) -> bytes:
+        digests = self.digests
+        if id(value) in digests:
+            return digests[id(value)]
+
+        # Iterative post-order, deep object graphs would exhaust the stack
+        active: set[int] = set()
+        stack: list[tuple[il.Value, list | None]] = [(value, None)]
+        while stack:
+            node, parts = stack[-1]
+            if parts is None:
+                if id(node) in digests:
+                    stack.pop()
+                    continue
+                leaf = self._leaf(node)
+                if leaf is not None:
+                    digests[id(node)] = leaf
+                    stack.pop()
+                    continue
+                parts = self._parts(node)
+                stack[-1] = (node, parts)
+                active.add(id(node))
+                for part in reversed(parts):
+                    if not isinstance(part, bytes) and id(part) not in digests and id(part) not in active:
+                        stack.append((part, None))
+                continue
+
+            stack.pop()
+            active.discard(id(node))
+            encoded = [part if isinstance(part, bytes) else digests.get(id(part), CYCLE_DIGEST) for part in parts]
+            # Sets are unordered, their items are hashed in digest order
+            unordered = isinstance(node, (il.ConstantSet, il.ConstantFrozenSet))
+            if unordered:
+                encoded = encoded[:1] + [_digest(encoded[1:], sort=True)]
+            elif _isPlainDict(node):
+                encoded = _sortItems(encoded)
+            digests[id(node)] = _digest(encoded)
+        return digests[id(value)]
+
+# How a value can be descended into: its kind, a digest of what it is apart
+# from its entries (its type, or the call that created it) and its entries by
+# path label, e.g. "['key']", "[0]" or ".name"
+class _View:
+    def __init__(self, kind: str, head: bytes):
+        self.kind = kind
+        self.head = head
+        self.entries: dict[str, il.Value] = {}
+        # Keys of the item entries, by label
+        self.keys: dict[str, object] = {}
+        self.length = 0
+
+    def addItem(self, key, value: il.Value):
+        label = f'[{key!r}]'
+        self.entries[label] = value
+        self.keys[label] = key
+
+    def addAttr(self, name: str, value: il.Value):
+        self.entries[f'.{name}'] = value
+
+def _addItems(view: _View, value: il.Value) -> bool:
+    if isinstance(value, il.ConstantDict):
+        for k, v in value.values:
+            if not isinstance(k, il.ConstantValue):
+                return False
+            view.addItem(k.value, v)
+        return True
+    if isinstance(value, (il.ConstantList, il.ConstantTuple)):
+        for v in value.values:
+            view.addItem(view.length, v)
+            view.length += 1
+        return True
+    return False
+
+# Adds the entries of an object's state as BUILD sets them, a dict or a
+# (dict, slots) tuple, as attributes
+def _addState(view: _View, state: il.Value, hasher: MerkleHasher) -> bool:
+    if isinstance(state, il.ConstantTuple) and len(state.values) == 2:
+        return all(_addState(view, part, hasher) for part in state.values)
+    if isinstance(state, il.ConstantValue) and state.value is None:
+        return True
+    stateView = _view(state, hasher)
+    if stateView is None or stateView.kind != 'dict':
+        return False
+    for label, v in stateView.entries.items():
+        key = stateView.keys.get(label)
+        if isinstance(key, str) and key.isidentifier():
+            view.addAttr(key, v)
+        else:
+            view.entries[label] = v
+    return True
+
+# A list or dict variable has the same view as a constant of the same items
+def _containerView(container: il.Value) -> _View | None:
+    name = type(container).__name__
+    view = _View(name[len('Constant'):].lower(), _digest([name.encode('utf-8')]))
+    return view if _addItems(view, container) else None
+
+def _view(value: il.Value, hasher: MerkleHasher) -> _View | None:
+    if not isinstance(value, il.VariableInsn):
+        return _containerView(value)
+
+    if value.op == il.InsnType.MUTABLE_CONSTANT:
+        view = _containerView(value.args[0])
+        if view is None:
+            return None
+    else:
+        view = _View('object', _digest([value.op.name.encode('utf-8')] + [hasher.digest(arg) for arg in value.args]))
+
+    for use in sorted(value.uses, key=lambda insn: insn.order):
+        if isMethodLookup(use, value):
+            return None
+        if use.op not in MUTATING_INSNS or use.args[0] is not value:
+            continue
+        if use.op == il.InsnType.SET_ITEM:
+            if not isinstance(use.args[1], il.ConstantValue):
+                return None
+            view.addItem(cast(il.ConstantValue, use.args[1]).value, use.args[2])
+        elif use.op == il.InsnType.EXTEND:
+            if not _addItems(view, use.args[1]):
+                return None
+        elif use.op == il.InsnType.BUILD:
+            if not _addState(view, use.args[1], hasher):
+                return None
+        elif use.op == il.InsnType.SET_ATTR:
+            if not isinstance(use.args[1], il.ConstantValue):
+                return None
+            view.addAttr(cast(il.ConstantValue, use.args[1]).value, use.args[2])
+    return view
+
+# A difference between two pickles: 'added', 'removed' or 'changed' at a path
+# from the root, in the syntax of query paths. old and new are decompiled
+# snippets that assign the value on each side to `value`.
+class Change:
+    def __init__(self, kind: str, path: str, old: str | None = None, new: str | None = None):
+        self.kind = kind
+        self.path = path
+        self.old = old
+        self.new = new
+
+    def toDict(self) -> dict:
+        return {'kind': self.kind, 'path': self.path, 'old': self.old, 'new': self.new}
+
+CHANGE_MARKERS = {'added': '+', 'removed': '-', 'changed': '~'}
+
+class StructuralDiff:
+    def __init__(self):
+        self.changes: list[Change] = []
+        # Set when either program stops at an unsupported opcode, the diff only
+        # covers what was disassembled before it, starting from the first
+        # object created (see StructuralDiffer._root)
+        self.partial = False
+
+    def toDict(self) -> dict:
+        return {'partial': self.partial, 'changes': [change.toDict() for change in self.changes]}
+
+    def __str__(self):
+        if not self.changes:
+            lines = ['No differences']
+        else:
+            lines = [f'{len(self.changes)} difference{"s" if len(self.changes) != 1 else ""}']
+        if self.partial:
+            lines.append('Partial diff, a program could not be fully disassembled')
+        for change in self.changes:
+            lines.append(f'{CHANGE_MARKERS[change.kind]} {change.path or "<root>"}')
+            for marker, snippet in [('-', change.old), ('+', change.new)]:
+                if snippet is not None:
+                    lines += [f'    {marker} {line}' for line in snippet.splitlines()]
+        return '\n'.join(lines)
+
+# Compares the objects two programs reconstruct. Both are hashed bottom-up
+# once, then their graphs are walked from the root together, skipping every
+# pair of values with equal digests, down to the entries that differ. With
+# snippets, each change carries decompiled source of the values involved,
+# generated from just the instructions they depend on. Best run on programs
+# before analysis.
+class StructuralDiffer:
+    def __init__(self, old: il.Program, new: il.Program, snippets: bool = True, maxChanges: int | None = None):
+        self.old = old
+        self.new = new
+        self.snippets = snippets
+        self.maxChanges = maxChanges
+        self.oldHasher = MerkleHasher()
+        self.newHasher = MerkleHasher()
+
+    # The value a program stops on. A program that ends early, at an opcode
+    # that is not supported, has none: its root is taken to be the first object
+    # it created that nothing refers to but the instructions filling it, as the
+    # pickler writes containers before the objects in them.
+    @staticmethod
+    def _root(program: il.Program) -> il.Value:
+        stop = program.end
+        if stop is not None and stop.op == il.InsnType.STOP:
+            return stop.args[0]
+        for insn in program:
+            if isinstance(insn, il.VariableInsn) and insn.op != il.InsnType.GLOBAL and \
+                all((use.op in MUTATING_INSNS and use.args[0] is insn) or isMethodLookup(use, insn) for use in insn.uses):
+                return insn
+        raise ValueError('Cannot diff a program that does not create any object')
+
+    def _snippet(self, program: il.Program, value: il.Value) -> str:
+        needed = backwardSlice(value)
+        if len(needed) > MAX_SNIPPET_INSNS:
+            return f'# {len(needed)} instructions, too large to show'
+
+        snippet = il.Program()
+        snippet.variableCount = program.variableCount
+        varMap: dict[il.VariableInsn, il.VariableInsn] = {}
+        for insn in sorted(needed, key=lambda insn: insn.order):
+            snippet.insertInsn(insn.cloneInsn(varMap), snippet.end)
+        snippet.appendInsn(il.InsnType.STOP, value.cloneValue(varMap))
+        transform.createDefaultTransformManager().run(snippet, transform.DEFAULT_MAX_PASSES)
+
+        source = codegen.CodeGenerator().generateBinding(snippet, helpers=False)
+        if len(source) > MAX_SNIPPET_LENGTH:
+            source = f'{source[:MAX_SNIPPET_LENGTH]}\n# ... {len(source) - MAX_SNIPPET_LENGTH} more characters'
+        return source
+
+    def _record(self, result: StructuralDiff, kind: str, path: str, old: il.Value | None, new: il.Value | None):
+        change = Change(kind, path)
+        if self.snippets:
+            change.old = self._snippet(self.old, old) if old is not None else None
+            change.new = self._snippet(self.new, new) if new is not None else None
+        result.changes.append(change)
+
+    def diff(self) -> StructuralDiff:
+        result = StructuralDiff()
+        result.partial = self.old.poison or self.new.poison
+
+        # Pairs of values to compare, and added or removed values to record
+        pending: list[tuple[str | None, str, il.Value | None, il.Value | None]] = \
+            [(None, '', self._root(self.old), self._root(self.new))]
+        while pending:
+            if self.maxChanges is not None and len(result.changes) >= self.maxChanges:
+                break
+            kind, path, old, new = pending.pop()
+            if kind is not None:
+                self._record(result, kind, path, old, new)
+                continue
+            if self.oldHasher.digest(old) == self.newHasher.digest(new):
+                continue
+
+            oldView, newView = _view(old, self.oldHasher), _view(new, self.newHasher)
+            if oldView is None or newView is None or oldView.kind != newView.kind or oldView.head != newView.head:
+                self._record(result, 'changed', path, old, new)
+                continue
+
+            # Entries are compared in the order of the old value, then added ones
+            children = []
+            for label, oldEntry in oldView.entries.items():
+                if label not in newView.entries:
+                    children.append(('removed', path + label, oldEntry, None))
+                elif self.oldHasher.digest(oldEntry) != self.newHasher.digest(newView.entries[label]):
+                    children.append((None, path + label, oldEntry, newView.entries[label]))
+            for label, newEntry in newView.entries.items():
+                if label not in oldView.entries:
+                    children.append(('added', path + label, None, newEntry))
+            if not children:
+                # The difference is not in the entries, e.g. their order
+                self._record(result, 'changed', path, old, new)
+                continue
+            pending.extend(reversed(children))
+        return result
+
+# Compares the objects two programs reconstruct, see StructuralDiffer
+def diffPrograms(old: il.Program, new: il.Program, snippets: bool = True, maxChanges: int | None = None) -> StructuralDiff:
+    return StructuralDiffer(old, new, snippets=snippets, maxChanges=maxChanges).diff()
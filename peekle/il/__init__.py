@@ -1,2 +1,5 @@
 from .dis import *
 from .il import *
+from .stats import *
+from .scan import *
+from .binary import *
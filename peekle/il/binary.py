@@ -0,0 +1,392 @@
+import gc
+import struct
+from typing import IO, Iterator
+from . import il
+
+# Binary IL format, version 1:
+#
+#   header  IL_MAGIC, varint version
+#   records one tag byte each, followed by
+#     STRING    varint length, UTF-8 bytes: appended to the string table
+#     CONSTANT  kind byte, payload: appended to the constant table
+#     INSN      varint op, varint argument count, references
+#     VARIABLE  varint op, varint name, varint argument count, references:
+#               appended to the variable table
+#     END       flags byte, varint variable count
+#
+# A reference is a varint (index << 1) | isVariable into the constant or the
+# variable table. Strings, constants and variables are written just before the
+# first record that refers to them, so both sides stream: the writer never
+# holds more than the tables, and the reader can build instructions as they
+# arrive. Variable uses are not stored, they follow from the references.
+# Constants are written once per distinct value, containers once per object,
+# so values shared between instructions are still shared after loading.
+IL_MAGIC = b'PKIL'
+IL_FORMAT_VERSION = 1
+
+RECORD_END = 0
+RECORD_STRING = 1
+RECORD_CONSTANT = 2
+RECORD_INSN = 3
+RECORD_VARIABLE = 4
+
+CONSTANT_NONE = 0
+CONSTANT_FALSE = 1
+CONSTANT_TRUE = 2
+CONSTANT_INT = 3
+CONSTANT_FLOAT = 4
+CONSTANT_COMPLEX = 5
+CONSTANT_STR = 6
+CONSTANT_BYTES = 7
+CONSTANT_BYTEARRAY = 8
+CONSTANT_TUPLE = 9
+CONSTANT_LIST = 10
+CONSTANT_DICT = 11
+CONSTANT_SET = 12
+CONSTANT_FROZENSET = 13
+CONSTANT_GLOBAL = 14
+
+CONTAINER_KINDS = {
+    il.ConstantTuple: CONSTANT_TUPLE,
+    il.ConstantList: CONSTANT_LIST,
+    il.ConstantSet: CONSTANT_SET,
+    il.ConstantFrozenSet: CONSTANT_FROZENSET,
+}
+CONTAINER_TYPES = {kind: cls for cls, kind in CONTAINER_KINDS.items()}
+
+FLAG_POISON = 1
+
+# Size of the chunks written and read at a time
+BUFFER_SIZE = 1 << 16
+
+def isSavedProgram(head: bytes) -> bool:
+    return head.startswith(IL_MAGIC)
+
+def _encodeVarint(buffer: bytearray, n: int):
+    while n >= 0x80:
+        buffer.append((n & 0x7f) | 0x80)
+        n >>= 7
+    buffer.append(n)
+
+def _zigzag(n: int) -> int:
+    return n << 1 if n >= 0 else ((-n) << 1) - 1
+
+def _unzigzag(n: int) -> int:
+    return n >> 1 if not n & 1 else -((n + 1) >> 1)
+
+# Writes instructions to a file in the binary IL format as they are given.
+# close() must be called once all instructions were written.
+class ProgramWriter:
+    def __init__(self, file: IO[bytes]):
+        self.file = file
+        self.buffer = bytearray(IL_MAGIC)
+        _encodeVarint(self.buffer, IL_FORMAT_VERSION)
+
+        self.strings: dict[str, int] = {}
+        # Scalars are keyed by value, everything else by identity. Values are
+        # kept alive so that their ids are not reused while writing.
+        self.constants: dict[tuple, int] = {}
+        self.objects: dict[int, tuple[il.Value, int]] = {}
+        self.variables: dict[il.VariableInsn, int] = {}
+
+    def _flush(self):
+        self.file.write(self.buffer)
+        self.buffer = bytearray()
+
+    def _string(self, s: str) -> int:
+        index = self.strings.get(s)
+        if index is None:
+            data = s.encode('utf-8', 'surrogatepass')
+            self.buffer.append(RECORD_STRING)
+            _encodeVarint(self.buffer, len(data))
+            self.buffer += data
+            index = self.strings[s] = len(self.strings)
+        return index
+
+    def _scalarKey(self, value) -> tuple | None:
+        if isinstance(value, (float, complex)):
+            # Keyed by repr to keep 0.0/-0.0 and nan apart
+            return (type(value), repr(value))
+        if value is None or isinstance(value, (bool, int, str, bytes)):
+            return (type(value), value)
+        return None
+
+    def _encodeScalar(self, value) -> bytearray:
+        payload = bytearray()
+        if value is None:
+            payload.append(CONSTANT_NONE)
+        elif value is False:
+            payload.append(CONSTANT_FALSE)
+        elif value is True:
+            payload.append(CONSTANT_TRUE)
+        elif type(value) is int:
+            payload.append(CONSTANT_INT)
+            _encodeVarint(payload, _zigzag(value))
+        elif type(value) is float:
+            payload.append(CONSTANT_FLOAT)
+            payload += struct.pack('<d', value)
+        elif type(value) is complex:
+            payload.append(CONSTANT_COMPLEX)
+            payload += struct.pack('<dd', value.real, value.imag)
+        elif type(value) is str:
+            index = self._string(value)
+            payload.append(CONSTANT_STR)
+            _encodeVarint(payload, index)
+        elif type(value) in (bytes, bytearray):
+            payload.append(CONSTANT_BYTES if type(value) is bytes else CONSTANT_BYTEARRAY)
+            _encodeVarint(payload, len(value))
+            payload += value
+        else:
+            raise ValueError(f'Cannot save constant of type {type(value).__name__}')
+        return payload
+
+    def _encodeObject(self, value: il.Value) -> bytearray:
+        payload = bytearray()
+        if isinstance(value, il.ConstantValue):
+            return self._encodeScalar(value.value)
+        elif isinstance(value, il.ConstantGlobal):
+            module = self._string(value.module)
+            name = self._string(value.name) + 1 if value.name is not None else 0
+            payload.append(CONSTANT_GLOBAL)
+            _encodeVarint(payload, module)
+            _encodeVarint(payload, name)
+        elif isinstance(value, il.ConstantDict):
+            refs = [(self._ref(k), self._ref(v)) for k, v in value.values]
+            payload.append(CONSTANT_DICT)
+            _encodeVarint(payload, len(refs))
+            for k, v in refs:
+                _encodeVarint(payload, k)
+                _encodeVarint(payload, v)
+        elif type(value) in CONTAINER_KINDS:
+            refs = [self._ref(v) for v in value.values]
+            payload.append(CONTAINER_KINDS[type(value)])
+            _encodeVarint(payload, len(refs))
+            for ref in refs:
+                _encodeVarint(payload, ref)
+        else:
+            raise ValueError(f'Cannot save value {value.stringifyValue()}')
+        return payload
+
+    # Returns the reference to a value, writing its constant record first if
+    # it was not written yet
+    def _ref(self, value: il.Value) -> int:
+        if isinstance(value, il.VariableInsn):
+            index = self.variables.get(value)
+            if index is None:
+                raise ValueError(f'Variable {value.name} is used before it is defined')
+            return index << 1 | 1
+
+        key = self._scalarKey(value.value) if isinstance(value, il.ConstantValue) else None
+        if key is not None:
+            index = self.constants.get(key)
+        else:
+            index = self.objects.get(id(value), (None, None))[1]
+        if index is None:
+            payload = self._encodeObject(value)
+            self.buffer.append(RECORD_CONSTANT)
+            self.buffer += payload
+            index = len(self.constants) + len(self.objects)
+            if key is not None:
+                self.constants[key] = index
+            else:
+                self.objects[id(value)] = (value, index)
+        return index << 1
+
+    def write(self, insn: il.Insn):
+        refs = [self._ref(arg) for arg in insn.args]
+        if isinstance(insn, il.VariableInsn):
+            # Names given by Program.createVarInsn are stored as their number
+            name = insn.name
+            number = name[1:] if name.startswith('v') else ''
+            if number.isdigit() and str(int(number)) == number:
+                nameRef = (int(number) << 1) | 1
+            else:
+                nameRef = self._string(name) << 1
+            self.buffer.append(RECORD_VARIABLE)
+            _encodeVarint(self.buffer, insn.op.value)
+            _encodeVarint(self.buffer, nameRef)
+            self.variables[insn] = len(self.variables)
+        else:
+            self.buffer.append(RECORD_INSN)
+            _encodeVarint(self.buffer, insn.op.value)
+        _encodeVarint(self.buffer, len(refs))
+        for ref in refs:
+            _encodeVarint(self.buffer, ref)
+
+        if len(self.buffer) >= BUFFER_SIZE:
+            self._flush()
+
+    def close(self, poison: bool = False, variableCount: int | None = None):
+        self.buffer.append(RECORD_END)
+        self.buffer.append(FLAG_POISON if poison else 0)
+        _encodeVarint(self.buffer, len(self.variables) if variableCount is None else variableCount)
+        self._flush()
+
+# Reads instructions from a file in the binary IL format. Iterating yields the
+# instructions as they are read, uses of a variable are complete once all
+# instructions were read. poison and variableCount are set at the end.
+class ProgramReader:
+    def __init__(self, file: IO[bytes]):
+        self.file = file
+        self.buffer = b''
+        self.pos = 0
+
+        self.strings: list[str] = []
+        self.constants: list[il.Value] = []
+        self.variables: list[il.VariableInsn] = []
+        self.poison = False
+        self.variableCount = 0
+
+        if self._read(len(IL_MAGIC)) != IL_MAGIC:
+            raise ValueError('Not a saved IL program')
+        version = self._varint()
+        if version != IL_FORMAT_VERSION:
+            raise ValueError(f'Unsupported IL format version {version}')
+
+    def _fill(self, n: int):
+        while len(self.buffer) - self.pos < n:
+            chunk = self.file.read(max(BUFFER_SIZE, n))
+            if not chunk:
+                raise ValueError('Truncated IL program')
+            self.buffer = self.buffer[self.pos:] + chunk
+            self.pos = 0
+
+    def _read(self, n: int) -> bytes:
+        self._fill(n)
+        data = self.buffer[self.pos:self.pos + n]
+        self.pos += n
+        return data
+
+    def _byte(self) -> int:
+        try:
+            b = self.buffer[self.pos]
+        except IndexError:
+            self._fill(1)
+            b = self.buffer[self.pos]
+        self.pos += 1
+        return b
+
+    def _varint(self) -> int:
+        # Most varints are a single byte
+        b = self._byte()
+        if b < 0x80:
+            return b
+        n = b & 0x7f
+        shift = 7
+        while True:
+            b = self._byte()
+            n |= (b & 0x7f) << shift
+            if b < 0x80:
+                return n
+            shift += 7
+
+    def _op(self) -> il.InsnType:
+        op = self._varint()
+        try:
+            return il.InsnType(op)
+        except ValueError:
+            raise ValueError(f'Corrupt IL program: unknown instruction {op}') from None
+
+    def _value(self) -> il.Value:
+        ref = self._varint()
+        try:
+            return self.variables[ref >> 1] if ref & 1 else self.constants[ref >> 1]
+        except IndexError:
+            raise ValueError(f'Corrupt IL program: invalid reference {ref}') from None
+
+    def _string(self, index: int) -> str:
+        try:
+            return self.strings[index]
+        except IndexError:
+            raise ValueError(f'Corrupt IL program: invalid string {index}') from None
+
+    def _readString(self):
+        data = self._read(self._varint())
+        try:
+            self.strings.append(data.decode('utf-8', 'surrogatepass'))
+        except UnicodeDecodeError:
+            raise ValueError('Corrupt IL program: invalid string data') from None
+
+    def _readConstant(self):
+        kind = self._byte()
+        if kind == CONSTANT_NONE:
+            value = il.ConstantValue(None)
+        elif kind == CONSTANT_FALSE:
+            value = il.ConstantValue(False)
+        elif kind == CONSTANT_TRUE:
+            value = il.ConstantValue(True)
+        elif kind == CONSTANT_INT:
+            value = il.ConstantValue(_unzigzag(self._varint()))
+        elif kind == CONSTANT_FLOAT:
+            value = il.ConstantValue(struct.unpack('<d', self._read(8))[0])
+        elif kind == CONSTANT_COMPLEX:
+            value = il.ConstantValue(complex(*struct.unpack('<dd', self._read(16))))
+        elif kind == CONSTANT_STR:
+            value = il.ConstantValue(self._string(self._varint()))
+        elif kind == CONSTANT_BYTES:
+            value = il.ConstantValue(bytes(self._read(self._varint())))
+        elif kind == CONSTANT_BYTEARRAY:
+            value = il.ConstantValue(bytearray(self._read(self._varint())))
+        elif kind == CONSTANT_GLOBAL:
+            module = self._string(self._varint())
+            name = self._varint()
+            value = il.ConstantGlobal(module, self._string(name - 1) if name else None)
+        elif kind == CONSTANT_DICT:
+            value = il.ConstantDict([(self._value(), self._value()) for _ in range(self._varint())])
+        elif kind in CONTAINER_TYPES:
+            value = CONTAINER_TYPES[kind]([self._value() for _ in range(self._varint())])
+        else:
+            raise ValueError(f'Corrupt IL program: unknown constant kind {kind}')
+        self.constants.append(value)
+
+    def __iter__(self) -> Iterator[il.Insn]:
+        while True:
+            tag = self._byte()
+            if tag == RECORD_STRING:
+                self._readString()
+            elif tag == RECORD_CONSTANT:
+                self._readConstant()
+            elif tag == RECORD_INSN or tag == RECORD_VARIABLE:
+                op = self._op()
+                if tag == RECORD_VARIABLE:
+                    nameRef = self._varint()
+                    name = f'v{nameRef >> 1}' if nameRef & 1 else self._string(nameRef >> 1)
+                    args = [self._value() for _ in range(self._varint())]
+                    insn = il.VariableInsn(op, args, name)
+                    self.variables.append(insn)
+                else:
+                    insn = il.Insn(op, [self._value() for _ in range(self._varint())])
+                for def_ in insn.defs:
+                    def_.uses.add(insn)
+                yield insn
+            elif tag == RECORD_END:
+                self.poison = bool(self._byte() & FLAG_POISON)
+                self.variableCount = self._varint()
+                return
+            else:
+                raise ValueError(f'Corrupt IL program: unknown record {tag}')
+
+    def read(self) -> il.Program:
+        program = il.Program()
+        # The garbage collector would run over and over while the instructions
+        # are created, none of them is garbage
+        collect = gc.isenabled()
+        gc.disable()
+        try:
+            for insn in self:
+                program.insertInsn(insn, program.end)
+        finally:
+            if collect:
+                gc.enable()
+        program.poison = self.poison
+        program.variableCount = self.variableCount
+        return program
+
+def saveProgram(program: il.Program, file: IO[bytes]):
+    writer = ProgramWriter(file)
+    for insn in program:
+        writer.write(insn)
+    writer.close(program.poison, program.variableCount)
+
+def loadProgram(file: IO[bytes]) -> il.Program:
+    return ProgramReader(file).read()
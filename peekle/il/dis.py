@@ -1,17 +1,69 @@
+import io
+import mmap
 import pickle
 import pickletools
 from typing import IO
 from . import il
+from .stats import DisassemblyStats
+from .parallel import MIN_PARALLEL_SIZE, isFramed, genopsParallel
+from ..compression import decompressed
+from ..progress import Progress, Cancelled
 
 class Disassembler:
     dispatch = {}
 
-    def __init__(self, obj: bytes | bytearray | IO[bytes]):
-        self.obj = obj
+    # Compressed input (gzip, bz2, xz or lzma) is decompressed while disassembling.
+    # With progress, the byte offset is reported every progress.interval
+    # opcodes, and cancelling stops with a POISON instruction. With several
+    # workers, the frames of large protocol 4+ pickles in memory or in a file
+    # are decoded in parallel worker processes, see parallel.genopsParallel.
+    def __init__(self, obj: bytes | bytearray | IO[bytes], collectStats: bool = False, progress: Progress | None = None,
+                 workers: int | None = None):
+        self.obj = decompressed(obj)
+        self.workers = workers
         self.program = il.Program()
         self.memo = {}
         self.stack = []
         self.metastack = []
+        self.stats = DisassemblyStats() if collectStats else None
+        self.progress = progress
+        self.size = self._inputSize(obj) if progress is not None else None
+
+    # Size of the pickle in bytes, if it is known up front: it is not for
+    # compressed input and streams that cannot seek
+    def _inputSize(self, obj) -> int | None:
+        if isinstance(self.obj, (bytes, bytearray)):
+            return len(self.obj)
+        if self.obj is not obj or not obj.seekable():
+            return None
+        pos = obj.tell()
+        size = obj.seek(0, io.SEEK_END)
+        obj.seek(pos)
+        return size
+
+    # The pickle as bytes or a read-only map of its file, and where it starts,
+    # or None if it can only be streamed
+    def _mapped(self) -> tuple[bytes | bytearray | mmap.mmap | None, int]:
+        if isinstance(self.obj, (bytes, bytearray)):
+            return self.obj, 0
+        if not isinstance(self.obj, (io.BufferedReader, io.BufferedRandom, io.FileIO)):
+            return None, 0
+        try:
+            return mmap.mmap(self.obj.fileno(), 0, access=mmap.ACCESS_READ), self.obj.tell()
+        except (OSError, ValueError):
+            return None, 0
+
+    # Opcodes of the pickle, as (opcode, argument, position) tuples, and the
+    # map of its file if one was made. Statistics are collected serially.
+    def _opcodes(self):
+        if self.workers is None or self.workers < 2 or self.stats is not None:
+            return pickletools.genops(self.obj), None
+        data, start = self._mapped()
+        if data is None or len(data) - start < MIN_PARALLEL_SIZE or not isFramed(data, start):
+            if isinstance(data, mmap.mmap):
+                data.close()
+            return pickletools.genops(self.obj), None
+        return genopsParallel(data, start, self.workers), data if isinstance(data, mmap.mmap) else None
 
     def _popMark(self):
         s = self.stack
@@ -54,8 +106,6 @@ class Disassembler:
     dispatch[pickle.SHORT_BINSTRING[0]] = _disassembleConstant
     dispatch[pickle.UNICODE[0]] = _disassembleConstant
     dispatch[pickle.BINUNICODE[0]] = _disassembleConstant
-    dispatch[pickle.NEWTRUE[0]] = _disassembleConstant
-    dispatch[pickle.NEWFALSE[0]] = _disassembleConstant
     dispatch[pickle.LONG1[0]] = _disassembleConstant
     dispatch[pickle.LONG4[0]] = _disassembleConstant
     dispatch[pickle.BINBYTES[0]] = _disassembleConstant
@@ -66,6 +116,15 @@ class Disassembler:
     dispatch[pickle.BYTEARRAY8[0]] = _disassembleConstant
     dispatch[pickle.BINFLOAT[0]] = _disassembleConstant
 
+    # NEWTRUE and NEWFALSE carry no argument, so genops yields None for them
+    def _disassembleTrue(self, op, arg):
+        self.stack.append(il.ConstantValue(True))
+    dispatch[pickle.NEWTRUE[0]] = _disassembleTrue
+
+    def _disassembleFalse(self, op, arg):
+        self.stack.append(il.ConstantValue(False))
+    dispatch[pickle.NEWFALSE[0]] = _disassembleFalse
+
     def _disassembleReduce(self, op, arg):
         args = self.stack.pop()
         func = self.stack.pop()
@@ -104,6 +163,12 @@ class Disassembler:
         self.program.appendInsn(il.InsnType.EXTEND, l, il.ConstantList(s))
     dispatch[pickle.APPENDS[0]] = _disassembleAppends
 
+    def _disassembleAppend(self, op, arg):
+        value = self.stack.pop()
+        l = self.stack[-1]
+        self.program.appendInsn(il.InsnType.EXTEND, l, il.ConstantList([value]))
+    dispatch[pickle.APPEND[0]] = _disassembleAppend
+
     def _disassmbleGet(self, op, arg):
         self.stack.append(self.memo[arg])
     dispatch[pickle.GET[0]] = _disassmbleGet
@@ -124,6 +189,8 @@ class Disassembler:
     def _disassemblePut(self, op, arg):
         self.memo[arg] = self.stack[-1]
     dispatch[pickle.PUT[0]] = _disassemblePut
+    dispatch[pickle.BINPUT[0]] = _disassemblePut
+    dispatch[pickle.LONG_BINPUT[0]] = _disassemblePut
 
     def _disassembleSetItem(self, op, arg):
         value = self.stack.pop()
@@ -148,13 +215,29 @@ class Disassembler:
             self.program.appendInsn(il.InsnType.SET_ITEM, d, s[i], s[i + 1])
     dispatch[pickle.SETITEMS[0]] = _disassembleSetItems
 
+    # NEWOBJ creates the instance with cls.__new__, without calling __init__,
+    # which is what copyreg.__newobj__ and copyreg.__newobj_ex__ do
     def _disassembleNewObj(self, op, arg):
         args = self.stack.pop()
         cls = self.stack.pop()
-        res = self.program.appendVarInsn(il.InsnType.CALL, cls, args)
+        if isinstance(args, il.ConstantTuple):
+            res = self.program.appendVarInsn(il.InsnType.CALL, il.ConstantGlobal('copyreg', '__newobj__'),
+                                             il.ConstantTuple([cls, *args.values]))
+        else:
+            res = self.program.appendVarInsn(il.InsnType.CALL, il.ConstantGlobal('copyreg', '__newobj_ex__'),
+                                             il.ConstantTuple([cls, args, il.ConstantDict([])]))
         self.stack.append(res)
     dispatch[pickle.NEWOBJ[0]] = _disassembleNewObj
 
+    def _disassembleNewObjEx(self, op, arg):
+        kwargs = self.stack.pop()
+        args = self.stack.pop()
+        cls = self.stack.pop()
+        res = self.program.appendVarInsn(il.InsnType.CALL, il.ConstantGlobal('copyreg', '__newobj_ex__'),
+                                         il.ConstantTuple([cls, args, kwargs]))
+        self.stack.append(res)
+    dispatch[pickle.NEWOBJ_EX[0]] = _disassembleNewObjEx
+
     def _disassembleTuple1(self, op, arg):
         a = self.stack.pop()
         self.stack.append(il.ConstantTuple([a]))
@@ -191,6 +274,17 @@ class Disassembler:
         self.stack.append(res)
     dispatch[pickle.STACK_GLOBAL[0]] = _disassembleStackGlobal
 
+    def _disassemblePersId(self, op, arg):
+        res = self.program.appendVarInsn(il.InsnType.PERSISTENT_LOAD, il.ConstantValue(arg))
+        self.stack.append(res)
+    dispatch[pickle.PERSID[0]] = _disassemblePersId
+
+    def _disassembleBinPersId(self, op, arg):
+        pid = self.stack.pop()
+        res = self.program.appendVarInsn(il.InsnType.PERSISTENT_LOAD, pid)
+        self.stack.append(res)
+    dispatch[pickle.BINPERSID[0]] = _disassembleBinPersId
+
     def _disassembleMemoize(self, op, arg):
         self.memo[len(self.memo)] = self.stack[-1]
     dispatch[pickle.MEMOIZE[0]] = _disassembleMemoize
@@ -201,17 +295,57 @@ class Disassembler:
     dispatch[pickle.FRAME[0]] = _disassembleIgnored
 
     def disassemble(self):
+        stats = self.stats
+        progress = self.progress
+        count = 0
+        endPos = None
+        ops, mapped = self._opcodes()
         try:
-            for opcode, arg, pos in pickletools.genops(self.obj):
+            for opcode, arg, pos in ops:
                 op = ord(opcode.code)
+                if stats is not None:
+                    stats.record(opcode, arg, pos, self.stack)
+                if progress is not None:
+                    count += 1
+                    if count % progress.interval == 0 and \
+                            progress.report('disassemble', 'bytes', pos, self.size, f'{count} opcodes'):
+                        raise Cancelled(f'Cancelled at byte {pos}')
                 if op not in self.dispatch:
                     raise ValueError(f'Unknown or unimplemented opcode: {op} {opcode.name} at {pos} ({repr(opcode.code)})')
 
                 shouldStop = self.dispatch[op](self, op, arg)
                 if shouldStop:
+                    endPos = pos + 1 if pos is not None else None
                     break
         except Exception as e:
             self.program.appendInsn(il.InsnType.POISON, il.ConstantValue(str(e)))
             self.program.poison = True
 
+            if stats is not None and not isinstance(e, Cancelled):
+                endPos = self._scanRemaining(ops, stats)
+        finally:
+            ops.close()
+            if mapped is not None:
+                mapped.close()
+                # Leave the file after the pickle, as reading it would
+                if endPos is not None:
+                    self.obj.seek(endPos)
+
+        if stats is not None:
+            stats.finish(endPos)
+        if progress is not None and not progress.cancelled:
+            progress.report('disassemble', 'bytes', endPos if endPos is not None else self.size or 0, self.size,
+                            f'{count} opcodes')
         return self.program
+
+    # Keeps collecting statistics past an error, so that they cover the whole
+    # pickle even when it cannot be disassembled.
+    def _scanRemaining(self, ops, stats: DisassemblyStats) -> int | None:
+        try:
+            for opcode, arg, pos in ops:
+                stats.record(opcode, arg, pos, [])
+                if opcode.code == pickle.STOP.decode('latin-1'):
+                    return pos + 1 if pos is not None else None
+        except Exception:
+            pass
+        return None
@@ -1,5 +1,6 @@
 from __future__ import annotations
-from typing import cast
+import heapq
+from typing import IO, cast
 from enum import Enum
 
 # An SSA IL value.
@@ -21,6 +22,18 @@ class Value:
     def replaceVarInsn(self, old: VariableInsn, new: Value):
         pass
 
+    # Returns this value with variables replaced by their clones. Values that
+    # do not reference any variable are immutable and shared, not copied.
+    def cloneValue(self, varMap: dict[VariableInsn, VariableInsn]) -> Value:
+        return self
+
+    @staticmethod
+    def cloneValues(values: list[Value], varMap: dict[VariableInsn, VariableInsn]) -> list[Value] | None:
+        cloned = [value.cloneValue(varMap) for value in values]
+        if all(a is b for a, b in zip(cloned, values)):
+            return None
+        return cloned
+
 class ConstantValue(Value):
     def __init__(self, value):
         self.value = value
@@ -47,6 +60,10 @@ class ConstantTuple(Value):
                 self.values[i] = new
             else:
                 value.replaceVarInsn(old, new)
+
+    def cloneValue(self, varMap: dict[VariableInsn, VariableInsn]):
+        values = Value.cloneValues(self.values, varMap)
+        return self if values is None else ConstantTuple(values)
     
 class ConstantList(Value):
     def __init__(self, values: list[Value]):
@@ -64,6 +81,10 @@ class ConstantList(Value):
                 self.values[i] = new
             else:
                 value.replaceVarInsn(old, new)
+
+    def cloneValue(self, varMap: dict[VariableInsn, VariableInsn]):
+        values = Value.cloneValues(self.values, varMap)
+        return self if values is None else ConstantList(values)
     
 class ConstantDict(Value):
     def __init__(self, values: list[tuple[Value, Value]]):
@@ -87,6 +108,15 @@ class ConstantDict(Value):
                 self.values[i] = (key, new)
             else:
                 value.replaceVarInsn(old, new)
+
+    def cloneValue(self, varMap: dict[VariableInsn, VariableInsn]):
+        keys = Value.cloneValues([key for key, value in self.values], varMap)
+        values = Value.cloneValues([value for key, value in self.values], varMap)
+        if keys is None and values is None:
+            return self
+        keys = keys or [key for key, value in self.values]
+        values = values or [value for key, value in self.values]
+        return ConstantDict(list(zip(keys, values)))
     
 class ConstantSet(Value):
     def __init__(self, values: list[Value]):
@@ -105,6 +135,10 @@ class ConstantSet(Value):
             else:
                 value.replaceVarInsn(old, new)
 
+    def cloneValue(self, varMap: dict[VariableInsn, VariableInsn]):
+        values = Value.cloneValues(self.values, varMap)
+        return self if values is None else ConstantSet(values)
+
 class ConstantFrozenSet(Value):
     def __init__(self, values: list[Value]):
         self.values = values
@@ -121,6 +155,10 @@ class ConstantFrozenSet(Value):
                 self.values[i] = new
             else:
                 value.replaceVarInsn(old, new)
+
+    def cloneValue(self, varMap: dict[VariableInsn, VariableInsn]):
+        values = Value.cloneValues(self.values, varMap)
+        return self if values is None else ConstantFrozenSet(values)
     
 class ConstantGlobal(Value):
     def __init__(self, module: str, name: str | None):
@@ -166,6 +204,14 @@ class InsnType(Enum):
     LSHIFT = 28
     RSHIFT = 29
 
+    # numpy array from raw data: dtype descr, shape, order ('C' or 'F'), data
+    NDARRAY = 30
+
+    # Unpickler.persistent_load(pid)
+    PERSISTENT_LOAD = 31
+    # Lazily loaded torch storage: archive entry, dtype, number of elements
+    STORAGE = 32
+
     POISON = 255
 
 class Insn:
@@ -190,6 +236,25 @@ class Insn:
                 arg.replaceVarInsn(old, new)
         self.defs = Value.computeDefs(self.args)
 
+    # Returns an unlinked copy of this instruction that refers to the cloned
+    # variables. Constant arguments are shared.
+    def cloneInsn(self, varMap: dict[VariableInsn, VariableInsn]) -> Insn:
+        return Insn(self.op, [arg.cloneValue(varMap) for arg in self.args])
+
+    # Instructions are pickled without their links and uses, which would make
+    # pickle recurse through the whole program. Program restores them.
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['prev'], state['next']
+        state.pop('uses', None)
+        state.pop('order', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.prev = None
+        self.next = None
+
     def __iter__(self):
         insn = self
         while insn is not None:
@@ -214,17 +279,62 @@ class VariableInsn(Insn, Value):
     def valueDefs(self):
         return {self}
 
+    def cloneValue(self, varMap: dict[VariableInsn, VariableInsn]):
+        return varMap[self]
+
+    def cloneInsn(self, varMap: dict[VariableInsn, VariableInsn]) -> VariableInsn:
+        insn = VariableInsn(self.op, [arg.cloneValue(varMap) for arg in self.args], self.name)
+        varMap[self] = insn
+        return insn
+
+# Spacing of the order keys of appended instructions. An instruction inserted
+# between two others takes the middle of their gap, the program is renumbered
+# once a gap is used up.
+ORDER_GAP = 1 << 32
+
 class Program:
     def __init__(self):
-        self.begin = None
-        self.end = None
         self.poison = False
         self.variableCount = 0
+        self.clear()
+
+    # Removes all instructions at once, without unlinking them
+    def clear(self):
+        self.begin = None
+        self.end = None
+
+        # Instructions of each type, mapped to the sequence number of their
+        # insertion. Dicts keep insertion order, so instructions inserted
+        # after a given sequence number are at the end. The sequence number is
+        # also incremented by every removal.
+        self.index: dict[InsnType, dict[Insn, int]] = {}
+        self.indexSeq = 0
+        # Incremented whenever order keys are reassigned
+        self.orderEpoch = 0
+
+    def _renumber(self):
+        for i, insn in enumerate(self):
+            insn.order = i * ORDER_GAP
+        self.orderEpoch += 1
+
+    def _orderAfter(self, after: Insn | None) -> int:
+        next_ = self.begin if after is None else after.next
+        if next_ is None:
+            return 0 if after is None else after.order + ORDER_GAP
+        if after is None:
+            return next_.order - ORDER_GAP
+        if next_.order - after.order < 2:
+            self._renumber()
+        return (after.order + next_.order) // 2
 
     def insertInsn(self, insn: Insn, after: Insn):
         if insn.prev is not None or insn.next is not None:
             raise ValueError('Cannot insert an instruction that is already in a program')
 
+        insn.order = self._orderAfter(after)
+        self.indexSeq += 1
+        self.index.setdefault(insn.op, {})[insn] = self.indexSeq
+
         if after is None:
             insn.next = self.begin
             if self.begin is not None:
@@ -264,6 +374,8 @@ class Program:
 
         insn.prev = None
         insn.next = None
+        del self.index[insn.op][insn]
+        self.indexSeq += 1
 
         for def_ in insn.defs:
             def_.uses.remove(insn)
@@ -311,9 +423,55 @@ class Program:
         self.insertInsn(insn, self.end)
         return insn
         
+    # Returns an independent copy of the program that can be transformed
+    # without affecting this one. Instructions are copied, constants that do
+    # not reference variables (including all payloads) are shared.
+    def clone(self) -> Program:
+        program = Program()
+        program.poison = self.poison
+        program.variableCount = self.variableCount
+
+        varMap: dict[VariableInsn, VariableInsn] = {}
+        for insn in self:
+            program.insertInsn(insn.cloneInsn(varMap), program.end)
+        return program
+
+    # Programs are pickled as a flat list of instructions, so that every
+    # variable is pickled before its uses
+    def __getstate__(self):
+        return {'insns': list(self), 'poison': self.poison, 'variableCount': self.variableCount}
+
+    def __setstate__(self, state):
+        self.clear()
+        self.poison = state['poison']
+        self.variableCount = state['variableCount']
+        for insn in state['insns']:
+            if isinstance(insn, VariableInsn):
+                insn.uses = set()
+            self.insertInsn(insn, self.end)
+
+    # Writes the program to a file in the binary IL format, see binary.py
+    def save(self, file: IO[bytes]):
+        from .binary import saveProgram
+        saveProgram(self, file)
+
+    # Reads a program written by save
+    @staticmethod
+    def load(file: IO[bytes]) -> Program:
+        from .binary import loadProgram
+        return loadProgram(file)
+
     def __iter__(self):
         return Program.Iterator(self)
 
+    # Iterates over the instructions of the given types only, see OpIterator
+    def iterOps(self, *ops: InsnType) -> Program.OpIterator:
+        return Program.OpIterator(self, ops)
+
+    # Returns the number of instructions of the given type
+    def countOp(self, op: InsnType) -> int:
+        return len(self.index.get(op, ()))
+
     def __str__(self):
         return '\n'.join(map(lambda insn: insn.stringifyInsn(), self))
     
@@ -352,3 +510,76 @@ class Program:
             self.current = self.current.prev
             self.program.removeInsn(target, skipUseCheck=True)
             self.program.insertInsn(target, after)
+
+    # Iterates over the instructions of the given types in program order,
+    # without visiting any other instruction. Like Iterator, instructions can
+    # be removed, replaced and moved through it, and instructions of the given
+    # types inserted after the current one are visited too.
+    class OpIterator(Iterator):
+        def __init__(self, program: Program, ops: tuple[InsnType, ...]):
+            super().__init__(program)
+            self.ops = ops
+            # Instructions indexed when iteration started, sorted once. Order
+            # keys are only ever renumbered in program order, so this stays
+            # sorted.
+            self.startSeq = program.indexSeq
+            insns = [insn for op in ops for insn in program.index.get(op, ())]
+            insns.sort(key=lambda insn: insn.order)
+            self.insns = insns
+            self.i = 0
+            # Instructions indexed since then, as a heap of (order, seq, insn)
+            self.seq = program.indexSeq
+            self.epoch = program.orderEpoch
+            self.inserted: list[tuple[int, int, Insn]] = []
+
+        def __next__(self) -> Insn:
+            program = self.program
+            insns = self.insns
+            if program.indexSeq == self.startSeq:
+                # Nothing changed since iteration started
+                if self.i == len(insns):
+                    raise StopIteration()
+                self.current = insns[self.i]
+                self.i += 1
+                return self.current
+
+            if program.orderEpoch != self.epoch:
+                self.inserted = [(insn.order, seq, insn) for _, seq, insn in self.inserted]
+                heapq.heapify(self.inserted)
+                self.epoch = program.orderEpoch
+            index = program.index
+            if program.indexSeq != self.seq:
+                for op in self.ops:
+                    for insn, seq in reversed(index.get(op, {}).items()):
+                        if seq <= self.seq:
+                            break
+                        heapq.heappush(self.inserted, (insn.order, seq, insn))
+                self.seq = program.indexSeq
+
+            # Instructions before the current one were visited already, or
+            # inserted behind it. Instructions from the start that were removed
+            # or reinserted since are skipped.
+            position = self.current.order if self.current is not None else None
+            i = self.i
+            while i < len(insns):
+                insn = insns[i]
+                seq = index.get(insn.op, {}).get(insn)
+                if seq is not None and seq <= self.startSeq and (position is None or insn.order > position):
+                    break
+                i += 1
+            self.i = i
+            inserted = self.inserted
+            while inserted:
+                order, seq, insn = inserted[0]
+                if index.get(insn.op, {}).get(insn) == seq and (position is None or order > position):
+                    break
+                heapq.heappop(inserted)
+
+            if inserted and (i == len(insns) or inserted[0][0] < insns[i].order):
+                self.current = heapq.heappop(inserted)[2]
+            elif i < len(insns):
+                self.current = insns[i]
+                self.i = i + 1
+            else:
+                raise StopIteration()
+            return self.current
@@ -0,0 +1,161 @@
+from __future__ import annotations
+import io
+import gc
+import mmap
+import pickle
+import pickletools
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, BrokenExecutor
+from .scan import _LENGTH_PREFIXES
+
+# Pickles smaller than this are always disassembled serially
+MIN_PARALLEL_SIZE = 1 << 22
+# Smallest number of bytes handed to a worker at a time
+MIN_CHUNK_SIZE = 1 << 20
+# Chunks decoded ahead of the disassembler per worker, which bounds the number
+# of decoded opcodes waiting in memory
+CHUNKS_AHEAD = 2
+
+_OPCODES = {opcode.code: opcode for opcode in pickletools.opcodes}
+_BYTE_OPCODES = {ord(opcode.code): opcode for opcode in pickletools.opcodes}
+
+# Whether a pickle starting at start begins with a PROTO of 4 or more and a FRAME
+def isFramed(data, start: int = 0) -> bool:
+    return len(data) - start >= 3 and data[start] == pickle.PROTO[0] and data[start + 1] >= 4 and \
+        data[start + 2] == pickle.FRAME[0]
+
+# Returns the position after the opcode at pos, without decoding its argument
+def _opcodeEnd(data, pos: int) -> int:
+    opcode = _BYTE_OPCODES.get(data[pos])
+    if opcode is None:
+        raise ValueError(f'Unknown opcode at {pos}')
+    arg = opcode.arg
+    pos += 1
+    if arg is None:
+        end = pos
+    elif arg.n >= 0:
+        end = pos + arg.n
+    elif arg.n == pickletools.UP_TO_NEWLINE:
+        end = pos
+        for _ in range(2 if opcode.name in ('GLOBAL', 'INST') else 1):
+            end = data.find(b'\n', end) + 1
+            if end == 0:
+                raise ValueError(f'Unterminated argument of {opcode.name} at {pos - 1}')
+    else:
+        size, signed = _LENGTH_PREFIXES[arg.n]
+        n = int.from_bytes(data[pos:pos + size], 'little', signed=signed)
+        if n < 0:
+            raise ValueError(f'Negative length in {opcode.name} at {pos - 1}')
+        end = pos + size + n
+    if end > len(data):
+        raise ValueError(f'Truncated {opcode.name} at {pos - 1}')
+    return end
+
+# Indexes the frames of a protocol 4+ pickle that starts at start. Returns the
+# offsets where every frame (with its FRAME opcode) and every run of opcodes
+# outside of frames (the PROTO, and large arguments the pickler writes past the
+# current frame) begins, followed by the end of the data. Frames are skipped
+# by their length, only opcodes outside of frames are looked at. Indexing ends
+# at a STOP outside of a frame, or at anything malformed, and the rest of the
+# data is left as one last run.
+def indexFrames(data, start: int = 0) -> list[int]:
+    bounds = [start]
+    pos = start
+    try:
+        while pos < len(data):
+            if data[pos] == pickle.FRAME[0]:
+                if pos != bounds[-1]:
+                    bounds.append(pos)
+                pos += 9 + int.from_bytes(data[pos + 1:pos + 9], 'little')
+                if pos >= len(data):
+                    break
+                bounds.append(pos)
+            elif data[pos] == pickle.STOP[0]:
+                break
+            else:
+                pos = _opcodeEnd(data, pos)
+    except ValueError:
+        pass
+    if bounds[-1] != len(data):
+        bounds.append(len(data))
+    return bounds
+
+# Groups consecutive frames into chunks of at least chunkSize bytes
+def _chunks(bounds: list[int], chunkSize: int) -> list[tuple[int, int]]:
+    cuts = [bounds[0]]
+    for bound in bounds[1:-1]:
+        if bound - cuts[-1] >= chunkSize:
+            cuts.append(bound)
+    cuts.append(bounds[-1])
+    return list(zip(cuts, cuts[1:]))
+
+_data = None
+
+def _initWorker(data):
+    global _data
+    _data = data
+    # Workers only create short-lived opcode tuples, none of them cyclic
+    gc.disable()
+
+# Decodes the opcodes of one chunk into (code, argument, position) tuples.
+# Returns None if they do not end exactly at the end of the chunk, because an
+# opcode is malformed or runs past it, unless they end with a STOP.
+def _decodeChunk(start: int, end: int) -> list[tuple[str, object, int]] | None:
+    stream = io.BytesIO(_data[start:end])
+    ops = []
+    try:
+        for opcode, arg, pos in pickletools.genops(stream):
+            ops.append((opcode.code, arg, start + pos))
+            if stream.tell() == end - start:
+                return ops
+    except Exception:
+        return None
+    return ops
+
+def _openAt(data, pos: int):
+    stream = data if isinstance(data, mmap.mmap) else io.BytesIO(data)
+    stream.seek(pos)
+    return stream
+
+# Yields the opcodes of a framed pickle held in memory (bytes, a bytearray or
+# an mmap) like pickletools.genops, decoded on a pool of worker processes. The
+# frames are indexed first, grouped into chunks, and each chunk is decoded by
+# a worker while the opcodes of earlier chunks are consumed. The first chunk
+# that does not decode to exactly its own bytes (a malformed pickle, or frame
+# lengths that do not fall between opcodes) and everything after it are
+# decoded serially, so the opcodes and errors are the same as without workers.
+# Workers are forked, as maps of files cannot be sent to spawned processes:
+# where fork is not available, or the pool fails, decoding is serial as well.
+def genopsParallel(data, start: int, workers: int, chunkSize: int | None = None):
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        yield from pickletools.genops(_openAt(data, start))
+        return
+    bounds = indexFrames(data, start)
+    chunks = _chunks(bounds, chunkSize or max(MIN_CHUNK_SIZE, (len(data) - start) // (workers * 4)))
+
+    executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'),
+                                   initializer=_initWorker, initargs=(data,))
+    try:
+        futures = deque()
+        submitted = 0
+        for chunkStart, _ in chunks:
+            try:
+                while submitted < len(chunks) and len(futures) < workers * CHUNKS_AHEAD:
+                    futures.append(executor.submit(_decodeChunk, *chunks[submitted]))
+                    submitted += 1
+                ops = futures.popleft().result()
+            except (BrokenExecutor, OSError):
+                ops = None
+            if ops is None:
+                yield from pickletools.genops(_openAt(data, chunkStart))
+                return
+
+            for code, arg, pos in ops:
+                yield _OPCODES[code], arg, pos
+            if ops and ops[-1][0] == pickle.STOP.decode('latin-1'):
+                return
+        # Without a STOP, reading on raises the same error as without workers
+        yield from pickletools.genops(_openAt(data, chunks[-1][1]))
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,293 @@
+import io
+import pickle
+import copyreg
+import pickletools
+from ..compression import decompressed
+
+# Argument sizes of the length-prefixed opcodes, see pickletools.ArgumentDescriptor
+_LENGTH_PREFIXES = {
+    pickletools.TAKEN_FROM_ARGUMENT1: (1, True),
+    pickletools.TAKEN_FROM_ARGUMENT4: (4, True),
+    pickletools.TAKEN_FROM_ARGUMENT4U: (4, False),
+    pickletools.TAKEN_FROM_ARGUMENT8U: (8, False),
+}
+
+# Opcodes whose argument the scanner needs to decode, everything else is skipped.
+_STRING_OPCODES = set(['STRING', 'BINSTRING', 'SHORT_BINSTRING', 'UNICODE', 'SHORT_BINUNICODE', 'BINUNICODE', 'BINUNICODE8'])
+_MEMO_OPCODES = set(['GET', 'BINGET', 'LONG_BINGET', 'PUT', 'BINPUT', 'LONG_BINPUT'])
+_EXTENSION_OPCODES = set(['EXT1', 'EXT2', 'EXT4'])
+
+class _Global:
+    __slots__ = ('key',)
+
+    def __init__(self, module: str, name: str):
+        self.key = (module, name)
+
+class _OpcodeInfo:
+    def __init__(self, opcode: pickletools.OpcodeInfo):
+        self.opcode = opcode
+        self.name = opcode.name
+        self.arg = opcode.arg
+        self.decode = opcode.name in _STRING_OPCODES or opcode.name in _MEMO_OPCODES or \
+            opcode.name in _EXTENSION_OPCODES
+
+        before = opcode.stack_before
+        if pickletools.markobject in before:
+            self.popsMark = True
+            self.pops = before.index(pickletools.markobject)
+        else:
+            self.popsMark = False
+            self.pops = len(before)
+        self.pushes = len(opcode.stack_after)
+
+        # Fixed-size arguments that are never decoded are read and dropped
+        # directly by the scan loop
+        self.skip = self.arg.n if self.arg is not None and self.arg.n > 0 and not self.decode else 0
+        self.readArg = self.arg is not None and not self.skip
+
+_OPCODES = {opcode.code.encode('latin-1'): _OpcodeInfo(opcode) for opcode in pickletools.opcodes}
+
+# Collects the globals a pickle references, and how often each is called,
+# without building any IL. Only strings, globals and memo slots holding them
+# are tracked on the stack, every other value is modelled as None, and large
+# arguments are skipped without being decoded.
+class ImportScanner:
+    # Longer strings are never module or attribute names, so they are skipped
+    MAX_STRING = 1024
+
+    def __init__(self, obj: bytes | bytearray | io.RawIOBase | io.BufferedIOBase):
+        obj = decompressed(obj)
+        self.file = io.BytesIO(obj) if isinstance(obj, (bytes, bytearray)) else obj
+        self.stack: list = []
+        self.metastack: list[list] = []
+        self.memo: dict[int, str | _Global] = {}
+        self.memoSize = 0
+        self.imports: dict[tuple[str, str], list[int]] = {}
+        self.dynamicGlobals = 0
+        self.error: str | None = None
+
+    def _read(self, n: int) -> bytes:
+        data = self.file.read(n)
+        if len(data) != n:
+            raise EOFError('Pickle data was truncated')
+        return data
+
+    def _skip(self, n: int):
+        if self.file.seekable():
+            self.file.seek(n, io.SEEK_CUR)
+        else:
+            while n > 0:
+                n -= len(self._read(min(n, 1 << 20)))
+
+    def _readArg(self, info: _OpcodeInfo):
+        arg = info.arg
+        if arg.n >= 0:
+            # Only memo indices and extension codes are decoded, all of them
+            # unsigned
+            return int.from_bytes(self._read(arg.n), 'little')
+
+        if arg.n == pickletools.UP_TO_NEWLINE:
+            line = self.file.readline()
+            if info.name == 'GLOBAL' or info.name == 'INST':
+                line2 = self.file.readline()
+                return line.decode('utf-8').rstrip('\n'), line2.decode('utf-8').rstrip('\n')
+            return arg.reader(io.BytesIO(line)) if info.decode else None
+
+        size, signed = _LENGTH_PREFIXES[arg.n]
+        n = int.from_bytes(self._read(size), 'little', signed=signed)
+        if n < 0:
+            raise ValueError(f'Negative length in {info.name}')
+        if not info.decode or n > self.MAX_STRING:
+            self._skip(n)
+            return None
+        data = self._read(n)
+        return data.decode('utf-8', 'surrogatepass') if 'UNICODE' in info.name else data.decode('latin-1')
+
+    def _pop(self):
+        return self.stack.pop() if self.stack else None
+
+    def _popMark(self) -> list:
+        items = self.stack
+        self.stack = self.metastack.pop() if self.metastack else []
+        return items
+
+    def _reference(self, global_: _Global, call: bool = False):
+        counts = self.imports.setdefault(global_.key, [0, 0])
+        if call:
+            counts[1] += 1
+        else:
+            counts[0] += 1
+
+    def _call(self, callee):
+        if isinstance(callee, _Global):
+            self._reference(callee, call=True)
+
+    dispatch = {}
+
+    def _scanString(self, info, arg):
+        self.stack.append(arg if isinstance(arg, str) else None)
+    dispatch[pickle.STRING[0]] = _scanString
+    dispatch[pickle.BINSTRING[0]] = _scanString
+    dispatch[pickle.SHORT_BINSTRING[0]] = _scanString
+    dispatch[pickle.UNICODE[0]] = _scanString
+    dispatch[pickle.SHORT_BINUNICODE[0]] = _scanString
+    dispatch[pickle.BINUNICODE[0]] = _scanString
+    dispatch[pickle.BINUNICODE8[0]] = _scanString
+
+    def _scanGlobal(self, info, arg):
+        global_ = _Global(*arg)
+        self._reference(global_)
+        self.stack.append(global_)
+    dispatch[pickle.GLOBAL[0]] = _scanGlobal
+
+    def _scanStackGlobal(self, info, arg):
+        globalName = self._pop()
+        module = self._pop()
+        if isinstance(module, str) and isinstance(globalName, str):
+            global_ = _Global(module, globalName)
+            self._reference(global_)
+            self.stack.append(global_)
+        else:
+            self.dynamicGlobals += 1
+            self.stack.append(None)
+    dispatch[pickle.STACK_GLOBAL[0]] = _scanStackGlobal
+
+    # Extension codes are resolved through the copyreg registry of this
+    # process, which is what pickle does on load. Codes it does not know are
+    # counted as dynamic globals.
+    def _scanExtension(self, info, arg):
+        key = copyreg._inverted_registry.get(arg)
+        if key is not None:
+            global_ = _Global(*key)
+            self._reference(global_)
+            self.stack.append(global_)
+        else:
+            self.dynamicGlobals += 1
+            self.stack.append(None)
+    dispatch[pickle.EXT1[0]] = _scanExtension
+    dispatch[pickle.EXT2[0]] = _scanExtension
+    dispatch[pickle.EXT4[0]] = _scanExtension
+
+    def _scanInst(self, info, arg):
+        global_ = _Global(*arg)
+        self._reference(global_)
+        self._reference(global_, call=True)
+        self._popMark()
+        self.stack.append(None)
+    dispatch[pickle.INST[0]] = _scanInst
+
+    def _scanObj(self, info, arg):
+        items = self._popMark()
+        if items:
+            self._call(items[0])
+        self.stack.append(None)
+    dispatch[pickle.OBJ[0]] = _scanObj
+
+    def _scanReduce(self, info, arg):
+        self._pop()
+        self._call(self._pop())
+        self.stack.append(None)
+    dispatch[pickle.REDUCE[0]] = _scanReduce
+    dispatch[pickle.NEWOBJ[0]] = _scanReduce
+
+    def _scanNewObjEx(self, info, arg):
+        self._pop()
+        self._pop()
+        self._call(self._pop())
+        self.stack.append(None)
+    dispatch[pickle.NEWOBJ_EX[0]] = _scanNewObjEx
+
+    def _scanMark(self, info, arg):
+        self.metastack.append(self.stack)
+        self.stack = []
+    dispatch[pickle.MARK[0]] = _scanMark
+
+    def _scanDup(self, info, arg):
+        self.stack.append(self.stack[-1] if self.stack else None)
+    dispatch[pickle.DUP[0]] = _scanDup
+
+    def _scanGet(self, info, arg):
+        self.stack.append(self.memo.get(arg))
+    dispatch[pickle.GET[0]] = _scanGet
+    dispatch[pickle.BINGET[0]] = _scanGet
+    dispatch[pickle.LONG_BINGET[0]] = _scanGet
+
+    def _scanPut(self, info, arg):
+        if arg is None:
+            # MEMOIZE
+            arg = self.memoSize
+        if arg >= self.memoSize:
+            self.memoSize = arg + 1
+        top = self.stack[-1] if self.stack else None
+        if top is not None:
+            self.memo[arg] = top
+        else:
+            self.memo.pop(arg, None)
+    dispatch[pickle.PUT[0]] = _scanPut
+    dispatch[pickle.BINPUT[0]] = _scanPut
+    dispatch[pickle.LONG_BINPUT[0]] = _scanPut
+    dispatch[pickle.MEMOIZE[0]] = _scanPut
+
+    def _scanStop(self, info, arg):
+        return True
+    dispatch[pickle.STOP[0]] = _scanStop
+
+    # Any other opcode only matters for its effect on the stack
+    def _scanPush(self, info, arg):
+        self.stack.append(None)
+
+    def _scanNothing(self, info, arg):
+        pass
+
+    def _scanOther(self, info, arg):
+        if info.popsMark:
+            self._popMark()
+        stack = self.stack
+        for _ in range(info.pops):
+            if stack:
+                stack.pop()
+        if info.pushes:
+            stack.extend([None] * info.pushes)
+
+    # Picks a handler for every opcode, specializing the common pure stack
+    # effects so that the scan loop stays cheap.
+    @classmethod
+    def _resolveDispatch(cls) -> dict:
+        if '_resolved' not in cls.__dict__:
+            resolved = {}
+            for code, info in _OPCODES.items():
+                op = code[0]
+                if op in cls.dispatch:
+                    resolved[op] = cls.dispatch[op]
+                elif not info.popsMark and info.pops == 0 and info.pushes == 1:
+                    resolved[op] = cls._scanPush
+                elif not info.popsMark and info.pops == 0 and info.pushes == 0:
+                    resolved[op] = cls._scanNothing
+                else:
+                    resolved[op] = cls._scanOther
+            cls._resolved = resolved
+        return cls._resolved
+
+    # Scans the whole pickle. Returns {(module, name): (references, calls)}.
+    def scan(self) -> dict[tuple[str, str], tuple[int, int]]:
+        read = self.file.read
+        readArg = self._readArg
+        dispatch = self._resolveDispatch()
+        try:
+            while True:
+                code = read(1)
+                if not code:
+                    raise EOFError('Pickle data ended without a STOP opcode')
+                info = _OPCODES.get(code)
+                if info is None:
+                    raise ValueError(f'Unknown opcode {code!r}')
+                if info.skip:
+                    read(info.skip)
+                    arg = None
+                else:
+                    arg = readArg(info) if info.readArg else None
+                if dispatch[code[0]](self, info, arg):
+                    break
+        except Exception as e:
+            self.error = str(e)
+        return {key: (refs, calls) for key, (refs, calls) in self.imports.items()}
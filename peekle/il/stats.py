@@ -0,0 +1,121 @@
+import pickletools
+
+OPCODE_FAMILIES = {
+    'integer': ['INT', 'BININT', 'BININT1', 'BININT2', 'LONG', 'LONG1', 'LONG4'],
+    'float': ['FLOAT', 'BINFLOAT'],
+    'string': ['STRING', 'BINSTRING', 'SHORT_BINSTRING', 'UNICODE', 'BINUNICODE', 'SHORT_BINUNICODE', 'BINUNICODE8'],
+    'bytes': ['BINBYTES', 'SHORT_BINBYTES', 'BINBYTES8', 'BYTEARRAY8', 'NEXT_BUFFER', 'READONLY_BUFFER'],
+    'singleton': ['NONE', 'NEWTRUE', 'NEWFALSE'],
+    'container': ['EMPTY_LIST', 'LIST', 'APPEND', 'APPENDS', 'EMPTY_DICT', 'DICT', 'SETITEM', 'SETITEMS',
+                  'EMPTY_TUPLE', 'TUPLE', 'TUPLE1', 'TUPLE2', 'TUPLE3', 'EMPTY_SET', 'ADDITEMS', 'FROZENSET'],
+    'memo': ['PUT', 'BINPUT', 'LONG_BINPUT', 'GET', 'BINGET', 'LONG_BINGET', 'MEMOIZE'],
+    'global': ['GLOBAL', 'STACK_GLOBAL', 'EXT1', 'EXT2', 'EXT4'],
+    'call': ['REDUCE', 'BUILD', 'INST', 'OBJ', 'NEWOBJ', 'NEWOBJ_EX'],
+    'persistent': ['PERSID', 'BINPERSID'],
+    'stack': ['MARK', 'POP', 'POP_MARK', 'DUP'],
+    'framing': ['PROTO', 'FRAME', 'STOP'],
+}
+OPCODE_FAMILY = {name: family for family, names in OPCODE_FAMILIES.items() for name in names}
+
+MEMO_PUTS = set(['PUT', 'BINPUT', 'LONG_BINPUT', 'MEMOIZE'])
+MEMO_GETS = set(['GET', 'BINGET', 'LONG_BINGET'])
+
+# Cheap histogram of a pickle, collected by the Disassembler while it scans the
+# opcodes (see Disassembler(collectStats=True)).
+class DisassemblyStats:
+    def __init__(self):
+        self.opcodeCounts: dict[str, int] = {}
+        self.familyBytes: dict[str, int] = {}
+        self.memoPuts = 0
+        self.memoGets = 0
+        self.markDepth = 0
+        self.maxMarkDepth = 0
+        self.largestConstant: tuple[int, str, int] | None = None
+        self.globals: dict[tuple[str, str], int] = {}
+        self.totalBytes = 0
+
+        self._lastFamily: str | None = None
+        self._lastPos: int | None = None
+
+    def _recordGlobal(self, module, name):
+        key = (str(module), str(name))
+        self.globals[key] = self.globals.get(key, 0) + 1
+
+    # Records a single opcode, before it is dispatched. The stack is only read to
+    # resolve STACK_GLOBAL operands.
+    def record(self, opcode: pickletools.OpcodeInfo, arg, pos: int | None, stack: list):
+        name = opcode.name
+        self.opcodeCounts[name] = self.opcodeCounts.get(name, 0) + 1
+
+        if pos is not None:
+            if self._lastPos is not None:
+                self.familyBytes[self._lastFamily] = self.familyBytes.get(self._lastFamily, 0) + pos - self._lastPos
+            self._lastPos = pos
+            self._lastFamily = OPCODE_FAMILY.get(name, 'other')
+
+        if name in MEMO_PUTS:
+            self.memoPuts += 1
+        elif name in MEMO_GETS:
+            self.memoGets += 1
+
+        if name == 'MARK':
+            self.markDepth += 1
+            self.maxMarkDepth = max(self.maxMarkDepth, self.markDepth)
+        elif pickletools.markobject in opcode.stack_before:
+            self.markDepth -= 1
+
+        if name == 'GLOBAL' or name == 'INST':
+            module, _, global_ = arg.partition(' ')
+            self._recordGlobal(module, global_)
+        elif name == 'STACK_GLOBAL' and len(stack) >= 2:
+            module, global_ = stack[-2], stack[-1]
+            self._recordGlobal(getattr(module, 'value', '?'), getattr(global_, 'value', '?'))
+
+        if isinstance(arg, (str, bytes, bytearray)) and name not in OPCODE_FAMILIES['global']:
+            size = len(arg)
+        elif isinstance(arg, int) and not isinstance(arg, bool) and name in OPCODE_FAMILIES['integer']:
+            size = (arg.bit_length() + 7) // 8
+        else:
+            size = None
+        if size is not None and (self.largestConstant is None or size > self.largestConstant[0]):
+            self.largestConstant = (size, name, pos)
+
+    # Accounts for the last opcode once the end of the pickle is known.
+    def finish(self, endPos: int | None):
+        if endPos is not None and self._lastPos is not None:
+            self.familyBytes[self._lastFamily] = self.familyBytes.get(self._lastFamily, 0) + endPos - self._lastPos
+            self._lastPos = None
+        self.totalBytes = sum(self.familyBytes.values())
+
+    def toDict(self) -> dict:
+        largest = None
+        if self.largestConstant is not None:
+            size, name, pos = self.largestConstant
+            largest = {'size': size, 'opcode': name, 'pos': pos}
+        globals_ = sorted(self.globals.items(), key=lambda item: item[1], reverse=True)
+        return {
+            'totalBytes': self.totalBytes,
+            'opcodes': dict(sorted(self.opcodeCounts.items(), key=lambda item: item[1], reverse=True)),
+            'familyBytes': dict(sorted(self.familyBytes.items(), key=lambda item: item[1], reverse=True)),
+            'memoPuts': self.memoPuts,
+            'memoGets': self.memoGets,
+            'maxMarkDepth': self.maxMarkDepth,
+            'largestConstant': largest,
+            'globals': [{'module': module, 'name': name, 'count': count} for (module, name), count in globals_],
+        }
+
+    def __str__(self):
+        lines = [f'{sum(self.opcodeCounts.values())} opcodes, {self.totalBytes} bytes']
+        lines.append('Opcodes: ' + ', '.join(f'{name} {count}' for name, count in
+                                             sorted(self.opcodeCounts.items(), key=lambda item: item[1], reverse=True)))
+        lines.append('Bytes by family: ' + ', '.join(f'{family} {n}' for family, n in
+                                                     sorted(self.familyBytes.items(), key=lambda item: item[1], reverse=True)))
+        lines.append(f'Memo: {self.memoPuts} puts, {self.memoGets} gets')
+        lines.append(f'Max mark depth: {self.maxMarkDepth}')
+        if self.largestConstant is not None:
+            size, name, pos = self.largestConstant
+            lines.append(f'Largest constant: {size} bytes ({name} at {pos})')
+        lines.append(f'Distinct globals: {len(self.globals)}')
+        for (module, name), count in sorted(self.globals.items(), key=lambda item: item[1], reverse=True):
+            lines.append(f'  {module}.{name}: {count}')
+        return '\n'.join(lines)
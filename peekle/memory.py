@@ -0,0 +1,182 @@
+import os
+import sys
+import time
+import threading
+import resource
+import tracemalloc
+import contextlib
+from . import il
+
+def _currentRss() -> int | None:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+def _maxRss() -> int:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+# Samples the resident set size on a background thread, falling back to the
+# process high-water mark where /proc is not available.
+class _RssSampler(threading.Thread):
+    def __init__(self, interval: float):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = _currentRss()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            rss = _currentRss()
+            if rss is not None and rss > self.peak:
+                self.peak = rss
+
+    def stop(self) -> int:
+        self.stopped.set()
+        self.join()
+        if self.peak is None:
+            return _maxRss()
+        rss = _currentRss()
+        return max(self.peak, rss) if rss is not None else self.peak
+
+def _valueSize(value: il.Value, seen: set[int], footprint: dict[str, list[int]]):
+    if id(value) in seen or isinstance(value, il.Insn):
+        return
+    seen.add(id(value))
+
+    size = sys.getsizeof(value) + sys.getsizeof(value.__dict__)
+    if isinstance(value, il.ConstantValue):
+        size += sys.getsizeof(value.value)
+    elif isinstance(value, il.ConstantDict):
+        size += sys.getsizeof(value.values) + sum(sys.getsizeof(pair) for pair in value.values)
+        for k, v in value.values:
+            _valueSize(k, seen, footprint)
+            _valueSize(v, seen, footprint)
+    elif isinstance(value, il.ConstantGlobal):
+        size += sys.getsizeof(value.module) + sys.getsizeof(value.name)
+    elif hasattr(value, 'values'):
+        size += sys.getsizeof(value.values)
+        for v in value.values:
+            _valueSize(v, seen, footprint)
+
+    entry = footprint.setdefault(type(value).__name__, [0, 0])
+    entry[0] += 1
+    entry[1] += size
+
+# Approximate memory held by the IL, broken down by node type. Instructions are
+# keyed by class and opcode, e.g. "VariableInsn(CALL)". Shared values are only
+# counted once.
+def ilFootprint(program: il.Program) -> dict[str, dict[str, int]]:
+    footprint: dict[str, list[int]] = {}
+    seen: set[int] = set()
+    for insn in program:
+        size = sys.getsizeof(insn) + sys.getsizeof(insn.__dict__) + sys.getsizeof(insn.args) + sys.getsizeof(insn.defs)
+        if isinstance(insn, il.VariableInsn):
+            size += sys.getsizeof(insn.uses) + sys.getsizeof(insn.name)
+        entry = footprint.setdefault(f'{type(insn).__name__}({insn.op.name})', [0, 0])
+        entry[0] += 1
+        entry[1] += size
+
+        for arg in insn.args:
+            _valueSize(arg, seen, footprint)
+
+    ordered = sorted(footprint.items(), key=lambda item: item[1][1], reverse=True)
+    return {name: {'count': count, 'bytes': size} for name, (count, size) in ordered}
+
+# Allocations made by the profiler (with its sampling thread), tracemalloc
+# itself and the import machinery are left out of the allocation sites
+_SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, threading.__file__),
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+]
+
+_PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _siteName(frame: tracemalloc.Frame) -> str:
+    filename = frame.filename
+    if filename.startswith(_PACKAGE_ROOT + os.sep):
+        filename = os.path.relpath(filename, _PACKAGE_ROOT)
+    return f'{filename}:{frame.lineno}'
+
+# The allocation sites (file and line) that gained the most memory between two
+# tracemalloc snapshots
+def topAllocations(before: tracemalloc.Snapshot, after: tracemalloc.Snapshot, limit: int) -> list[dict]:
+    stats = after.filter_traces(_SNAPSHOT_FILTERS).compare_to(before.filter_traces(_SNAPSHOT_FILTERS), 'lineno')
+    stats = [stat for stat in stats if stat.size_diff > 0]
+    stats.sort(key=lambda stat: stat.size_diff, reverse=True)
+    return [{'site': _siteName(stat.traceback[0]), 'bytes': stat.size_diff, 'count': stat.count_diff}
+            for stat in stats[:limit]]
+
+# Records peak and retained memory for each pipeline stage, using tracemalloc
+# for Python allocations and RSS sampling for the whole process. A tracemalloc
+# snapshot is taken before and after each stage, and the allocation sites that
+# retained the most memory are reported with the stage.
+class MemoryProfiler:
+    def __init__(self, sampleInterval: float = 0.01, topTypes: int = 10, topSites: int = 10):
+        self.sampleInterval = sampleInterval
+        self.topTypes = topTypes
+        self.topSites = topSites
+        self.stages: dict[str, dict] = {}
+        self.footprint: dict[str, dict[str, int]] = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        startedTracing = not tracemalloc.is_tracing()
+        if startedTracing:
+            tracemalloc.start()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        sampler = _RssSampler(self.sampleInterval)
+        sampler.start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            rss = sampler.stop()
+            current, peak = tracemalloc.get_traced_memory()
+            sites = topAllocations(snapshot, tracemalloc.take_snapshot(), self.topSites)
+            del snapshot
+            if startedTracing:
+                tracemalloc.stop()
+            self.stages[name] = {
+                'time': elapsed,
+                'peak': peak - before,
+                'retained': current - before,
+                'peakRss': rss,
+                'topAllocations': sites,
+            }
+
+    # Records the IL node types holding the most memory in the given program.
+    def recordProgram(self, program: il.Program):
+        self.footprint = dict(list(ilFootprint(program).items())[:self.topTypes])
+
+    def report(self) -> dict:
+        return {'stages': self.stages, 'ilTypes': self.footprint}
+
+    def __str__(self):
+        lines = []
+        for name, stage in self.stages.items():
+            lines.append(f'{name}: peak {_formatBytes(stage["peak"])}, retained {_formatBytes(stage["retained"])}, '
+                         f'peak RSS {_formatBytes(stage["peakRss"])} ({stage["time"]:.2f}s)')
+            for site in stage['topAllocations']:
+                lines.append(f'  {site["site"]}: {site["count"]} blocks, {_formatBytes(site["bytes"])}')
+        if self.footprint:
+            lines.append('Largest IL node types:')
+            for name, entry in self.footprint.items():
+                lines.append(f'  {name}: {entry["count"]} nodes, {_formatBytes(entry["bytes"])}')
+        return '\n'.join(lines)
+
+def _formatBytes(n: int) -> str:
+    for unit in ['B', 'KiB', 'MiB', 'GiB']:
+        if abs(n) < 1024 or unit == 'GiB':
+            return f'{n:.1f} {unit}' if unit != 'B' else f'{n} B'
+        n /= 1024
@@ -0,0 +1,50 @@
+from typing import Callable
+
+# Number of opcodes (while disassembling) or instructions (while generating
+# code) between two progress reports
+DEFAULT_INTERVAL = 100000
+
+# A progress report of one stage of the pipeline: 'disassemble', 'transform' or
+# 'codegen'. done counts units ('bytes' of the pickle read, 'passes' run,
+# 'partitions' transformed or 'instructions' generated) out of total, if it is
+# known. detail describes where the stage is, e.g. the pass and round.
+class ProgressEvent:
+    def __init__(self, stage: str, unit: str, done: int, total: int | None = None, detail: str | None = None):
+        self.stage = stage
+        self.unit = unit
+        self.done = done
+        self.total = total
+        self.detail = detail
+
+    def __repr__(self):
+        total = f'/{self.total}' if self.total is not None else ''
+        detail = f' ({self.detail})' if self.detail is not None else ''
+        return f'<{self.stage}: {self.done}{total} {self.unit}{detail}>'
+
+# Raised where a cancelled stage has nothing partial to return. program is the
+# partial program, if there is one.
+class Cancelled(Exception):
+    def __init__(self, message: str = 'Cancelled', program=None):
+        super().__init__(message)
+        self.program = program
+
+# Passes progress reports of the pipeline to a callback. The callback returns
+# True to cancel, after which every stage stops at its next report: the
+# disassembler returns the program read so far, ending in a POISON
+# instruction, the transform manager stops between passes, leaving a complete
+# but partially analyzed program, and the code generator ends the source
+# generated so far with a raise.
+class Progress:
+    def __init__(self, callback: Callable[[ProgressEvent], bool | None], interval: int = DEFAULT_INTERVAL):
+        self.callback = callback
+        self.interval = interval
+        self.cancelled = False
+
+    # Returns whether the pipeline should stop
+    def report(self, stage: str, unit: str, done: int, total: int | None = None, detail: str | None = None) -> bool:
+        if not self.cancelled and self.callback(ProgressEvent(stage, unit, done, total, detail)):
+            self.cancelled = True
+        return self.cancelled
+
+    def cancel(self):
+        self.cancelled = True
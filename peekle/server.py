@@ -0,0 +1,232 @@
+import io
+import os
+import json
+import time
+import signal
+import socket
+import struct
+import resource
+import threading
+import socketserver
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from .il import dis
+from . import transform
+from . import codegen
+
+# Every message is a length-prefixed JSON header followed by a length-prefixed
+# binary payload (which may be empty):
+#
+#   u32 header length | header (UTF-8 JSON) | u64 payload length | payload
+#
+# Requests carry either a "path" in the header or the pickle bytes as payload,
+# plus "output" ("source", "il" or "stats"), "analysis" and "poolConstants".
+# Responses carry "status" ("ok", "poisoned" or "error"), "error" and "stats",
+# with the source or IL text as payload.
+HEADER_LENGTH = struct.Struct('>I')
+PAYLOAD_LENGTH = struct.Struct('>Q')
+
+# Largest header and payload a message may carry, larger ones are rejected
+# before anything is read
+MAX_HEADER_SIZE = 1 << 20
+MAX_PAYLOAD_SIZE = 1 << 32
+
+OUTPUTS = ('source', 'il', 'stats')
+
+def _recvExact(sock: socket.socket, n: int) -> bytes | None:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(min(n - len(buf), 1 << 20))
+        if not chunk:
+            if buf:
+                raise ConnectionError('Connection closed in the middle of a message')
+            return None
+        buf += chunk
+    return bytes(buf)
+
+def sendMessage(sock: socket.socket, header: dict, payload: bytes = b''):
+    data = json.dumps(header).encode('utf-8')
+    sock.sendall(HEADER_LENGTH.pack(len(data)) + data + PAYLOAD_LENGTH.pack(len(payload)))
+    if payload:
+        sock.sendall(payload)
+
+def _recvRequired(sock: socket.socket, n: int) -> bytes:
+    data = _recvExact(sock, n)
+    if data is None:
+        raise ConnectionError('Connection closed in the middle of a message')
+    return data
+
+# Returns None if the peer closed the connection between messages. Raises
+# ValueError for messages larger than the limits.
+def recvMessage(sock: socket.socket, maxPayload: int = MAX_PAYLOAD_SIZE) -> tuple[dict, bytes] | None:
+    data = _recvExact(sock, HEADER_LENGTH.size)
+    if data is None:
+        return None
+    n = HEADER_LENGTH.unpack(data)[0]
+    if n > MAX_HEADER_SIZE:
+        raise ValueError(f'Header of {n} bytes exceeds the limit of {MAX_HEADER_SIZE}')
+    header = json.loads(_recvRequired(sock, n) if n > 0 else b'')
+    n = PAYLOAD_LENGTH.unpack(_recvRequired(sock, PAYLOAD_LENGTH.size))[0]
+    if n > maxPayload:
+        raise ValueError(f'Payload of {n} bytes exceeds the limit of {maxPayload}')
+    payload = _recvRequired(sock, n) if n > 0 else b''
+    return header, payload
+
+# Sends a single request to a running server and waits for the response.
+def request(socketPath: str, header: dict, payload: bytes = b'') -> tuple[dict, bytes]:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socketPath)
+        sendMessage(sock, header, payload)
+        response = recvMessage(sock)
+    if response is None:
+        raise ConnectionError('Server closed the connection without responding')
+    return response
+
+# Derives from BaseException so that it is not turned into a POISON instruction
+# by the disassembler's error handling.
+class RequestTimeout(BaseException):
+    pass
+
+def _raiseTimeout(signum, frame):
+    raise RequestTimeout('Request exceeded the time limit')
+
+# Warm per-process pipeline. The time limit is enforced per request with an
+# interval timer, the memory limit caps the address space of the worker.
+class ServerWorker:
+    def __init__(self, timeout: float | None = None, memoryLimit: int | None = None):
+        self.timeout = timeout
+        if memoryLimit is not None:
+            resource.setrlimit(resource.RLIMIT_AS, (memoryLimit, memoryLimit))
+        signal.signal(signal.SIGALRM, _raiseTimeout)
+        # Interrupts are handled by the server process, which shuts the pool down
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+        self.transform = transform.createDefaultTransformManager()
+        self.codegen = codegen.CodeGenerator()
+        self.poolingCodegen = codegen.CodeGenerator(poolConstants=True)
+
+    def _run(self, header: dict, payload: bytes) -> tuple[dict, bytes]:
+        output = header.get('output', 'source')
+        if output not in OUTPUTS:
+            raise ValueError(f'Unknown output: {output}')
+
+        stats = {}
+        timings = {}
+        if 'path' in header:
+            f = open(header['path'], 'rb')
+        else:
+            f = io.BytesIO(payload)
+        with f:
+            start = time.perf_counter()
+            disassembler = dis.Disassembler(f, collectStats=output == 'stats')
+            program = disassembler.disassemble()
+            timings['disassemble'] = time.perf_counter() - start
+            if disassembler.stats is not None:
+                stats['disassembly'] = disassembler.stats.toDict()
+            stats['inputSize'] = f.tell()
+
+        if header.get('analysis', True):
+            start = time.perf_counter()
+            stats['passes'] = self.transform.run(program, maxPasses=transform.DEFAULT_MAX_PASSES)
+            timings['transform'] = time.perf_counter() - start
+
+        out = b''
+        if output == 'il':
+            out = str(program).encode('utf-8')
+        elif output == 'source':
+            start = time.perf_counter()
+            codegen_ = self.poolingCodegen if header.get('poolConstants', False) else self.codegen
+            out = codegen_.generateSource(program).encode('utf-8')
+            timings['codegen'] = time.perf_counter() - start
+
+        stats['instructions'] = sum(1 for _ in program)
+        stats['timings'] = timings
+        return {'status': 'poisoned' if program.poison else 'ok', 'stats': stats}, out
+
+    def _disarm(self):
+        if self.timeout is None:
+            return
+        try:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        except RequestTimeout:
+            # Fired just as the request finished, the timer has expired
+            pass
+
+    def handle(self, header: dict, payload: bytes) -> tuple[dict, bytes]:
+        # The timer is disarmed before leaving the try, so that a timeout firing
+        # at any point still produces a response
+        try:
+            try:
+                if self.timeout is not None:
+                    signal.setitimer(signal.ITIMER_REAL, self.timeout)
+                result = self._run(header, payload)
+            finally:
+                self._disarm()
+        except (Exception, RequestTimeout) as e:
+            return {'status': 'error', 'error': f'{type(e).__name__}: {e}'}, b''
+        return result
+
+_worker: ServerWorker | None = None
+
+def _initWorker(timeout: float | None, memoryLimit: int | None):
+    global _worker
+    _worker = ServerWorker(timeout, memoryLimit)
+
+def _handleRequest(header: dict, payload: bytes) -> tuple[dict, bytes]:
+    return _worker.handle(header, payload)
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                message = recvMessage(self.request, self.server.maxPayload)
+            except (ConnectionError, ValueError) as e:
+                sendMessage(self.request, {'status': 'error', 'error': f'Bad request: {e}'})
+                return
+            if message is None:
+                return
+
+            sendMessage(self.request, *self.server.submit(*message))
+
+# Long-lived decompile server on a UNIX socket. Connections are handled on
+# threads, the actual work runs on a pool of warm worker processes.
+class DecompileServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socketPath: str, workers: int | None = None, timeout: float | None = None,
+                 memoryLimit: int | None = None, maxPayload: int = MAX_PAYLOAD_SIZE):
+        if os.path.exists(socketPath):
+            os.unlink(socketPath)
+        super().__init__(socketPath, _RequestHandler)
+        os.chmod(socketPath, 0o600)
+
+        self.socketPath = socketPath
+        self.workers = workers
+        self.timeout = timeout
+        self.memoryLimit = memoryLimit
+        self.maxPayload = maxPayload
+        self.executorLock = threading.Lock()
+        self.executor = self._createExecutor()
+
+    def _createExecutor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_initWorker,
+                                   initargs=(self.timeout, self.memoryLimit))
+
+    def submit(self, header: dict, payload: bytes) -> tuple[dict, bytes]:
+        executor = self.executor
+        try:
+            return executor.submit(_handleRequest, header, payload).result()
+        except BrokenProcessPool as e:
+            # A worker died outright (e.g. killed by the OS), replace the pool
+            # so that later requests are served again
+            with self.executorLock:
+                if self.executor is executor:
+                    self.executor = self._createExecutor()
+                    executor.shutdown(wait=False, cancel_futures=True)
+            return {'status': 'error', 'error': f'{type(e).__name__}: {e}'}, b''
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(cancel_futures=True)
+        if os.path.exists(self.socketPath):
+            os.unlink(self.socketPath)
@@ -1,4 +1,11 @@
 from .constant_fold import *
 from .dead_code import *
 from .known_builtins import *
+from .numpy_arrays import *
+from .torch_storage import *
+from .recognizers import *
 from .transform import *
+from .pipeline import *
+from .query import *
+from .load_cost import *
+from .purity import *
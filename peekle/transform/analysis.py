@@ -1,7 +1,8 @@
 import sys
 import builtins
+import _compat_pickle
 from .. import il
-import functools
+from . import purity
 
 # (insn, expected # args)
 GLOBAL_CALL_MAP = {
@@ -44,34 +45,21 @@ SIDE_EFFECT_INSNS = set([
     il.InsnType.SET_ITEM,
     il.InsnType.BUILD,
     il.InsnType.EXTEND,
+    il.InsnType.PERSISTENT_LOAD,
     il.InsnType.POISON
 ])
 
-SIDE_EFFECT_FREE_CALLS = set([
-    __import__,
-    range,
-    abs,
-    bin,
-    chr,
-    copyright,
-    credits,
-    dir,
-    getattr,
-    globals,
-    hasattr,
-    hash,
-    help,
-    hex,
-    id,
-    len,
-    license,
-    locals,
-    map,
-    max,
-    min,
-    oct,
-    round,
-    functools.partial
+# Calls to callables of these kinds can be removed when unused and inlined,
+# if all of their arguments are literals
+SIDE_EFFECT_FREE_PURITY = set([purity.PURE, purity.CONSTRUCTOR])
+
+# Instructions that call a method of their operands, which runs code unless
+# the operands are literals (e.g. a defaultdict's factory on a missing key)
+DISPATCHING_INSNS = set([
+    il.InsnType.GET_ATTR,
+    il.InsnType.GET_ITEM,
+    il.InsnType.LEN,
+    *(op for op, _ in INSTANCE_DUNDER_MAP.values()),
 ])
 
 BUILTIN_CALLS = set()
@@ -106,18 +94,79 @@ def maybeGetConstantCallee(insn: il.Insn):
         return getGlobal(insn.args[0])
     return None
 
+# Whether a value is built only from literals. Anything else, a global or the
+# result of an instruction, may be a callable or an object with methods that
+# run code when a pure callable uses it.
+def isLiteral(value: il.Value) -> bool:
+    if isinstance(value, il.ConstantValue):
+        return True
+    if isinstance(value, il.ConstantDict):
+        return all(isLiteral(k) and isLiteral(v) for k, v in value.values)
+    if isinstance(value, (il.ConstantTuple, il.ConstantList, il.ConstantSet, il.ConstantFrozenSet)):
+        return all(isLiteral(v) for v in value.values)
+    return False
+
 def hasSideEffects(insn: il.Insn):
     if insn.op in SIDE_EFFECT_INSNS:
         return True
+
+    if insn.op in DISPATCHING_INSNS:
+        return not all(isLiteral(arg) for arg in insn.args)
     
     if insn.op == il.InsnType.CALL:
         if not isConstantCall(insn):
             return True
         
-        callee = getGlobal(insn.args[0])
-        if callee is None:
+        global_ = insn.args[0]
+        if getPurity(global_.module, global_.name) not in SIDE_EFFECT_FREE_PURITY:
             return True
-        
-        return callee not in SIDE_EFFECT_FREE_CALLS
+        # A pure callable or constructor may still run code through what it is
+        # given (list() over a map of os.system, operator.getitem on a
+        # defaultdict of os.system) or keep a callable to run later
+        return not isLiteral(insn.args[1])
 
     return False
+
+# Protocol 0-2 pickles may use Python 2 names, which pickle maps on load.
+# Returns the Python 3 (module, name) of a global.
+def normalizeGlobal(module: str, name: str | None) -> tuple[str, str | None]:
+    if (module, name) in _compat_pickle.NAME_MAPPING:
+        return _compat_pickle.NAME_MAPPING[(module, name)]
+    return _compat_pickle.IMPORT_MAPPING.get(module, module), name
+
+# Returns the declared purity of a global (see purity.lookupPurity), or None.
+# The global is looked up by its Python 3 name first, then, if it resolves, by
+# the module and qualified name of the object itself, so that a callable
+# re-exported by another module shares the summary of the original.
+def getPurity(module: str, name: str | None) -> str | None:
+    if _purityCacheVersion[0] != purity.purityVersion:
+        _purityCache.clear()
+        _purityCacheVersion[0] = purity.purityVersion
+
+    key = (module, name)
+    if key not in _purityCache:
+        module, name = normalizeGlobal(module, name)
+        kind = purity.lookupPurity(module, name)
+        if kind is None:
+            obj = getGlobal(il.ConstantGlobal(module, name))
+            objModule, objName = getattr(obj, '__module__', None), getattr(obj, '__qualname__', None)
+            if isinstance(objModule, str) and isinstance(objName, str) and (objModule, objName) != (module, name):
+                kind = purity.lookupPurity(objModule, objName)
+        _purityCache[key] = kind
+    return _purityCache[key]
+
+_purityCache: dict[tuple[str, str | None], str | None] = {}
+_purityCacheVersion = [-1]
+
+# Classifies a global referenced by a pickle without importing anything: its
+# declared purity ('pure', 'constructor' or 'impure'), 'impure' for anything
+# else that resolves, and 'unresolved' if its module is not loaded or lacks
+# the name.
+def classifyGlobal(module: str, name: str | None) -> str:
+    kind = getPurity(module, name)
+    if kind is not None:
+        return kind
+    module, name = normalizeGlobal(module, name)
+    if getGlobal(il.ConstantGlobal(module, name)) is None:
+        return 'unresolved'
+    return purity.IMPURE
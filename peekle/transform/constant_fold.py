@@ -3,13 +3,21 @@ from .transform import TransformPass
 from .. import il
 from . import analysis
 
+# Instructions that ConstantValuePass folds when both operands are constant
+FOLDABLE_OPS = (
+    il.InsnType.EQUALS, il.InsnType.NOT_EQUALS, il.InsnType.LESS_THAN, il.InsnType.LESS_EQUALS,
+    il.InsnType.GREATER_THAN, il.InsnType.GREATER_EQUALS, il.InsnType.ADD, il.InsnType.SUB, il.InsnType.MUL,
+    il.InsnType.FLOOR_DIV, il.InsnType.TRUE_DIV, il.InsnType.MOD, il.InsnType.POW, il.InsnType.BITWISE_AND,
+    il.InsnType.BITWISE_OR, il.InsnType.BITWISE_XOR, il.InsnType.LSHIFT, il.InsnType.RSHIFT,
+)
+
 class ConstantValuePass(TransformPass):
     def __init__(self):
         super().__init__('Constant Value Folding')
 
     def run(self, program: il.Program) -> bool:
         modified = False
-        it = iter(program)
+        it = program.iterOps(*FOLDABLE_OPS)
         for insn in it:
             if not isinstance(insn, il.VariableInsn) or len(insn.args) != 2 or \
                 not all(isinstance(arg, il.ConstantValue) for arg in insn.args):
@@ -65,7 +73,7 @@ class ConstantGlobalPass(TransformPass):
 
     def run(self, program: il.Program) -> bool:
         modified = False
-        it = iter(program)
+        it = program.iterOps(il.InsnType.GLOBAL)
         for insn in it:
             if not isinstance(insn, il.VariableInsn):
                 continue
@@ -91,7 +99,7 @@ class ConstantGetItemPass(TransformPass):
 
     def run(self, program: il.Program) -> bool:
         modified = False
-        it = iter(program)
+        it = program.iterOps(il.InsnType.GET_ITEM)
         for insn in it:
             if insn.op != il.InsnType.GET_ITEM or not isinstance(insn, il.VariableInsn) or \
                 not isinstance(insn.args[1], il.ConstantValue) or \
@@ -110,7 +118,7 @@ class InlineMutableConstantPass(TransformPass):
 
     def run(self, program: il.Program) -> bool:
         modified = False
-        it = iter(program)
+        it = program.iterOps(il.InsnType.MUTABLE_CONSTANT)
         for insn in it:
             if insn.op != il.InsnType.MUTABLE_CONSTANT or not isinstance(insn, il.VariableInsn) or \
                 len(insn.uses) != 1:
@@ -10,7 +10,7 @@ class GlobalCallPass(TransformPass):
 
     def run(self, program: il.Program) -> bool:
         modified = False
-        it = iter(program)
+        it = program.iterOps(il.InsnType.CALL)
         for insn in it:
             callee = analysis.maybeGetConstantCallee(insn)
             if callee is None or callee not in analysis.GLOBAL_CALL_MAP:
@@ -33,7 +33,7 @@ class InstanceDunderPass(TransformPass):
 
     def run(self, program: il.Program) -> bool:
         modified = False
-        it = iter(program)
+        it = program.iterOps(il.InsnType.GET_ATTR)
         for insn in it:
             if insn.op != il.InsnType.GET_ATTR or not isinstance(insn, il.VariableInsn) or \
                 not isinstance(insn.args[1], il.ConstantValue):
@@ -70,7 +70,7 @@ class ImportToGlobalPass(TransformPass):
 
     def run(self, program: il.Program) -> bool:
         modified = False
-        it = iter(program)
+        it = program.iterOps(il.InsnType.CALL)
         for insn in it:
             callee = analysis.maybeGetConstantCallee(insn)
             if callee is not __import__ or not isinstance(insn, il.VariableInsn):
@@ -116,7 +116,7 @@ class GlobalReductionPass(TransformPass):
 
     def run(self, program: il.Program) -> bool:
         modified = False
-        it = iter(program)
+        it = program.iterOps(il.InsnType.GET_ATTR)
         for insn in it:
             modified |= self._reduceGlobal(program, insn, it)
         return modified
@@ -128,7 +128,7 @@ class LocalsPass(TransformPass):
 
     def run(self, program: il.Program) -> bool:
         modified = False
-        it = iter(program)
+        it = program.iterOps(il.InsnType.CALL)
         for insn in it:
             callee = analysis.maybeGetConstantCallee(insn)
             if callee is not locals or not isinstance(insn, il.VariableInsn):
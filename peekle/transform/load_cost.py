@@ -0,0 +1,345 @@
+import sys
+from typing import cast
+from .. import il
+from . import analysis
+from .torch_storage import STORAGE_DTYPES
+
+# Sizes of CPython 3 objects on 64-bit platforms, see sys.getsizeof
+POINTER_SIZE = 8
+LIST_SIZE = 56
+TUPLE_SIZE = 40
+BYTEARRAY_SIZE = 57
+EMPTY_DICT_SIZE = 64
+SMALL_SET_SIZE = 216
+# An instance of a class with a __dict__, the dict is accounted separately
+OBJECT_SIZE = 56
+# numpy.ndarray header, the data is shared with the bytes it was created from
+NDARRAY_SIZE = 112
+
+# Bytes per element of the dtypes torch storages are recorded with
+TORCH_ITEM_SIZES = {
+    'float64': 8, 'float32': 4, 'float16': 2, 'bfloat16': 2,
+    'int64': 8, 'int32': 4, 'int16': 2, 'int8': 1, 'uint8': 1, 'bool': 1,
+    'complex128': 16, 'complex64': 8,
+    'qint8': 1, 'quint8': 1, 'qint32': 4, 'quint4x2': 1, 'quint2x4': 1,
+}
+
+def _listSize(n: int) -> int:
+    return LIST_SIZE + POINTER_SIZE * n
+
+def _tupleSize(n: int) -> int:
+    return TUPLE_SIZE + POINTER_SIZE * n if n > 0 else 0
+
+# Entries of a dict's hash table. Since 3.11, dicts whose keys are all str
+# leave out the hash, which the keys cache.
+DICT_ENTRY_SIZE = 24
+UNICODE_DICT_ENTRY_SIZE = 16 if sys.version_info >= (3, 11) else DICT_ENTRY_SIZE
+
+# A dict's hash table is a power of two, at most two thirds full, with an index
+# entry of 1 to 8 bytes per slot and an entry per usable slot.
+def _dictSize(n: int, unicodeKeys: bool = False) -> int:
+    if n == 0:
+        return EMPTY_DICT_SIZE
+    slots = 8
+    while slots * 2 // 3 < n:
+        slots *= 2
+    indexSize = 1 if slots <= 0xff else 2 if slots <= 0xffff else 4 if slots <= 0xffffffff else 8
+    entrySize = UNICODE_DICT_ENTRY_SIZE if unicodeKeys else DICT_ENTRY_SIZE
+    return 96 + slots * indexSize + (slots * 2 // 3) * entrySize
+
+# Sets resize to four times their size once three fifths full, small sets use
+# the 8 slots inside the object.
+def _setSize(n: int) -> int:
+    slots = 8
+    while True:
+        threshold = -(-(slots - 1) * 3 // 5)
+        if n < threshold:
+            break
+        target = threshold * 2 if threshold > 50000 else threshold * 4
+        slots = 8
+        while slots <= target:
+            slots *= 2
+    return SMALL_SET_SIZE if slots == 8 else SMALL_SET_SIZE + 16 * slots
+
+CONTAINER_SIZES = {
+    'list': _listSize,
+    'tuple': _tupleSize,
+    'dict': _dictSize,
+    'set': _setSize,
+    'frozenset': _setSize,
+}
+
+CONTAINER_TYPES = {
+    il.ConstantList: 'list',
+    il.ConstantTuple: 'tuple',
+    il.ConstantDict: 'dict',
+    il.ConstantSet: 'set',
+    il.ConstantFrozenSet: 'frozenset',
+}
+
+# Constructors whose result size follows from the number of items passed in
+KNOWN_CONSTRUCTORS = {
+    ('builtins', 'list'): 'list',
+    ('builtins', 'tuple'): 'tuple',
+    ('builtins', 'dict'): 'dict',
+    ('builtins', 'set'): 'set',
+    ('builtins', 'frozenset'): 'frozenset',
+}
+
+# Calls that create an instance of their first argument
+INSTANCE_CONSTRUCTORS = set([
+    ('copyreg', '_reconstructor'),
+    ('copyreg', '__newobj__'),
+    ('copyreg', '__newobj_ex__'),
+    ('builtins', 'object.__new__'),
+])
+
+def _isSingleton(value) -> bool:
+    if value is None or type(value) is bool:
+        return True
+    if type(value) is int:
+        return -5 <= value <= 256
+    if type(value) is str:
+        return len(value) == 0 or (len(value) == 1 and ord(value) < 256)
+    if type(value) is bytes:
+        return len(value) <= 1
+    return False
+
+def _isStr(value: il.Value) -> bool:
+    return isinstance(value, il.ConstantValue) and type(value.value) is str
+
+def _hasUnicodeKeys(value: il.Value) -> bool:
+    return isinstance(value, il.ConstantDict) and all(_isStr(k) for k, _ in value.values)
+
+def _containerSize(name: str, n: int, unicodeKeys: bool = False) -> int:
+    if name == 'dict':
+        return _dictSize(n, unicodeKeys)
+    return CONTAINER_SIZES[name](n)
+
+def _items(value: il.Value) -> list[il.Value]:
+    if isinstance(value, il.ConstantDict):
+        return [v for pair in value.values for v in pair]
+    return value.values
+
+# Estimated footprint of the object graph a pickle reconstructs, broken down by
+# type. Built-in types are keyed by name, objects created by calls by the
+# global that created them.
+class LoadCost:
+    def __init__(self):
+        self.totalBytes = 0
+        self.objects = 0
+        # References to an object that is already counted (memo GETs)
+        self.sharedReferences = 0
+        # Values whose size cannot be known statically (results of operations,
+        # persistent ids), they are counted as objects of size 0
+        self.unknownObjects = 0
+        # Set when the program stops at an unsupported opcode, the estimate only
+        # covers what was disassembled before it
+        self.partial = False
+        self.types: dict[str, dict[str, int]] = {}
+
+    def record(self, name: str, size: int, objects: int = 1, builds: int = 0):
+        entry = self.types.setdefault(name, {'objects': 0, 'builds': 0, 'bytes': 0})
+        entry['objects'] += objects
+        entry['builds'] += builds
+        entry['bytes'] += size
+        self.objects += objects
+        self.totalBytes += size
+
+    def toDict(self) -> dict:
+        return {
+            'totalBytes': self.totalBytes,
+            'objects': self.objects,
+            'sharedReferences': self.sharedReferences,
+            'unknownObjects': self.unknownObjects,
+            'partial': self.partial,
+            'types': dict(sorted(self.types.items(), key=lambda item: item[1]['bytes'], reverse=True)),
+        }
+
+    def __str__(self):
+        lines = [f'Estimated load cost: {self.totalBytes} bytes in {self.objects} objects']
+        lines.append(f'Shared references: {self.sharedReferences}, unknown objects: {self.unknownObjects}')
+        if self.partial:
+            lines.append('Partial estimate, the program could not be fully disassembled')
+        for name, entry in sorted(self.types.items(), key=lambda item: item[1]['bytes'], reverse=True):
+            builds = f', {entry["builds"]} builds' if entry['builds'] else ''
+            lines.append(f'  {name}: {entry["objects"]} objects{builds}, {entry["bytes"]} bytes')
+        return '\n'.join(lines)
+
+# Estimates the memory pickle.load would allocate for a program, without
+# executing or importing anything. Sizes are those of CPython on 64-bit
+# platforms; objects of unknown classes are assumed to be plain instances whose
+# state is accounted separately. Values shared through the memo are counted
+# once. Best run on the program before analysis, which may duplicate folded
+# constants.
+class LoadCostEstimator:
+    def __init__(self):
+        self.cost = LoadCost()
+        self.seen: set[int] = set()
+        # Mutable containers, their current number of items and whether all
+        # their keys are str, sized at the end
+        self.containers: dict[il.VariableInsn, list] = {}
+        self.classes: dict[il.VariableInsn, str] = {}
+        # Keys of the torch storages already counted, each is loaded once
+        self.storages: set = set()
+
+    def _globalName(self, value: il.Value) -> str | None:
+        if isinstance(value, il.ConstantGlobal):
+            if value.name is None:
+                return value.module
+            return '.'.join(analysis.normalizeGlobal(value.module, value.name))
+        if isinstance(value, il.VariableInsn) and value.op == il.InsnType.GLOBAL and \
+            all(isinstance(arg, il.ConstantValue) and type(arg.value) is str for arg in value.args):
+            module, name = (cast(il.ConstantValue, arg).value for arg in value.args)
+            return '.'.join(analysis.normalizeGlobal(module, name))
+        return None
+
+    # Counts a constant and everything it contains, unless it was already
+    # counted through another reference
+    def _countValue(self, value: il.Value):
+        if isinstance(value, (il.VariableInsn, il.ConstantGlobal)):
+            return
+        if id(value) in self.seen:
+            self.cost.sharedReferences += 1
+            return
+        self.seen.add(id(value))
+
+        if isinstance(value, il.ConstantValue):
+            if not _isSingleton(value.value):
+                self.cost.record(type(value.value).__name__, sys.getsizeof(value.value))
+            return
+
+        name = CONTAINER_TYPES[type(value)]
+        if name != 'tuple' or value.values:
+            self.cost.record(name, _containerSize(name, len(value.values), _hasUnicodeKeys(value)))
+        for item in _items(value):
+            self._countValue(item)
+
+    # Counts the items of a container that are added to another one, the
+    # container itself is not retained
+    def _countItems(self, value: il.Value):
+        if isinstance(value, il.VariableInsn):
+            return
+        if hasattr(value, 'values') and id(value) not in self.seen:
+            for item in _items(value):
+                self._countValue(item)
+        else:
+            self._countValue(value)
+
+    def _addItems(self, target: il.Value, n: int, key: il.Value | None = None):
+        if target in self.containers:
+            self.containers[target][1] += n
+            if key is not None and not _isStr(key):
+                self.containers[target][2] = False
+        elif isinstance(target, il.VariableInsn):
+            # Items added to an object, e.g. a dict subclass
+            self.cost.record(self.classes.get(target, '<unknown>'), POINTER_SIZE * 3 * n, objects=0)
+
+    # Whether a container is only filled and then passed to the given call
+    def _isConsumed(self, container: il.VariableInsn, call: il.Insn) -> bool:
+        return all(use is call or (use.op in (il.InsnType.SET_ITEM, il.InsnType.EXTEND) and use.args[0] is container)
+                   for use in container.uses)
+
+    def _recordStorage(self, key, dtype: str, numel):
+        if key in self.storages:
+            self.cost.sharedReferences += 1
+            return
+        self.storages.add(key)
+        size = TORCH_ITEM_SIZES.get(dtype, 1) * numel if type(numel) is int else 0
+        self.cost.record(f'torch.storage({dtype})', size)
+
+    # Persistent ids torch.save writes for storages, as TorchStoragePass
+    # recognizes them, are sized from their number of elements
+    def _estimatePersistentLoad(self, insn: il.Insn):
+        pid = insn.args[0]
+        if isinstance(pid, il.ConstantTuple) and len(pid.values) == 5 and \
+            all(isinstance(pid.values[i], il.ConstantValue) for i in (0, 2, 4)) and pid.values[0].value == 'storage':
+            storageType = self._globalName(pid.values[1])
+            if storageType is not None and storageType.startswith('torch.') and storageType[6:] in STORAGE_DTYPES:
+                self._recordStorage(f'data/{pid.values[2].value}', STORAGE_DTYPES[storageType[6:]], pid.values[4].value)
+                return
+        self._countItems(pid)
+        self.cost.unknownObjects += 1
+
+    def _estimateCall(self, insn: il.VariableInsn):
+        callee = self._globalName(insn.args[0])
+        args = insn.args[1]
+        self._countItems(args)
+        values = args.values if isinstance(args, il.ConstantTuple) else []
+
+        key = tuple(callee.split('.', 1)) if callee is not None and '.' in callee else None
+        if key in INSTANCE_CONSTRUCTORS and values:
+            callee = self._globalName(values[0]) or callee
+        elif key in KNOWN_CONSTRUCTORS:
+            name = KNOWN_CONSTRUCTORS[key]
+            items = values[0] if values else None
+            if items in self.containers and self._isConsumed(items, insn):
+                # A list built only to be converted, e.g. set([...]) in protocol 2
+                _, n, _ = self.containers.pop(items)
+            elif items is not None and hasattr(items, 'values'):
+                n = len(items.values)
+            else:
+                n = 0
+                if items is not None:
+                    self.cost.unknownObjects += 1
+            self.cost.record(name, _containerSize(name, n))
+            return
+        elif key == ('builtins', 'bytearray'):
+            data = values[0] if values else None
+            n = len(data.value) if isinstance(data, il.ConstantValue) and isinstance(data.value, (bytes, str)) else 0
+            self.cost.record('bytearray', BYTEARRAY_SIZE + n)
+            return
+
+        name = callee if callee is not None else '<dynamic>'
+        self.classes[insn] = name
+        self.cost.record(name, OBJECT_SIZE)
+
+    def estimate(self, program: il.Program) -> LoadCost:
+        for insn in program:
+            op = insn.op
+            if op == il.InsnType.MUTABLE_CONSTANT:
+                value = insn.args[0]
+                self.containers[insn] = [CONTAINER_TYPES[type(value)], len(value.values), _hasUnicodeKeys(value)]
+                for item in _items(value):
+                    self._countValue(item)
+            elif op == il.InsnType.CALL:
+                self._estimateCall(cast(il.VariableInsn, insn))
+            elif op == il.InsnType.SET_ITEM:
+                self._addItems(insn.args[0], 1, insn.args[1])
+                self._countValue(insn.args[1])
+                self._countValue(insn.args[2])
+            elif op == il.InsnType.EXTEND:
+                self._addItems(insn.args[0], len(insn.args[1].values) if hasattr(insn.args[1], 'values') else 0)
+                self._countItems(insn.args[1])
+            elif op == il.InsnType.BUILD:
+                # The state usually becomes the instance __dict__
+                self._countValue(insn.args[1])
+                name = self.classes.get(insn.args[0], '<unknown>')
+                self.cost.record(name, 0, objects=0, builds=1)
+            elif op == il.InsnType.NDARRAY:
+                self._countValue(insn.args[3])
+                self.cost.record('numpy.ndarray', NDARRAY_SIZE)
+            elif op == il.InsnType.STORAGE:
+                entry = cast(il.ConstantValue, insn.args[0]).value
+                dtype = cast(il.ConstantGlobal, insn.args[1]).name
+                numel = insn.args[2].value if isinstance(insn.args[2], il.ConstantValue) else None
+                self._recordStorage(entry, dtype, numel)
+            elif op == il.InsnType.STOP:
+                self._countValue(insn.args[0])
+            elif op == il.InsnType.PERSISTENT_LOAD:
+                self._estimatePersistentLoad(insn)
+            elif op not in (il.InsnType.GLOBAL, il.InsnType.POISON):
+                # Attribute and item lookups, operators and the like
+                for arg in insn.args:
+                    self._countValue(arg)
+                if isinstance(insn, il.VariableInsn):
+                    self.cost.unknownObjects += 1
+
+        for name, n, unicodeKeys in self.containers.values():
+            self.cost.record(name, _containerSize(name, n, unicodeKeys))
+        self.cost.partial = program.poison
+        return self.cost
+
+# Estimates how much memory unpickling the program would take
+def estimateLoadCost(program: il.Program) -> LoadCost:
+    return LoadCostEstimator().estimate(program)
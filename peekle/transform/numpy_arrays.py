@@ -0,0 +1,129 @@
+from typing import cast
+from .transform import TransformPass
+from .. import il
+
+# numpy moved its internals from numpy.core to numpy._core in 2.0, pickles may
+# use either
+RECONSTRUCT_MODULES = set(['numpy.core.multiarray', 'numpy._core.multiarray'])
+FROMBUFFER_MODULES = set(['numpy.core.numeric', 'numpy._core.numeric'])
+
+def _isGlobal(value: il.Value, modules: set[str], name: str) -> bool:
+    return isinstance(value, il.ConstantGlobal) and value.module in modules and value.name == name
+
+def _isConstant(value: il.Value, *types) -> bool:
+    return isinstance(value, il.ConstantValue) and type(value.value) in types
+
+def _constantShape(value: il.Value) -> il.ConstantTuple | None:
+    if not isinstance(value, il.ConstantTuple) or not all(_isConstant(v, int) for v in value.values):
+        return None
+    return value
+
+def _builds(value: il.VariableInsn) -> list[il.Insn]:
+    return [use for use in value.uses if use.op == il.InsnType.BUILD and use.args[0] is value]
+
+# Resolves a numpy.dtype(typestr, False, True) call and the BUILD applying its
+# state to an array-protocol descriptor such as '<f8'. Returns None for
+# structured, subarray and object dtypes, which cannot be loaded from raw data.
+def _dtypeDescr(value: il.Value) -> str | None:
+    if not isinstance(value, il.VariableInsn) or value.op != il.InsnType.CALL or \
+        not isinstance(value.args[0], il.ConstantGlobal) or value.args[0].module != 'numpy' or \
+        value.args[0].name != 'dtype' or not isinstance(value.args[1], il.ConstantTuple):
+        return None
+
+    args = cast(il.ConstantTuple, value.args[1]).values
+    if len(args) != 3 or not _isConstant(args[0], str) or args[0].value.startswith('O'):
+        return None
+
+    builds = _builds(value)
+    if len(builds) != 1 or not isinstance(builds[0].args[1], il.ConstantTuple):
+        return None
+
+    # (version, byteorder, subarray, names, fields, elsize, alignment, flags[, metadata])
+    state = cast(il.ConstantTuple, builds[0].args[1]).values
+    if len(state) not in (8, 9) or not _isConstant(state[1], str) or \
+        not all(_isConstant(v, type(None)) for v in state[2:5]):
+        return None
+    if len(state) == 9 and not _isConstant(state[8], type(None)):
+        return None
+
+    byteorder = state[1].value
+    if byteorder not in ('<', '>', '|'):
+        return None
+    return byteorder + args[0].value
+
+# Removes a dtype call once no array refers to it anymore.
+def _removeUnusedDtype(program: il.Program, dtype: il.VariableInsn):
+    builds = _builds(dtype)
+    if len(dtype.uses) != len(builds):
+        return
+    for build in builds:
+        program.removeInsn(build)
+    program.removeInsn(dtype)
+
+# Recognizes numpy arrays reconstructed from raw bytes and replaces them with a
+# single NDARRAY instruction, so that code generation can load the data without
+# inlining it. Two forms are recognized:
+#   _reconstruct(ndarray, (0,), b'b') followed by
+#       BUILD (1, shape, dtype, is_fortran, data)
+#   _frombuffer(data, dtype, shape, order) (protocol 5 with in-band buffers)
+class NumpyArrayPass(TransformPass):
+    def __init__(self):
+        super().__init__('NumPy Array Recognition')
+
+    def _matchReconstruct(self, insn: il.VariableInsn):
+        args = cast(il.ConstantTuple, insn.args[1]).values
+        if len(args) != 3 or not _isGlobal(args[0], set(['numpy']), 'ndarray'):
+            return None
+
+        builds = _builds(insn)
+        if len(builds) != 1 or not isinstance(builds[0].args[1], il.ConstantTuple):
+            return None
+
+        state = cast(il.ConstantTuple, builds[0].args[1]).values
+        if len(state) != 5 or not _isConstant(state[3], bool) or not _isConstant(state[4], bytes, bytearray):
+            return None
+        shape = _constantShape(state[1])
+        descr = _dtypeDescr(state[2])
+        if shape is None or descr is None:
+            return None
+        return descr, shape, 'F' if state[3].value else 'C', state[4], state[2], builds[0]
+
+    def _matchFrombuffer(self, insn: il.VariableInsn):
+        args = cast(il.ConstantTuple, insn.args[1]).values
+        if len(args) != 4 or not _isConstant(args[0], bytes, bytearray) or \
+            not _isConstant(args[3], str) or args[3].value not in ('C', 'F'):
+            return None
+
+        shape = _constantShape(args[2])
+        descr = _dtypeDescr(args[1])
+        if shape is None or descr is None:
+            return None
+        return descr, shape, args[3].value, args[0], args[1], None
+
+    def run(self, program: il.Program) -> bool:
+        modified = False
+        it = program.iterOps(il.InsnType.CALL)
+        for insn in it:
+            if insn.op != il.InsnType.CALL or not isinstance(insn, il.VariableInsn) or \
+                not isinstance(insn.args[1], il.ConstantTuple):
+                continue
+
+            callee = insn.args[0]
+            if _isGlobal(callee, RECONSTRUCT_MODULES, '_reconstruct'):
+                match = self._matchReconstruct(insn)
+            elif _isGlobal(callee, FROMBUFFER_MODULES, '_frombuffer'):
+                match = self._matchFrombuffer(insn)
+            else:
+                continue
+            if match is None:
+                continue
+
+            descr, shape, order, data, dtype, build = match
+            if build is not None:
+                program.removeInsn(build)
+            insn2 = program.createVarInsn(il.InsnType.NDARRAY, il.ConstantValue(descr), shape,
+                                          il.ConstantValue(order), data)
+            it.replaceInsn(insn2)
+            _removeUnusedDtype(program, dtype)
+            modified = True
+        return modified
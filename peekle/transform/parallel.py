@@ -0,0 +1,387 @@
+from __future__ import annotations
+import os
+import gc
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, BrokenExecutor
+from .. import il
+from ..progress import Progress
+
+# Programs smaller than this are always transformed serially
+MIN_PARALLEL_SIZE = 20000
+# Smallest number of instructions handed to a worker at a time
+MIN_PARTITION_SIZE = 2000
+# Containers near the root with fewer items than this are kept in the main
+# partition and their items are partitioned instead
+MIN_FANOUT = 16
+
+FILL_INSNS = set([
+    il.InsnType.SET_ITEM,
+    il.InsnType.EXTEND,
+    il.InsnType.BUILD,
+    il.InsnType.SET_ATTR,
+])
+
+# A contiguous run of instructions whose variables are only used inside the
+# run or by instructions of the main partition
+class Partition:
+    def __init__(self, first: int):
+        self.first = first
+        self.last = first
+        self.insns: list[il.Insn] = []
+        self.program = il.Program()
+        # Stand-ins for the instructions of the main partition that use the
+        # partition's variables, one per user, so that transforms see the
+        # same number of uses as in the whole program. The first `splits`
+        # stand in for the instructions of the main partition within the
+        # run, in order, and mark where they go back.
+        self.sinks: list[il.Insn] = []
+        self.splits = 0
+        # Variable -> (sink index, position in the sink)
+        self.boundary: dict[il.VariableInsn, tuple[int, int]] = {}
+
+class _UnionFind:
+    def __init__(self):
+        self.parent: dict[il.Insn, il.Insn] = {}
+
+    def find(self, x: il.Insn) -> il.Insn:
+        root = x
+        while self.parent.get(root, root) is not root:
+            root = self.parent[root]
+        while x is not root:
+            self.parent[x], x = root, self.parent.get(x, x)
+        return root
+
+    def union(self, a: il.Insn, b: il.Insn):
+        a, b = self.find(a), self.find(b)
+        if a is not b:
+            self.parent[a] = b
+
+# GLOBAL instructions of constant names are copied into every partition that
+# uses them instead of tying the partitions together
+def _isReplicable(insn: il.Insn) -> bool:
+    return insn.op == il.InsnType.GLOBAL and isinstance(insn, il.VariableInsn) and \
+        all(isinstance(arg, il.ConstantValue) for arg in insn.args)
+
+# Returns the containers near the root of the object graph and the
+# instructions that create or fill them, which stay in the main partition.
+# Descends from the STOP into containers with fewer than MIN_FANOUT items.
+def _findHubs(stop: il.Insn) -> tuple[set[il.VariableInsn], set[il.Insn]]:
+    hubs: set[il.VariableInsn] = set()
+    joins: set[il.Insn] = set([stop])
+    pending: list[il.Insn] = [stop]
+    while pending:
+        node = pending.pop()
+        children = set(node.defs)
+        if isinstance(node, il.VariableInsn):
+            for use in node.uses:
+                if use.op in FILL_INSNS and use.args[0] is node:
+                    joins.add(use)
+                    children.update(use.defs)
+            children.discard(node)
+        children = set(child for child in children if child not in hubs and not _isReplicable(child))
+        if len(children) >= MIN_FANOUT:
+            continue
+        for child in children:
+            hubs.add(child)
+            joins.add(child)
+            pending.append(child)
+    return hubs, joins
+
+# Splits a program into the main partition and contiguous partitions of about
+# partitionSize instructions that share no variables with each other. Returns
+# the instructions of the main partition and the partitions, or None if the
+# program does not split.
+def partitionProgram(program: il.Program, partitionSize: int) -> tuple[set[il.Insn], list[Partition]] | None:
+    insns = list(program)
+    stop = next((insn for insn in reversed(insns) if insn.op == il.InsnType.STOP), None)
+    if stop is None:
+        return None
+
+    hubs, joins = _findHubs(stop)
+    sets = _UnionFind()
+    main: set[il.Insn] = set()
+    for insn in insns:
+        if insn in joins or _isReplicable(insn) or insn.op in (il.InsnType.STOP, il.InsnType.POISON):
+            main.add(insn)
+            continue
+        for def_ in insn.defs:
+            if not _isReplicable(def_):
+                sets.union(insn, def_)
+    mainRoots = set(sets.find(hub) for hub in hubs)
+
+    last: dict[il.Insn, int] = {}
+    roots: list[il.Insn | None] = []
+    for i, insn in enumerate(insns):
+        root = None
+        if insn not in main:
+            root = sets.find(insn)
+            if root in mainRoots:
+                main.add(insn)
+                root = None
+            else:
+                last[root] = i
+        roots.append(root)
+
+    # A partition may only end where no connected component continues
+    partitions: list[Partition] = []
+    partition = None
+    reach = -1
+    for i, (insn, root) in enumerate(zip(insns, roots)):
+        if root is None:
+            continue
+        if partition is None:
+            partition = Partition(i)
+        partition.insns.append(insn)
+        partition.last = i
+        reach = max(reach, last[root])
+        if len(partition.insns) >= partitionSize and reach <= i:
+            partitions.append(partition)
+            partition = None
+    if partition is not None:
+        partitions.append(partition)
+
+    if len(partitions) < 2:
+        return None
+    return main, partitions
+
+# Replaces variables in the arguments of an instruction, all at once
+def _substitute(insn: il.Insn, values: dict[il.VariableInsn, il.Value]):
+    varMap = {def_: values.get(def_, def_) for def_ in insn.defs}
+    insn.args = [arg.cloneValue(varMap) for arg in insn.args]
+    insn.defs = il.Value.computeDefs(insn.args)
+
+def _relink(program: il.Program, insns: list[il.Insn]):
+    for insn in insns:
+        insn.prev = None
+        insn.next = None
+        program.insertInsn(insn, program.end)
+
+# Moves a partition's instructions into a program of their own, along with a
+# copy of every constant GLOBAL they use and sinks for the instructions of the
+# main partition within its range and those that use its variables
+def _buildPartition(program: il.Program, partition: Partition, insns: list[il.Insn], index: dict[il.Insn, int]):
+    members = set(partition.insns)
+    copies: dict[il.VariableInsn, il.VariableInsn] = {}
+    users: dict[il.Insn, list[il.VariableInsn]] = {}
+    for insn in partition.insns:
+        globals_ = [def_ for def_ in insn.defs if def_ not in members]
+        if globals_:
+            for def_ in globals_:
+                if def_ not in copies:
+                    copies[def_] = program.createVarInsn(il.InsnType.GLOBAL, *def_.args)
+                def_.uses.discard(insn)
+            _substitute(insn, copies)
+        if isinstance(insn, il.VariableInsn):
+            for use in insn.uses:
+                if use not in members:
+                    users.setdefault(use, []).append(insn)
+
+    inRange = [insn for insn in insns[partition.first:partition.last] if insn not in members]
+    users = dict([(insn, users.pop(insn, [])) for insn in inRange] + sorted(users.items(), key=lambda item: index[item[0]]))
+    partition.splits = len(inRange)
+    for user, vars in users.items():
+        for position, var in enumerate(vars):
+            partition.boundary.setdefault(var, (len(partition.sinks), position))
+        partition.sinks.append(il.Insn(il.InsnType.STOP, [il.ConstantTuple(vars)]))
+
+    # Sinks of instructions within the range go where the instruction was
+    ordered = list(copies.values())
+    splits = iter(zip(inRange, partition.sinks))
+    split = next(splits, None)
+    for insn in partition.insns:
+        while split is not None and index[split[0]] < index[insn]:
+            ordered.append(split[1])
+            split = next(splits, None)
+        ordered.append(insn)
+    ordered.extend(partition.sinks[partition.splits:])
+    _relink(partition.program, ordered)
+
+# Returns the instructions a worker returned for a partition, split where the
+# instructions of the main partition within its range go
+def _segments(partition: Partition) -> list[list[il.Insn]]:
+    splits = set(partition.sinks[:partition.splits])
+    sinks = set(partition.sinks)
+    segments: list[list[il.Insn]] = [[]]
+    for insn in partition.program:
+        if insn in splits:
+            segments.append([])
+        elif insn not in sinks:
+            segments[-1].append(insn)
+    return segments
+
+_manager = None
+_partitions: list[tuple[il.Program, list[il.Insn]]] = []
+
+def _initWorker(manager, partitions: list[tuple[il.Program, list[il.Insn]]]):
+    global _manager, _partitions
+    _manager = manager
+    _partitions = partitions
+
+def _runPartition(i: int, maxPasses: int, timed: bool) -> tuple[il.Program, list[il.Insn], int, dict[str, float] | None]:
+    program, sinks = _partitions[i]
+    timings = {} if timed else None
+    n = _manager.run(program, maxPasses=maxPasses, timings=timings)
+    return program, sinks, n, timings
+
+def _addTimings(timings: dict[str, float], other: dict[str, float]):
+    for name, t in other.items():
+        timings[name] = timings.get(name, 0.0) + t
+
+# Runs a transform manager over a program in place, transforming the
+# partitions of the program on a pool of worker processes while the main
+# partition is transformed in this one. Each partition sees the instructions
+# of the main partition that use its variables as opaque uses, and the main
+# partition sees the partitions' variables as opaque values, so transforms
+# across the boundary are not applied. Returns the
+# largest number of rounds any partition ran, timings are summed over all
+# processes. Small programs and programs that do not split are transformed
+# serially. With progress, the passes over the main partition and every
+# finished partition are reported. Cancelling stops the main partition and
+# leaves partitions that have not started untransformed. Workers are forked,
+# so that the partitions are not pickled into each of them: where fork is not
+# available the program is transformed serially, and partitions whose worker
+# failed are transformed in this process.
+def runPartitioned(manager, program: il.Program, maxPasses: int = -1, timings: dict[str, float] | None = None,
+                   workers: int | None = None, partitionSize: int | None = None, progress: Progress | None = None) -> int:
+    workers = workers or os.cpu_count() or 1
+    count = sum(1 for _ in program)
+    if workers < 2 or count < MIN_PARALLEL_SIZE or 'fork' not in multiprocessing.get_all_start_methods():
+        return manager.run(program, maxPasses=maxPasses, timings=timings, progress=progress)
+
+    # The garbage collector would run over and over while the program is
+    # split, and while the results are unpickled
+    collect = gc.isenabled()
+    gc.disable()
+    try:
+        split = partitionProgram(program, partitionSize or max(MIN_PARTITION_SIZE, count // (workers * 4)))
+        if split is None:
+            return manager.run(program, maxPasses=maxPasses, timings=timings, progress=progress)
+        return _transformPartitions(manager, program, *split, maxPasses, timings, workers, progress)
+    finally:
+        if collect:
+            gc.enable()
+
+def _transformPartitions(manager, program: il.Program, mainInsns: set[il.Insn], partitions: list[Partition],
+                         maxPasses: int, timings: dict[str, float] | None, workers: int, progress: Progress | None) -> int:
+    insns = list(program)
+    index = {insn: i for i, insn in enumerate(insns)}
+    for partition in partitions:
+        _buildPartition(program, partition, insns, index)
+    base = program.variableCount
+
+    # The main partition has a marker for every stretch of a partition
+    # between its own instructions
+    markers: dict[il.Insn, tuple[Partition, int]] = {}
+    ordered = []
+    partitionAt = {partition.first: partition for partition in partitions}
+    partition = None
+    for i, insn in enumerate(insns):
+        if i in partitionAt:
+            partition = partitionAt[i]
+            segment = 0
+            marker = il.Insn(il.InsnType.STOP, [il.ConstantValue(None)])
+            markers[marker] = (partition, segment)
+            ordered.append(marker)
+        if insn not in mainInsns:
+            continue
+        ordered.append(insn)
+        if partition is not None and i < partition.last:
+            segment += 1
+            marker = il.Insn(il.InsnType.STOP, [il.ConstantValue(None)])
+            markers[marker] = (partition, segment)
+            ordered.append(marker)
+
+    # The main partition refers to the partitions' variables through
+    # stand-ins that are not defined anywhere
+    standIns: dict[il.VariableInsn, tuple[Partition, il.VariableInsn]] = {}
+    replacements: dict[il.VariableInsn, il.Value] = {}
+    users: set[il.Insn] = set()
+    for partition in partitions:
+        for var in partition.boundary:
+            standIn = il.VariableInsn(il.InsnType.LOCAL, [il.ConstantValue(var.name)], var.name)
+            standIns[standIn] = (partition, var)
+            replacements[var] = standIn
+            users.update(use for use in var.uses if use in mainInsns)
+    for use in users:
+        for var in use.defs:
+            if var in replacements:
+                var.uses.discard(use)
+                replacements[var].uses.add(use)
+        _substitute(use, replacements)
+
+    main = il.Program()
+    main.poison = program.poison
+    main.variableCount = base
+    _relink(main, ordered)
+
+    # Workers are forked with the whole program in memory, which their garbage
+    # collector would otherwise traverse, and copy
+    gc.freeze()
+    try:
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'), initializer=_initWorker,
+                                 initargs=(manager, [(partition.program, partition.sinks) for partition in partitions])) as executor:
+            futures = []
+            try:
+                for i in range(len(partitions)):
+                    futures.append(executor.submit(_runPartition, i, maxPasses, timings is not None))
+            except (BrokenExecutor, OSError):
+                pass
+            rounds = manager.run(main, maxPasses=maxPasses, timings=timings, progress=progress)
+            for i, partition in enumerate(partitions):
+                future = futures[i] if i < len(futures) else None
+                # A partition that never ran keeps its original instructions
+                if progress is not None and progress.cancelled and (future is None or future.cancel()):
+                    continue
+                result = None
+                if future is not None:
+                    try:
+                        result = future.result()
+                    except (BrokenExecutor, OSError):
+                        pass
+                if result is None:
+                    # The pool failed, the partition is transformed here instead
+                    n = manager.run(partition.program, maxPasses=maxPasses, timings=timings)
+                else:
+                    partition.program, partition.sinks, n, workerTimings = result
+                    if timings is not None:
+                        _addTimings(timings, workerTimings)
+                rounds = max(rounds, n)
+                if progress is not None:
+                    progress.report('transform', 'partitions', i + 1, len(partitions))
+    finally:
+        gc.unfreeze()
+
+    # Variables created in the workers are renamed after those created here
+    variableCount = main.variableCount
+    for partition in partitions:
+        for insn in partition.program:
+            if isinstance(insn, il.VariableInsn) and int(insn.name[1:]) >= base:
+                insn.name = f'v{variableCount}'
+                variableCount += 1
+        for sink in partition.sinks:
+            for def_ in sink.defs:
+                def_.uses.discard(sink)
+
+    # Stand-ins are replaced by what the partitions' variables became
+    replacements = {}
+    for standIn, (partition, var) in standIns.items():
+        sink, position = partition.boundary[var]
+        replacements[standIn] = partition.sinks[sink].args[0].values[position]
+    for insn in main:
+        if any(def_ in standIns for def_ in insn.defs):
+            _substitute(insn, replacements)
+            for def_ in insn.defs:
+                def_.uses.add(insn)
+
+    segments = {partition: _segments(partition) for partition in partitions}
+    ordered = []
+    for insn in main:
+        if insn in markers:
+            partition, segment = markers[insn]
+            ordered.extend(segments[partition][segment])
+        else:
+            ordered.append(insn)
+    program.clear()
+    _relink(program, ordered)
+    program.variableCount = variableCount
+    return rounds
@@ -0,0 +1,28 @@
+from .transform import TransformManager
+from .constant_fold import ConstantValuePass, ConstantGlobalPass, ConstantGetItemPass, InlineMutableConstantPass
+from .dead_code import DeadCodePass
+from .known_builtins import GlobalCallPass, InstanceDunderPass, ImportToGlobalPass, GlobalReductionPass, LocalsPass
+from .numpy_arrays import NumpyArrayPass
+from .torch_storage import TorchStoragePass
+from .recognizers import RecognizerPass
+
+DEFAULT_MAX_PASSES = 20
+
+# Creates a transform manager with the standard analysis passes, in the order
+# the decompiler runs them.
+def createDefaultTransformManager() -> TransformManager:
+    transform = TransformManager()
+    transform.add(ConstantValuePass())
+    transform.add(ConstantGlobalPass())
+    transform.add(ConstantGetItemPass())
+    transform.add(InlineMutableConstantPass())
+    transform.add(DeadCodePass())
+    transform.add(GlobalCallPass())
+    transform.add(InstanceDunderPass())
+    transform.add(ImportToGlobalPass())
+    transform.add(GlobalReductionPass())
+    transform.add(LocalsPass())
+    transform.add(NumpyArrayPass())
+    transform.add(TorchStoragePass())
+    transform.add(RecognizerPass())
+    return transform
@@ -0,0 +1,155 @@
+import json
+from importlib import metadata
+
+# Callables that have no side effects of their own: calls to them can be
+# removed when their result is unused, and inlined at their use, as long as
+# their arguments are literals (see analysis.hasSideEffects)
+PURE = 'pure'
+# Callables that only create and return a new object, which are treated like
+# pure ones but always produce a distinct object
+CONSTRUCTOR = 'constructor'
+# Callables that have side effects. Anything not declared is impure, this
+# exists to override a module's default.
+IMPURE = 'impure'
+PURITY_KINDS = set([PURE, CONSTRUCTOR, IMPURE])
+
+# Name within a module summary that applies to every name not listed
+DEFAULT_NAME = '*'
+
+# Group of the entry points that packages can declare summaries for their own
+# modules under. An entry point resolves to a summary dict, or to a callable
+# returning one.
+ENTRY_POINT_GROUP = 'peekle.purity'
+
+# Summaries of common standard library modules, by the Python 3 (module, name)
+# of the global. Names are dotted paths within the module.
+STDLIB_SUMMARIES: dict[str, dict[str, str]] = {
+    'builtins': {
+        '__import__': PURE, 'abs': PURE, 'all': PURE, 'any': PURE, 'ascii': PURE, 'bin': PURE, 'callable': PURE,
+        'chr': PURE, 'copyright': PURE, 'credits': PURE, 'dir': PURE, 'divmod': PURE, 'format': PURE,
+        'getattr': PURE, 'globals': PURE, 'hasattr': PURE, 'hash': PURE, 'help': PURE, 'hex': PURE, 'id': PURE,
+        'isinstance': PURE, 'issubclass': PURE, 'len': PURE, 'license': PURE, 'locals': PURE,
+        'max': PURE, 'min': PURE, 'oct': PURE, 'ord': PURE, 'pow': PURE, 'range': PURE, 'repr': PURE, 'round': PURE,
+        'int.from_bytes': PURE, 'bytes.fromhex': PURE, 'bytearray.fromhex': PURE,
+        # Calls the function it is given once consumed
+        'map': IMPURE,
+        'bool': CONSTRUCTOR, 'bytearray': CONSTRUCTOR, 'bytes': CONSTRUCTOR, 'complex': CONSTRUCTOR,
+        'dict': CONSTRUCTOR, 'dict.fromkeys': CONSTRUCTOR, 'float': CONSTRUCTOR, 'frozenset': CONSTRUCTOR,
+        'int': CONSTRUCTOR, 'list': CONSTRUCTOR, 'object': CONSTRUCTOR, 'object.__new__': CONSTRUCTOR,
+        'set': CONSTRUCTOR, 'slice': CONSTRUCTOR, 'str': CONSTRUCTOR, 'tuple': CONSTRUCTOR,
+    },
+    'functools': {'partial': CONSTRUCTOR},
+    '_functools': {'partial': CONSTRUCTOR},
+    # Anything else in operator mutates its argument or calls into it
+    'operator': {
+        'abs': PURE, 'add': PURE, 'and_': PURE, 'concat': PURE, 'contains': PURE, 'countOf': PURE, 'eq': PURE,
+        'floordiv': PURE, 'ge': PURE, 'getitem': PURE, 'gt': PURE, 'index': PURE, 'indexOf': PURE, 'inv': PURE,
+        'invert': PURE, 'is_': PURE, 'is_not': PURE, 'le': PURE, 'length_hint': PURE, 'lshift': PURE, 'lt': PURE,
+        'matmul': PURE, 'mod': PURE, 'mul': PURE, 'ne': PURE, 'neg': PURE, 'not_': PURE, 'or_': PURE, 'pos': PURE,
+        'pow': PURE, 'rshift': PURE, 'sub': PURE, 'truediv': PURE, 'truth': PURE, 'xor': PURE,
+        '__abs__': PURE, '__add__': PURE, '__and__': PURE, '__concat__': PURE, '__contains__': PURE, '__eq__': PURE,
+        '__floordiv__': PURE, '__ge__': PURE, '__getitem__': PURE, '__gt__': PURE, '__index__': PURE,
+        '__inv__': PURE, '__invert__': PURE, '__le__': PURE, '__lshift__': PURE, '__lt__': PURE,
+        '__matmul__': PURE, '__mod__': PURE, '__mul__': PURE, '__ne__': PURE, '__neg__': PURE, '__not__': PURE,
+        '__or__': PURE, '__pos__': PURE, '__pow__': PURE, '__rshift__': PURE, '__sub__': PURE,
+        '__truediv__': PURE, '__xor__': PURE,
+        'attrgetter': CONSTRUCTOR, 'itemgetter': CONSTRUCTOR, 'methodcaller': CONSTRUCTOR,
+    },
+    'math': {DEFAULT_NAME: PURE},
+    'cmath': {DEFAULT_NAME: PURE},
+    'binascii': {DEFAULT_NAME: PURE},
+    'base64': {DEFAULT_NAME: PURE},
+    'codecs': {'encode': PURE, 'decode': PURE},
+    '_codecs': {'encode': PURE, 'decode': PURE},
+    'struct': {'pack': PURE, 'unpack': PURE, 'calcsize': PURE, 'Struct': CONSTRUCTOR},
+    'zlib': {'compress': PURE, 'decompress': PURE, 'crc32': PURE, 'adler32': PURE},
+    're': {'compile': PURE, '_compile': PURE},
+    'collections': {'OrderedDict': CONSTRUCTOR, 'deque': CONSTRUCTOR, 'defaultdict': CONSTRUCTOR,
+                    'Counter': CONSTRUCTOR, 'ChainMap': CONSTRUCTOR},
+    'datetime': {'date': CONSTRUCTOR, 'datetime': CONSTRUCTOR, 'time': CONSTRUCTOR, 'timedelta': CONSTRUCTOR,
+                 'timezone': CONSTRUCTOR},
+    'decimal': {'Decimal': CONSTRUCTOR},
+    'fractions': {'Fraction': CONSTRUCTOR},
+    'uuid': {'UUID': CONSTRUCTOR},
+    'ipaddress': {'ip_address': CONSTRUCTOR, 'ip_network': CONSTRUCTOR, 'ip_interface': CONSTRUCTOR,
+                  'IPv4Address': CONSTRUCTOR, 'IPv6Address': CONSTRUCTOR, 'IPv4Network': CONSTRUCTOR,
+                  'IPv6Network': CONSTRUCTOR, 'IPv4Interface': CONSTRUCTOR, 'IPv6Interface': CONSTRUCTOR},
+    'pathlib': {'PurePath': CONSTRUCTOR, 'PurePosixPath': CONSTRUCTOR, 'PureWindowsPath': CONSTRUCTOR,
+                'Path': CONSTRUCTOR, 'PosixPath': CONSTRUCTOR, 'WindowsPath': CONSTRUCTOR},
+    'array': {'array': CONSTRUCTOR, '_array_reconstructor': CONSTRUCTOR},
+    'types': {'SimpleNamespace': CONSTRUCTOR, 'MappingProxyType': CONSTRUCTOR},
+}
+
+# Declared purity by module, then by name within the module
+PURITY: dict[str, dict[str, str]] = {}
+
+# Resolved purity by (module, name), cleared whenever a declaration changes
+_cache: dict[tuple[str, str], str | None] = {}
+_entryPointsLoaded = False
+# Incremented whenever a declaration changes, for caches built on lookups
+purityVersion = 0
+
+def declarePurity(module: str, name: str, kind: str):
+    global purityVersion
+    if kind not in PURITY_KINDS:
+        raise ValueError(f'Unknown purity {kind!r} for {module}.{name}, expected one of {", ".join(sorted(PURITY_KINDS))}')
+    PURITY.setdefault(module, {})[name] = kind
+    _cache.clear()
+    purityVersion += 1
+
+# Declares the purity of several names of a module at once, DEFAULT_NAME
+# applies to the rest of the module
+def declareModulePurity(module: str, summary: dict[str, str]):
+    for name, kind in summary.items():
+        declarePurity(module, name, kind)
+
+# Declares summaries for several modules, in the format of STDLIB_SUMMARIES
+def declareSummaries(summaries: dict[str, dict[str, str]]):
+    if not isinstance(summaries, dict) or not all(isinstance(summary, dict) for summary in summaries.values()):
+        raise ValueError('Purity summaries must map module names to {name: kind} objects')
+    for module, summary in summaries.items():
+        declareModulePurity(module, summary)
+
+# Loads summaries from a JSON file, e.g.
+#   {"mylib.models": {"*": "constructor", "loadFromDisk": "impure"}}
+def loadPurityConfig(path: str):
+    with open(path, 'r', encoding='utf-8') as f:
+        try:
+            summaries = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f'Invalid purity config {path}: {e}') from None
+    declareSummaries(summaries)
+
+# Loads the summaries installed packages declare under ENTRY_POINT_GROUP. This
+# happens once, before the first lookup.
+def loadPurityEntryPoints():
+    global _entryPointsLoaded
+    _entryPointsLoaded = True
+    for entryPoint in metadata.entry_points(group=ENTRY_POINT_GROUP):
+        summaries = entryPoint.load()
+        if callable(summaries):
+            summaries = summaries()
+        declareSummaries(summaries)
+
+# Every declared summary as canonical JSON, including those of installed
+# packages, for keying caches of output that depends on them
+def purityFingerprint() -> str:
+    if not _entryPointsLoaded:
+        loadPurityEntryPoints()
+    return json.dumps(PURITY, sort_keys=True, separators=(',', ':'))
+
+# Returns the declared purity of a global by its Python 3 (module, name), or
+# None if it was not declared
+def lookupPurity(module: str, name: str | None) -> str | None:
+    if not _entryPointsLoaded:
+        loadPurityEntryPoints()
+    if name is None:
+        return None
+
+    key = (module, name)
+    if key not in _cache:
+        summary = PURITY.get(module)
+        _cache[key] = None if summary is None else summary.get(name, summary.get(DEFAULT_NAME))
+    return _cache[key]
+
+declareSummaries(STDLIB_SUMMARIES)
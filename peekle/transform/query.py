@@ -0,0 +1,174 @@
+import ast
+from typing import cast
+from .. import il
+from . import analysis
+
+# Instructions that mutate their first argument in place.
+MUTATING_INSNS = set([
+    il.InsnType.SET_ITEM,
+    il.InsnType.SET_ATTR,
+    il.InsnType.EXTEND,
+    il.InsnType.BUILD,
+])
+
+# Parses a query path such as "['state_dict']['encoder.weight']", ".config[0]"
+# or "obj['config'].name" into a list of ('item', key) / ('attr', name) steps.
+# A leading name, if any, stands for the unpickled object and is ignored.
+def parsePath(path: str) -> list[tuple[str, object]]:
+    path = path.strip()
+    if path.startswith('[') or path.startswith('.'):
+        path = 'obj' + path
+    try:
+        node = ast.parse(path, mode='eval').body
+    except SyntaxError as e:
+        raise ValueError(f'Invalid query path: {path}') from e
+
+    steps = []
+    while not isinstance(node, ast.Name):
+        if isinstance(node, ast.Subscript):
+            try:
+                steps.append(('item', ast.literal_eval(node.slice)))
+            except ValueError as e:
+                raise ValueError(f'Query keys must be literals: {ast.unparse(node.slice)}') from e
+        elif isinstance(node, ast.Attribute):
+            steps.append(('attr', node.attr))
+        else:
+            raise ValueError(f'Unsupported query path component: {ast.unparse(node)}')
+        node = node.value
+    steps.reverse()
+    return steps
+
+def _isKey(value: il.Value, key) -> bool:
+    return isinstance(value, il.ConstantValue) and type(value.value) is type(key) and value.value == key
+
+# Resolves query steps against the IL as produced by the disassembler, following
+# containers through their initial contents and later SET_ITEM/EXTEND/BUILD
+# instructions in program order.
+class _Resolver:
+    def __init__(self, program: il.Program):
+        self.order = {insn: i for i, insn in enumerate(program)}
+
+    def _uses(self, value: il.Value, op: il.InsnType) -> list[il.Insn]:
+        if not isinstance(value, il.VariableInsn):
+            return []
+        uses = [use for use in value.uses if use.op == op and use.args[0] is value]
+        return sorted(uses, key=lambda use: self.order[use])
+
+    @staticmethod
+    def _initial(value: il.Value) -> il.Value:
+        if isinstance(value, il.VariableInsn) and value.op == il.InsnType.MUTABLE_CONSTANT:
+            return value.args[0]
+        return value
+
+    def item(self, value: il.Value, key) -> il.Value | None:
+        initial = self._initial(value)
+        if isinstance(initial, (il.ConstantTuple, il.ConstantList)):
+            if not isinstance(key, int):
+                return None
+            values = list(initial.values)
+            for use in self._uses(value, il.InsnType.EXTEND):
+                if not isinstance(use.args[1], il.ConstantList):
+                    return None
+                values.extend(cast(il.ConstantList, use.args[1]).values)
+            try:
+                return values[key]
+            except IndexError:
+                return None
+
+        result = None
+        if isinstance(initial, il.ConstantDict):
+            for k, v in initial.values:
+                if _isKey(k, key):
+                    result = v
+        for use in self._uses(value, il.InsnType.SET_ITEM):
+            if _isKey(use.args[1], key):
+                result = use.args[2]
+        return result
+
+    def attr(self, value: il.Value, name: str) -> il.Value | None:
+        result = None
+        for use in self._uses(value, il.InsnType.BUILD):
+            state = use.args[1]
+            slots = None
+            if isinstance(state, il.ConstantTuple) and len(state.values) == 2:
+                state, slots = state.values
+            # Slot state is applied after the instance dict
+            for candidate in [slots, state]:
+                if candidate is None:
+                    continue
+                found = self.item(candidate, name)
+                if found is not None:
+                    result = found
+                    break
+        for use in self._uses(value, il.InsnType.SET_ATTR):
+            if _isKey(use.args[1], name):
+                result = use.args[2]
+        return result
+
+def isMethodLookup(use: il.Insn, obj: il.VariableInsn) -> bool:
+    if not isinstance(use, il.VariableInsn):
+        return False
+    if use.op == il.InsnType.GET_ATTR:
+        return use.args[0] is obj
+    # Before analysis, attribute lookups are still getattr(obj, name) calls
+    return analysis.maybeGetConstantCallee(use) is getattr and \
+        len(use.args[1].values) == 2 and use.args[1].values[0] is obj
+
+# Collects the instructions a value depends on, including every instruction that
+# mutates one of them and method calls made on them.
+def backwardSlice(value: il.Value) -> set[il.Insn]:
+    needed: set[il.Insn] = set()
+    work: list[il.Insn] = list(value.valueDefs())
+    while work:
+        insn = work.pop()
+        if insn in needed:
+            continue
+        needed.add(insn)
+        work.extend(insn.defs)
+
+        if not isinstance(insn, il.VariableInsn):
+            continue
+        for use in insn.uses:
+            if use.op in MUTATING_INSNS and use.args[0] is insn:
+                work.append(use)
+            elif use.op == il.InsnType.CALL and use.args[0] is insn and insn.op != il.InsnType.GLOBAL:
+                # Calling the value itself, e.g. a bound method of a needed
+                # object. Calls of a class or function only create new objects.
+                work.append(use)
+            elif isMethodLookup(use, insn):
+                # Methods looked up on the value, which are then called on it
+                for call in use.uses:
+                    if call.op == il.InsnType.CALL and call.args[0] is use:
+                        work.append(use)
+                        work.append(call)
+    return needed
+
+# Reduces a freshly disassembled program, in place, to the instructions that
+# contribute to the value at the given path, ending in a STOP on that value.
+def sliceProgram(program: il.Program, path: str | list[tuple[str, object]]) -> il.Program:
+    steps = parsePath(path) if isinstance(path, str) else path
+
+    stop = program.end
+    if stop is None or stop.op != il.InsnType.STOP:
+        raise ValueError('Cannot query a program that does not end in STOP')
+
+    resolver = _Resolver(program)
+    value = stop.args[0]
+    walked = ''
+    for kind, key in steps:
+        walked += f'[{key!r}]' if kind == 'item' else f'.{key}'
+        value = resolver.item(value, key) if kind == 'item' else resolver.attr(value, key)
+        if value is None:
+            raise ValueError(f'Query path {walked} could not be resolved statically')
+
+    needed = backwardSlice(value)
+
+    # The new STOP goes in first, so that the program never becomes empty
+    program.appendInsn(il.InsnType.STOP, value)
+    insn = program.end.prev
+    while insn is not None:
+        prev = insn.prev
+        if insn not in needed:
+            program.removeInsn(insn, skipUseCheck=True)
+        insn = prev
+    return program
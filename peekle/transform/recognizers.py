@@ -0,0 +1,213 @@
+import uuid
+import datetime
+from typing import Callable, cast
+from .transform import TransformPass
+from .. import il
+from . import analysis
+
+# A recognizer rewrites a call to a known global, given the program, the
+# iterator positioned on the call and the call itself. It returns whether it
+# changed the program, and may only remove the call through the iterator.
+Recognizer = Callable[[il.Program, il.Program.Iterator, il.VariableInsn], bool]
+
+# Recognizers by the Python 3 (module, name) of the global they handle
+RECOGNIZERS: dict[tuple[str, str], list[Recognizer]] = {}
+
+def registerRecognizer(module: str, name: str, recognizer: Recognizer):
+    RECOGNIZERS.setdefault((module, name), []).append(recognizer)
+
+# Decorator form of registerRecognizer
+def recognizer(module: str, name: str):
+    def decorator(func: Recognizer) -> Recognizer:
+        registerRecognizer(module, name, func)
+        return func
+    return decorator
+
+def _constant(value: il.Value, *types):
+    if isinstance(value, il.ConstantValue) and type(value.value) in types:
+        return value.value
+    return None
+
+def _callArgs(insn: il.VariableInsn) -> list[il.Value]:
+    return cast(il.ConstantTuple, insn.args[1]).values
+
+# Returns the SET_ITEM/EXTEND instructions that fill a freshly created container,
+# i.e. all its uses of the given op that come before any other use, in program
+# order. Returns None if the container is part of its own contents.
+def _collectMutations(insn: il.VariableInsn, op: il.InsnType) -> list[il.Insn] | None:
+    mutations = []
+    remaining = set(insn.uses)
+    node = insn.next
+    while node is not None and remaining:
+        if node in remaining:
+            if node.op != op or node.args[0] is not insn:
+                break
+            if any(insn in arg.valueDefs() for arg in node.args[1:]):
+                return None
+            mutations.append(node)
+            remaining.remove(node)
+        node = node.next
+    return mutations
+
+# Replaces a container constructor call, and the mutations that fill it, with a
+# single call placed after the last mutation. Any later use of the container
+# refers to the new call.
+def _foldMutations(program: il.Program, it: il.Program.Iterator, insn: il.VariableInsn,
+                   mutations: list[il.Insn], args: list[il.Value]):
+    insn2 = program.createVarInsn(il.InsnType.CALL, insn.args[0], il.ConstantTuple(args))
+    program.insertInsn(insn2, mutations[-1])
+    for mutation in mutations:
+        program.removeInsn(mutation)
+
+    for use in insn.uses:
+        use.replaceVarInsn(insn, insn2)
+    insn2.uses = insn.uses
+    insn.uses = set()
+    it.removeInsn()
+
+# Returns the key/value pairs of a dict that is only filled and then consumed
+# once, along with the instructions that build it, or None.
+def _dictContents(value: il.Value) -> tuple[list[tuple[il.Value, il.Value]], list[il.Insn]] | None:
+    if isinstance(value, il.ConstantDict):
+        return list(value.values), []
+    if not isinstance(value, il.VariableInsn) or value.op != il.InsnType.MUTABLE_CONSTANT or \
+        not isinstance(value.args[0], il.ConstantDict):
+        return None
+
+    mutations = _collectMutations(value, il.InsnType.SET_ITEM)
+    if mutations is None or len(value.uses) != len(mutations) + 1:
+        return None
+    items = list(cast(il.ConstantDict, value.args[0]).values)
+    items.extend((mutation.args[1], mutation.args[2]) for mutation in mutations)
+    return items, mutations + [value]
+
+# Protocol 0-2 pickles encode bytes as _codecs.encode(text, 'latin1')
+@recognizer('_codecs', 'encode')
+def _recognizeEncode(program: il.Program, it: il.Program.Iterator, insn: il.VariableInsn) -> bool:
+    args = _callArgs(insn)
+    if len(args) != 2 or _constant(args[0], str) is None or _constant(args[1], str) not in ('latin1', 'latin-1'):
+        return False
+    it.replaceInsn(il.ConstantValue(args[0].value.encode('latin-1')))
+    return True
+
+@recognizer('collections', 'OrderedDict')
+def _recognizeOrderedDict(program: il.Program, it: il.Program.Iterator, insn: il.VariableInsn) -> bool:
+    if _callArgs(insn):
+        return False
+    mutations = _collectMutations(insn, il.InsnType.SET_ITEM)
+    if not mutations:
+        return False
+    items = il.ConstantList([il.ConstantTuple([mutation.args[1], mutation.args[2]]) for mutation in mutations])
+    _foldMutations(program, it, insn, mutations, [items])
+    return True
+
+@recognizer('collections', 'deque')
+def _recognizeDeque(program: il.Program, it: il.Program.Iterator, insn: il.VariableInsn) -> bool:
+    args = _callArgs(insn)
+    if not args or not isinstance(args[0], (il.ConstantTuple, il.ConstantList)):
+        return False
+    mutations = _collectMutations(insn, il.InsnType.EXTEND)
+    if not mutations or not all(isinstance(mutation.args[1], il.ConstantList) for mutation in mutations):
+        return False
+    values = list(args[0].values)
+    for mutation in mutations:
+        values.extend(cast(il.ConstantList, mutation.args[1]).values)
+    _foldMutations(program, it, insn, mutations, [il.ConstantList(values)] + args[1:])
+    return True
+
+# datetime, date and time pickle their fields as packed bytes
+DATETIME_FIELDS = {
+    'datetime': ['year', 'month', 'day', 'hour', 'minute', 'second', 'microsecond'],
+    'date': ['year', 'month', 'day'],
+    'time': ['hour', 'minute', 'second', 'microsecond'],
+}
+
+def _recognizeDatetime(program: il.Program, it: il.Program.Iterator, insn: il.VariableInsn) -> bool:
+    args = _callArgs(insn)
+    data = _constant(args[0], bytes) if args else None
+    if data is None or len(args) > 2:
+        return False
+
+    cls = getattr(datetime, insn.args[0].name)
+    try:
+        obj = cls(data)
+    except (TypeError, ValueError):
+        return False
+    if getattr(obj, 'fold', 0):
+        return False
+
+    fields = [il.ConstantValue(getattr(obj, field)) for field in DATETIME_FIELDS[insn.args[0].name]]
+    insn2 = program.createVarInsn(il.InsnType.CALL, il.ConstantGlobal('datetime', insn.args[0].name),
+                                  il.ConstantTuple(fields + args[1:]))
+    it.replaceInsn(insn2)
+    return True
+registerRecognizer('datetime', 'datetime', _recognizeDatetime)
+registerRecognizer('datetime', 'date', _recognizeDatetime)
+registerRecognizer('datetime', 'time', _recognizeDatetime)
+
+# UUIDs are created without calling __init__, by copyreg.__newobj__(uuid.UUID)
+# (NEWOBJ) or object.__new__(uuid.UUID), and get their value from BUILD {'int': n}
+def _recognizeUUID(program: il.Program, it: il.Program.Iterator, insn: il.VariableInsn) -> bool:
+    args = _callArgs(insn)
+    if len(args) != 1 or not isinstance(args[0], il.ConstantGlobal) or \
+        analysis.normalizeGlobal(args[0].module, args[0].name) != ('uuid', 'UUID'):
+        return False
+    builds = [use for use in insn.uses if use.op == il.InsnType.BUILD and use.args[0] is insn]
+    if len(builds) != 1:
+        return False
+
+    contents = _dictContents(builds[0].args[1])
+    if contents is None:
+        return False
+    items, stateInsns = contents
+    if len(items) != 1 or _constant(items[0][0], str) != 'int' or _constant(items[0][1], int) is None:
+        return False
+
+    program.removeInsn(builds[0])
+    for stateInsn in stateInsns:
+        program.removeInsn(stateInsn, skipUseCheck=True)
+    value = str(uuid.UUID(int=items[0][1].value))
+    insn2 = program.createVarInsn(il.InsnType.CALL, il.ConstantGlobal('uuid', 'UUID'), il.ConstantTuple([il.ConstantValue(value)]))
+    it.replaceInsn(insn2)
+    return True
+registerRecognizer('copyreg', '__newobj__', _recognizeUUID)
+registerRecognizer('builtins', 'object.__new__', _recognizeUUID)
+
+# copyreg._reconstructor(cls, object, None) is how protocols 0 and 1 create
+# instances without calling __init__
+@recognizer('copyreg', '_reconstructor')
+def _recognizeReconstructor(program: il.Program, it: il.Program.Iterator, insn: il.VariableInsn) -> bool:
+    args = _callArgs(insn)
+    if len(args) != 3 or not isinstance(args[1], il.ConstantGlobal) or \
+        analysis.normalizeGlobal(args[1].module, args[1].name) != ('builtins', 'object') or \
+        not isinstance(args[2], il.ConstantValue) or args[2].value is not None:
+        return False
+
+    insn2 = program.createVarInsn(il.InsnType.CALL, il.ConstantGlobal('builtins', 'object.__new__'), il.ConstantTuple([args[0]]))
+    it.replaceInsn(insn2)
+    return True
+
+# Rewrites calls to known globals with the registered recognizers. Python 2
+# names of called globals are replaced with their Python 3 names first.
+class RecognizerPass(TransformPass):
+    def __init__(self):
+        super().__init__('Reduce Pattern Recognition')
+
+    def run(self, program: il.Program) -> bool:
+        modified = False
+        it = program.iterOps(il.InsnType.CALL)
+        for insn in it:
+            if not analysis.isConstantCall(insn) or not isinstance(insn, il.VariableInsn):
+                continue
+
+            callee = cast(il.ConstantGlobal, insn.args[0])
+            key = analysis.normalizeGlobal(callee.module, callee.name)
+            if key != (callee.module, callee.name):
+                insn.args[0] = il.ConstantGlobal(*key)
+                modified = True
+
+            for recognize in RECOGNIZERS.get(key, []):
+                if recognize(program, it, insn):
+                    modified = True
+                    break
+        return modified
@@ -0,0 +1,83 @@
+from typing import cast
+from .transform import TransformPass
+from .. import il
+
+# Legacy storage classes that torch.save records in persistent ids, by the
+# name of the dtype they hold
+STORAGE_DTYPES = {
+    'DoubleStorage': 'float64',
+    'FloatStorage': 'float32',
+    'HalfStorage': 'float16',
+    'BFloat16Storage': 'bfloat16',
+    'LongStorage': 'int64',
+    'IntStorage': 'int32',
+    'ShortStorage': 'int16',
+    'CharStorage': 'int8',
+    'ByteStorage': 'uint8',
+    'BoolStorage': 'bool',
+    'ComplexDoubleStorage': 'complex128',
+    'ComplexFloatStorage': 'complex64',
+    'QInt8Storage': 'qint8',
+    'QUInt8Storage': 'quint8',
+    'QInt32Storage': 'qint32',
+    'QUInt4x2Storage': 'quint4x2',
+    'QUInt2x4Storage': 'quint2x4',
+    'UntypedStorage': 'uint8',
+}
+
+def _isConstant(value: il.Value, *types) -> bool:
+    return isinstance(value, il.ConstantValue) and type(value.value) in types
+
+# Replaces the instruction under the iterator with an earlier storage handle.
+def _shareStorage(it: il.Program.Iterator, insn: il.VariableInsn, storage: il.VariableInsn):
+    for use in insn.uses:
+        use.replaceVarInsn(insn, storage)
+    storage.uses.update(insn.uses)
+    insn.uses = set()
+    it.removeInsn()
+
+# Replaces the persistent ids torch.save writes for tensor storages,
+# ('storage', torch.FloatStorage, key, location, numel), with STORAGE handles
+# that record the entry holding the data (relative to the directory of
+# data.pkl in the checkpoint), its dtype and number of elements. The device
+# location is dropped, storages are always loaded on the CPU. The unpickler
+# loads each storage once, so repeated references share the first handle.
+class TorchStoragePass(TransformPass):
+    def __init__(self):
+        super().__init__('Torch Storage Recognition')
+
+    def run(self, program: il.Program) -> bool:
+        modified = False
+        seen: dict[tuple, il.VariableInsn] = {}
+        it = program.iterOps(il.InsnType.STORAGE, il.InsnType.PERSISTENT_LOAD)
+        for insn in it:
+            if insn.op == il.InsnType.STORAGE and isinstance(insn, il.VariableInsn):
+                entry, dtype = cast(il.ConstantValue, insn.args[0]).value, cast(il.ConstantGlobal, insn.args[1]).name
+                if (entry, dtype) in seen:
+                    _shareStorage(it, insn, seen[(entry, dtype)])
+                    modified = True
+                else:
+                    seen[(entry, dtype)] = insn
+                continue
+            if insn.op != il.InsnType.PERSISTENT_LOAD or not isinstance(insn.args[0], il.ConstantTuple):
+                continue
+
+            pid = cast(il.ConstantTuple, insn.args[0]).values
+            if len(pid) != 5 or not _isConstant(pid[0], str) or pid[0].value != 'storage' or \
+                not _isConstant(pid[2], str) or not _isConstant(pid[4], int):
+                continue
+
+            storageType = pid[1]
+            if not isinstance(storageType, il.ConstantGlobal) or storageType.module != 'torch' or \
+                storageType.name not in STORAGE_DTYPES:
+                continue
+
+            entry, dtype = f'data/{pid[2].value}', STORAGE_DTYPES[storageType.name]
+            if (entry, dtype) in seen:
+                _shareStorage(it, insn, seen[(entry, dtype)])
+            else:
+                insn2 = program.createVarInsn(il.InsnType.STORAGE, il.ConstantValue(entry), il.ConstantGlobal('torch', dtype), pid[4])
+                it.replaceInsn(insn2)
+                seen[(entry, dtype)] = insn2
+            modified = True
+        return modified
@@ -1,4 +1,7 @@
+import time
 from .. import il
+from ..progress import Progress
+from .parallel import runPartitioned
 
 class TransformPass:
     def __init__(self, name):
@@ -17,13 +20,33 @@ class TransformManager:
     def add(self, pass_: TransformPass):
         self.passes.append(pass_)
 
-    def run(self, program: il.Program, maxPasses: int = -1) -> int:
+    # If timings is given, the time spent in each pass is accumulated into it,
+    # keyed by pass name. With more than one worker, independent parts of the
+    # program are transformed on a process pool, see runPartitioned. With
+    # progress, every pass is reported, and cancelling stops before the next
+    # one, leaving the program partially analyzed.
+    def run(self, program: il.Program, maxPasses: int = -1, timings: dict[str, float] | None = None,
+            workers: int | None = None, progress: Progress | None = None) -> int:
+        if workers is not None and workers > 1:
+            return runPartitioned(self, program, maxPasses=maxPasses, timings=timings, workers=workers, progress=progress)
+
         modified = True
         n = 0
+        passesRun = 0
         while modified:
             modified = False
             for pass_ in self.passes:
-                modified |= pass_.run(program)
+                if progress is not None and progress.cancelled:
+                    return n
+                if timings is None:
+                    modified |= pass_.run(program)
+                else:
+                    start = time.perf_counter()
+                    modified |= pass_.run(program)
+                    timings[pass_.name] = timings.get(pass_.name, 0.0) + time.perf_counter() - start
+                if progress is not None:
+                    passesRun += 1
+                    progress.report('transform', 'passes', passesRun, None, f'round {n + 1}: {pass_.name}')
 
             n += 1
             if maxPasses != -1 and n >= maxPasses:
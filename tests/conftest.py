@@ -0,0 +1,36 @@
+import io
+import sys
+import types
+import pickle
+import zipfile
+import pytest
+
+# A torch.save-style checkpoint holding one float storage, pickled with a
+# stand-in for torch.FloatStorage
+def writeArchive(path: str):
+    torch = types.ModuleType('torch')
+    class FloatStorage:
+        pass
+    FloatStorage.__module__ = 'torch'
+    FloatStorage.__qualname__ = 'FloatStorage'
+    torch.FloatStorage = FloatStorage
+    sys.modules['torch'] = torch
+
+    storage = object()
+    class Pickler(pickle.Pickler):
+        def persistent_id(self, obj):
+            return ('storage', FloatStorage, '0', 'cpu', 4) if obj is storage else None
+    f = io.BytesIO()
+    try:
+        Pickler(f, 2).dump({'weight': storage})
+    finally:
+        del sys.modules['torch']
+    with zipfile.ZipFile(path, 'w') as z:
+        z.writestr('model/data.pkl', f.getvalue())
+        z.writestr('model/data/0', bytes(range(16)))
+
+@pytest.fixture
+def torchArchive(tmp_path) -> str:
+    path = str(tmp_path / 'model.pt')
+    writeArchive(path)
+    return path
@@ -0,0 +1,45 @@
+import os
+import sys
+import types
+import zipfile
+import subprocess
+import pytest
+import peekle
+
+CLI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cli.py')
+
+def test_archive_without_pickle(tmp_path):
+    path = str(tmp_path / 'other.zip')
+    with zipfile.ZipFile(path, 'w') as z:
+        z.writestr('readme.txt', 'not a checkpoint')
+    with pytest.raises(ValueError):
+        peekle.TorchArchive(path)
+    result = subprocess.run([sys.executable, CLI, path, str(tmp_path / 'out.py')], capture_output=True, text=True)
+    assert result.returncode == 2
+    assert 'does not contain a data.pkl' in result.stderr
+    assert 'Traceback' not in result.stderr
+
+# Enough of torch for the generated loadStorage, storages are the bytes they map
+def fakeTorch() -> types.ModuleType:
+    torch = types.ModuleType('torch')
+    torch.uint8 = types.SimpleNamespace(itemsize=1)
+    torch.float32 = types.SimpleNamespace(itemsize=4)
+    torch.frombuffer = lambda data, dtype, count, offset: types.SimpleNamespace(
+        untyped_storage=lambda: bytes(data[offset:offset + count]))
+    torch.storage = types.SimpleNamespace(TypedStorage=lambda wrap_storage, dtype, _internal: wrap_storage)
+    return torch
+
+def test_generated_storages_share_a_closable_map(torchArchive, monkeypatch):
+    monkeypatch.setitem(sys.modules, 'torch', fakeTorch())
+    with peekle.TorchArchive(torchArchive) as archive:
+        program = peekle.disassemble(archive)
+        peekle.analyze(program)
+        source = peekle.codegen.CodeGenerator(archive=archive).generateBinding(program)
+    assert '_opened' not in source
+    namespace = {}
+    exec(source, namespace)
+    assert namespace['value'] == {'weight': bytes(range(16))}
+    [(_, z)] = namespace['openedStorages'].values()
+    namespace['closeStorages']()
+    assert z.fp is None
+    assert namespace['openedStorages'] == {}
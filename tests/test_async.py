@@ -0,0 +1,75 @@
+import io
+import pickle
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import pytest
+import peekle
+
+VALUE = {'a': [1, 2.5, 'x'], 'b': (None, True, b'raw')}
+
+# Async stream handing out the pickle in small pieces
+class ChunkedStream:
+    def __init__(self, data: bytes, chunkSize: int = 7):
+        self.data = io.BytesIO(data)
+        self.chunkSize = chunkSize
+
+    async def read(self, n: int = -1) -> bytes:
+        await asyncio.sleep(0)
+        return self.data.read(min(n, self.chunkSize) if n >= 0 else self.chunkSize)
+
+# Async stream that never returns any data
+class StalledStream:
+    async def read(self, n: int = -1) -> bytes:
+        await asyncio.Event().wait()
+
+def test_decompile_async_matches_decompile():
+    data = pickle.dumps(VALUE, 4)
+    with ThreadPoolExecutor(1) as executor:
+        assert asyncio.run(peekle.decompileAsync(data, executor)) == peekle.decompile(data)
+        assert asyncio.run(peekle.decompileAsync(ChunkedStream(data), executor)) == peekle.decompile(data)
+
+def test_process_executor():
+    data = pickle.dumps(VALUE, 4)
+    with ProcessPoolExecutor(1) as executor:
+        program = asyncio.run(peekle.disassembleAsync(ChunkedStream(data), executor))
+        assert str(program) == str(peekle.disassemble(data))
+        assert asyncio.run(peekle.decompileAsync(io.BytesIO(data), executor)) == peekle.decompile(data)
+
+def test_archive_storages_are_mapped_from_the_archive(torchArchive):
+    path = torchArchive
+    with peekle.TorchArchive(path) as archive:
+        expected = peekle.decompile(archive)
+        assert f'loadStorage({path!r}, {"model/data/0"!r}' in expected
+        assert asyncio.run(peekle.decompileAsync(archive)) == expected
+        with ProcessPoolExecutor(1) as executor:
+            assert asyncio.run(peekle.decompileAsync(archive, executor)) == expected
+
+def test_cancelling_releases_the_bridge_thread():
+    executor = ThreadPoolExecutor(1)
+
+    async def main():
+        task = asyncio.create_task(peekle.decompileAsync(StalledStream(), executor))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    done = threading.Event()
+    executor.submit(done.set)
+    assert done.wait(5)
+    executor.shutdown()
+
+def test_stopped_loop_releases_the_bridge_thread():
+    executor = ThreadPoolExecutor(1)
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(peekle.disassembleAsync(StalledStream(), executor))
+    loop.run_until_complete(asyncio.sleep(0.2))
+    # The loop is no longer running, the blocked read gives up
+    done = threading.Event()
+    executor.submit(done.set)
+    assert done.wait(5)
+    executor.shutdown()
+    loop.run_until_complete(asyncio.gather(task, return_exceptions=True))
+    loop.close()
@@ -0,0 +1,59 @@
+import os
+import pickle
+from peekle import batch
+
+def writePickle(path, value, protocol=4):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        pickle.dump(value, f, protocol)
+
+def test_output_paths_keep_layout_and_resolve_collisions(tmp_path):
+    inputs = [
+        ('in/a.pkl', 'a.pkl'),
+        ('in/a.pickle', 'a.pickle'),
+        ('in/sub/b.pkl', 'sub/b.pkl'),
+        ('other/sub/b.pkl', 'sub/b.pkl'),
+    ]
+    out = str(tmp_path)
+    assert batch.outputPaths(inputs, out, '.py') == [
+        os.path.join(out, 'a.pkl.py'),
+        os.path.join(out, 'a.pickle.py'),
+        os.path.join(out, 'sub/b.pkl.py'),
+        os.path.join(out, 'sub/b.pkl.1.py'),
+    ]
+
+def test_collect_inputs_walks_directories_and_globs(tmp_path):
+    writePickle(str(tmp_path / 'in' / 'a.pkl'), 1)
+    writePickle(str(tmp_path / 'in' / 'sub' / 'b.pkl'), 2)
+    inputs = batch.collectInputs([str(tmp_path / 'in'), str(tmp_path / 'in' / '**' / '*.pkl')])
+    assert [rel for _, rel in inputs] == ['a.pkl', os.path.join('sub', 'b.pkl')]
+
+def test_batch_summary(tmp_path):
+    writePickle(str(tmp_path / 'in' / 'ok.pkl'), {'a': [1, 2]})
+    (tmp_path / 'in' / 'sub').mkdir()
+    (tmp_path / 'in' / 'sub' / 'poisoned.pkl').write_bytes(pickle.dumps({'a': [1, 2]}, 4)[:-4])
+    writePickle(str(tmp_path / 'in' / 'unwritable.pkl'), 1)
+    (tmp_path / 'out' / 'unwritable.py').mkdir(parents=True)
+    summary = batch.runBatch([str(tmp_path / 'in')], str(tmp_path / 'out'), workers=2)
+    assert (summary['total'], summary['ok'], summary['poisoned'], summary['error']) == (3, 1, 1, 1)
+    statuses = {os.path.basename(result['input']): result['status'] for result in summary['files']}
+    assert statuses == {'ok.pkl': 'ok', 'poisoned.pkl': 'poisoned', 'unwritable.pkl': 'error'}
+    assert (tmp_path / 'out' / 'ok.py').is_file()
+    assert (tmp_path / 'out' / 'sub' / 'poisoned.py').is_file()
+
+def test_batch_survives_dying_worker(tmp_path, monkeypatch):
+    run = batch.BatchWorker.run
+    def crashingRun(self, inputPath, outputPath):
+        if 'crash' in inputPath:
+            os._exit(1)
+        return run(self, inputPath, outputPath)
+    # The pool forks, so the workers see the patched method
+    monkeypatch.setattr(batch.BatchWorker, 'run', crashingRun)
+    for i in range(6):
+        writePickle(str(tmp_path / 'in' / f'{i}.pkl'), [i])
+    writePickle(str(tmp_path / 'in' / 'crash.pkl'), [])
+    summary = batch.runBatch([str(tmp_path / 'in')], str(tmp_path / 'out'), workers=2, chunkSize=2)
+    assert (summary['total'], summary['ok'], summary['error']) == (7, 6, 1)
+    [failed] = [result for result in summary['files'] if result['status'] == 'error']
+    assert failed['input'].endswith('crash.pkl')
+    assert 'BrokenProcessPool' in failed['error']
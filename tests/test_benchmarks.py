@@ -0,0 +1,30 @@
+import pickle
+from benchmarks.corpus import PROTOCOLS, generateCorpus
+from benchmarks.run import benchmarkPickle
+from benchmarks.compare import findRegressions
+
+def test_corpus_covers_every_case_and_protocol():
+    cases = ['deep_nesting', 'many_globals', 'reduce_heavy']
+    corpus = dict(generateCorpus(1, cases))
+    assert sorted(corpus) == sorted(f'{case}.p{protocol}' for case in cases for protocol in PROTOCOLS)
+    for data in corpus.values():
+        pickle.loads(data)
+
+def test_benchmark_pickle():
+    [(_, data)] = generateCorpus(1, ['memo_heavy'], [4])
+    result = benchmarkPickle(data, 1)
+    assert set(result['timings']) == {'pickle.loads', 'pickletools.dis', 'disassemble', 'transform', 'codegen'}
+    assert result['passes']
+    assert not result['poisoned']
+    assert result['size'] == len(data)
+
+def run(timings: dict, passes: dict | None = None) -> dict:
+    return {'results': {'case.p4': {'timings': timings, 'passes': passes or {}}}}
+
+def test_find_regressions():
+    baseline = run({'disassemble': 1.0, 'codegen': 1.0, 'transform': 0.0001}, {'Dead Code Elimination': 1.0})
+    current = run({'disassemble': 1.05, 'codegen': 1.5, 'transform': 0.001, 'new': 1.0}, {'Dead Code Elimination': 2.0})
+    regressions = findRegressions(baseline, current, 0.1, {}, minTime=0.01)
+    assert [(stage, ratio) for _, stage, _, _, ratio in regressions] == [('codegen', 1.5), ('pass:Dead Code Elimination', 2.0)]
+    regressions = findRegressions(baseline, current, 0.1, {'codegen': 1.0, 'pass:Dead Code Elimination': 1.5})
+    assert [stage for _, stage, _, _, _ in regressions] == ['transform']
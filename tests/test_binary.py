@@ -0,0 +1,71 @@
+import io
+import pickle
+import random
+import collections
+import pytest
+import peekle
+from peekle.il import binary
+
+VALUE = {
+    'scalars': [1, -2, 2 ** 70, 2.5, -0.0, complex(1, 2), None, True, False],
+    'text': ['x', 'é中', '\udc80', b'raw', bytearray(b'mutable')],
+    'containers': ((1, 2), {3, 4}, frozenset([5]), collections.OrderedDict(k=(1, 2))),
+}
+
+def saved(program) -> bytes:
+    f = io.BytesIO()
+    program.save(f)
+    return f.getvalue()
+
+def load(data: bytes):
+    return peekle.il.Program.load(io.BytesIO(data))
+
+@pytest.mark.parametrize('analysis', [False, True])
+def test_round_trip(analysis):
+    program = peekle.disassemble(pickle.dumps(VALUE, 4))
+    if analysis:
+        peekle.analyze(program)
+    loaded = load(saved(program))
+    assert str(loaded) == str(program)
+    assert loaded.variableCount == program.variableCount
+    assert peekle.codegen.CodeGenerator().generateSource(loaded) == peekle.codegen.CodeGenerator().generateSource(program)
+
+def test_round_trip_keeps_poison():
+    program = peekle.disassemble(pickle.dumps(VALUE, 4)[:-10])
+    assert program.poison
+    loaded = load(saved(program))
+    assert loaded.poison
+    assert str(loaded) == str(program)
+
+def test_shared_constants_stay_shared():
+    shared = (1, 2)
+    program = peekle.disassemble(pickle.dumps([shared, shared], 4))
+    peekle.analyze(program)
+    [extend] = [insn for insn in load(saved(program)) if insn.op == peekle.il.InsnType.EXTEND]
+    first, second = extend.args[1].values
+    assert first is second
+
+def corrupted(data: bytes, old: bytes, new: bytes) -> bytes:
+    assert data.count(old) == 1
+    return data.replace(old, new)
+
+def test_corrupt_programs_raise_value_error():
+    data = saved(peekle.disassemble(pickle.dumps({'name': 'value'}, 4)))
+    with pytest.raises(ValueError, match='Corrupt IL program'):
+        load(corrupted(data, b'\x05value', b'\x05\xff\xfe\xfd\xfc\xfb'))
+    with pytest.raises(ValueError, match='Truncated IL program'):
+        load(data[:-3])
+    with pytest.raises(ValueError, match='Not a saved IL program'):
+        load(b'PKLI' + data[4:])
+
+def test_random_corruption_raises_value_error():
+    data = saved(peekle.disassemble(pickle.dumps(VALUE, 4)))
+    rnd = random.Random(0)
+    for _ in range(2000):
+        damaged = bytearray(data)
+        for _ in range(rnd.randint(1, 3)):
+            damaged[rnd.randrange(len(binary.IL_MAGIC) + 1, len(damaged))] = rnd.randrange(256)
+        try:
+            load(bytes(damaged))
+        except ValueError:
+            pass
@@ -0,0 +1,58 @@
+import sys
+import json
+import argparse
+import pickle
+import collections
+import pytest
+import peekle
+import cli
+
+VALUE = {'a': [1, 2.5, 'x'], 'b': collections.OrderedDict(k=(1, 2))}
+
+def runCli(monkeypatch, *args):
+    monkeypatch.setattr(sys, 'argv', ['cli.py', *args])
+    cli.main()
+
+def test_outputs_from_a_single_disassembly(tmp_path, monkeypatch, capsys):
+    data = pickle.dumps(VALUE, 4)
+    (tmp_path / 'in.pkl').write_bytes(data)
+    disassemble = peekle.dis.Disassembler.disassemble
+    calls = []
+    def countingDisassemble(self):
+        calls.append(self)
+        return disassemble(self)
+    monkeypatch.setattr(peekle.dis.Disassembler, 'disassemble', countingDisassemble)
+
+    out = {kind: str(tmp_path / f'out.{kind}') for kind in ['raw-il', 'il', 'il-bin', 'stats', 'cost', 'pickle']}
+    runCli(monkeypatch, str(tmp_path / 'in.pkl'), str(tmp_path / 'out.py'),
+           *[f'--emit={kind}={path}' for kind, path in out.items()])
+    assert len(calls) == 1
+    assert 'wrote 7 outputs' in capsys.readouterr().out
+
+    raw = peekle.disassemble(data)
+    analyzed = peekle.disassemble(data)
+    peekle.analyze(analyzed)
+    assert (tmp_path / 'out.py').read_text() == peekle.decompile(data)
+    assert open(out['raw-il']).read().strip() == str(raw).strip()
+    assert open(out['il']).read().strip() == str(analyzed).strip()
+    with open(out['il-bin'], 'rb') as f:
+        assert str(peekle.il.Program.load(f)) == str(analyzed)
+    with open(out['stats']) as f:
+        assert json.load(f)['totalBytes'] == len(data)
+    with open(out['cost']) as f:
+        assert json.load(f)
+    with open(out['pickle'], 'rb') as f:
+        assert pickle.load(f) == VALUE
+
+def test_emit_argument():
+    assert cli.parseEmit('il=out.il') == ('il', 'out.il')
+    assert cli.parseEmit('source=a=b.py') == ('source', 'a=b.py')
+    for value in ['il', 'il=', 'bogus=out']:
+        with pytest.raises(argparse.ArgumentTypeError):
+            cli.parseEmit(value)
+
+def test_emit_without_output(tmp_path, monkeypatch):
+    data = pickle.dumps(VALUE, 4)
+    (tmp_path / 'in.pkl').write_bytes(data)
+    runCli(monkeypatch, str(tmp_path / 'in.pkl'), '--emit', f'source={tmp_path / "a.py"}', '--emit', f'source={tmp_path / "b.py"}')
+    assert (tmp_path / 'a.py').read_text() == (tmp_path / 'b.py').read_text() == peekle.decompile(data)
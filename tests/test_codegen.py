@@ -0,0 +1,10 @@
+import pickle
+import peekle
+
+def test_compiled_code_with_bytearray(capsys):
+    data = pickle.dumps([bytearray(b'abc')], 5)
+    program = peekle.disassemble(data)
+    peekle.analyze(program)
+    exec(peekle.codegen.CodeGenerator().generateCode(program), {})
+    assert capsys.readouterr().out.strip() == "[bytearray(b'abc')]"
+    assert "bytearray(b'abc')" in peekle.decompile(data)
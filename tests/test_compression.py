@@ -0,0 +1,45 @@
+import io
+import bz2
+import gzip
+import lzma
+import pickle
+import pytest
+import peekle
+from peekle import compression
+
+VALUE = {'a': [1, 2.5, 'x'] * 50, 'b': (None, True, b'raw')}
+
+COMPRESSORS = {
+    'gzip': gzip.compress,
+    'bz2': bz2.compress,
+    'xz': lzma.compress,
+    'lzma': lambda data: lzma.compress(data, format=lzma.FORMAT_ALONE),
+}
+
+# File object that cannot seek, like a pipe
+class Pipe(io.RawIOBase):
+    def __init__(self, data: bytes):
+        self.data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b) -> int:
+        return self.data.readinto(b)
+
+@pytest.mark.parametrize('name', list(COMPRESSORS))
+def test_compressed_input_is_detected(name):
+    data = pickle.dumps(VALUE, 4)
+    compressed = COMPRESSORS[name](data)
+    assert compression.detectCompression(compressed[:compression.MAGIC_SIZE]) == name
+    expected = str(peekle.disassemble(data))
+    assert str(peekle.disassemble(compressed)) == expected
+    assert str(peekle.disassemble(io.BytesIO(compressed))) == expected
+    assert str(peekle.disassemble(Pipe(compressed))) == expected
+
+@pytest.mark.parametrize('protocol', range(pickle.HIGHEST_PROTOCOL + 1))
+def test_pickles_are_not_detected_as_compressed(protocol):
+    for value in [VALUE, [], [0], 0, 65536, 'x', (), {}, None]:
+        data = pickle.dumps(value, protocol)
+        assert compression.detectCompression(data[:compression.MAGIC_SIZE]) is None
+        assert compression.detectCompression(data[:compression.MAGIC_SIZE] + bytes(16)) is None
@@ -0,0 +1,45 @@
+import math
+import pickle
+import peekle
+from peekle.codegen import ConstantPool
+
+LONG = 'a long repeated string value' * 2
+
+def evaluate(program) -> object:
+    namespace = {}
+    exec(peekle.codegen.CodeGenerator(poolConstants=True).generateBinding(program), namespace)
+    return namespace['value']
+
+def analyzed(value, protocol: int = 4):
+    program = peekle.disassemble(pickle.dumps(value, protocol))
+    peekle.analyze(program)
+    return program
+
+def test_repeated_constants_are_bound_once():
+    value = [{'k': LONG, 't': (LONG, 1.5, 'short')} for _ in range(5)]
+    source = peekle.decompile(pickle.dumps(value, 0), poolConstants=True)
+    assert source.count(repr(LONG)) == 1
+    assert source.count("1.5, 'short')") == 1
+    # Constants are defined before the tuples that contain them
+    assert source.index(repr(LONG)) < source.index("1.5, 'short')")
+    assert evaluate(analyzed(value, 0)) == value
+
+def test_small_or_rare_constants_are_not_pooled():
+    pool = ConstantPool()
+    pool.build(analyzed([LONG, 'x', 'x', 'x', 1, 1, 1]))
+    assert [value.value for _, value in pool.definitions()] == []
+
+def test_floats_are_kept_apart():
+    value = [-0.0, 0.0, 123456789.125, 123456789.125, 123456789.125] * 20
+    result = evaluate(analyzed(value))
+    assert result == value
+    assert [math.copysign(1, v) for v in result] == [math.copysign(1, v) for v in value]
+
+def test_threshold():
+    program = analyzed([LONG, LONG])
+    pool = ConstantPool(threshold=1 << 20)
+    pool.build(program)
+    assert pool.definitions() == []
+    pool = ConstantPool(threshold=1)
+    pool.build(program)
+    assert [value.value for _, value in pool.definitions()] == [LONG]
@@ -0,0 +1,31 @@
+import pickle
+import collections
+import peekle
+
+def test_dict_order_is_ignored():
+    old = pickle.dumps({'a': 1, 'b': 2}, 4)
+    new = pickle.dumps({'b': 2, 'a': 1}, 4)
+    assert not peekle.diffPickles(old, new).changes
+
+def test_ordered_dict_order_is_compared():
+    old = pickle.dumps(collections.OrderedDict([('a', 1), ('b', 2)]), 4)
+    new = pickle.dumps(collections.OrderedDict([('b', 2), ('a', 1)]), 4)
+    assert peekle.diffPickles(old, new, snippets=False).changes
+
+def test_changed_entry():
+    old = pickle.dumps({'config': {'lr': 0.1, 'layers': [1, 2]}}, 4)
+    new = pickle.dumps({'config': {'lr': 0.2, 'layers': [1, 2]}}, 4)
+    result = peekle.diffPickles(old, new)
+    assert [(change.kind, change.path) for change in result.changes] == [('changed', "['config']['lr']")]
+    assert not result.partial
+
+def test_partial_program():
+    # Sets are added with ADDITEMS in protocol 4, which is not supported. The
+    # first 1000 items are appended in a batch before the set is reached.
+    items = list(range(1000))
+    old = pickle.dumps(items + [{3}], 4)
+    items[5] = -1
+    new = pickle.dumps(items + [{3}], 4)
+    result = peekle.diffPickles(old, new, snippets=False)
+    assert result.partial
+    assert [change.path for change in result.changes] == ['[5]']
@@ -0,0 +1,120 @@
+import io
+import pickle
+import random
+import collections
+import peekle
+from peekle.il import Program, Insn, InsnType, ConstantValue
+
+VALUE = [{'k': i, 'v': (i, str(i)), 's': {i}} for i in range(30)]
+OPS = [InsnType.SET_ITEM, InsnType.GET_ATTR, InsnType.EXTEND, InsnType.LEN]
+
+def disassembled() -> Program:
+    return peekle.disassemble(pickle.dumps(VALUE, 2))
+
+# Compares the index against a scan of the whole program
+def checkIndex(program: Program):
+    counts = collections.Counter(insn.op for insn in program)
+    assert {op: len(insns) for op, insns in program.index.items() if insns} == counts
+    for op in InsnType:
+        expected = [insn for insn in program if insn.op is op]
+        assert program.countOp(op) == len(expected)
+        assert list(program.iterOps(op)) == expected
+    expected = [insn for insn in program if insn.op in (InsnType.SET_ITEM, InsnType.CALL)]
+    assert list(program.iterOps(InsnType.SET_ITEM, InsnType.CALL)) == expected
+    orders = [insn.order for insn in program]
+    assert orders == sorted(orders)
+
+def newInsn(rng: random.Random) -> Insn:
+    return Insn(rng.choice(OPS), [ConstantValue(rng.randrange(100))])
+
+def test_index_of_disassembled_program():
+    program = disassembled()
+    assert program.countOp(InsnType.SET_ITEM) > 0
+    checkIndex(program)
+    peekle.analyze(program)
+    checkIndex(program)
+
+def test_index_follows_insert_remove_replace():
+    rng = random.Random(0)
+    program = disassembled()
+    for step in range(500):
+        insns = list(program)
+        action = rng.randrange(3)
+        if action == 0:
+            program.insertInsn(newInsn(rng), rng.choice(insns + [None]))
+        else:
+            candidates = [insn for insn in insns if not insn.hasUses()]
+            target = rng.choice(candidates)
+            if action == 1:
+                program.removeInsn(target)
+            else:
+                program.replaceInsn(target, newInsn(rng))
+        if step % 25 == 0:
+            checkIndex(program)
+    checkIndex(program)
+
+def test_renumbering_keeps_index_order():
+    program = disassembled()
+    after = program.begin
+    epoch = program.orderEpoch
+    # Inserting after the same instruction halves the same gap every time
+    for i in range(100):
+        program.insertInsn(Insn(InsnType.LEN, [ConstantValue(i)]), after)
+    assert program.orderEpoch > epoch
+    assert [insn.args[0].value for insn in program.iterOps(InsnType.LEN)] == list(reversed(range(100)))
+    checkIndex(program)
+
+def test_clone_and_pickle_rebuild_the_index():
+    program = disassembled()
+    peekle.analyze(program)
+    program.appendInsn(InsnType.LEN, ConstantValue(1))
+    for copy in [program.clone(), pickle.loads(pickle.dumps(program))]:
+        checkIndex(copy)
+        assert str(copy) == str(program)
+        # The copy is indexed independently
+        assert all(insn not in program.index.get(insn.op, {}) for insn in copy)
+        for insn in list(copy.iterOps(InsnType.LEN)):
+            copy.removeInsn(insn)
+        assert copy.countOp(InsnType.LEN) == 0
+        assert program.countOp(InsnType.LEN) == 1
+
+def test_loaded_program_is_indexed():
+    program = disassembled()
+    f = io.BytesIO()
+    program.save(f)
+    loaded = Program.load(io.BytesIO(f.getvalue()))
+    checkIndex(loaded)
+    for op in InsnType:
+        assert loaded.countOp(op) == program.countOp(op)
+
+def test_remove_and_replace_while_iterating():
+    program = disassembled()
+    replaced = []
+    for i, insn in enumerate(iterator := program.iterOps(InsnType.SET_ITEM)):
+        if i % 2:
+            iterator.removeInsn()
+        else:
+            new = Insn(InsnType.SET_ITEM, insn.args[:])
+            iterator.replaceInsn(new)
+            replaced.append(new)
+    assert list(program.iterOps(InsnType.SET_ITEM)) == replaced
+    checkIndex(program)
+
+def test_inserted_instructions_are_visited_in_order():
+    program = Program()
+    for i in range(10):
+        program.appendInsn(InsnType.LEN, ConstantValue(i))
+    visited = []
+    for insn in (iterator := program.iterOps(InsnType.LEN, InsnType.EXTEND)):
+        visited.append(insn.args[0].value)
+        if insn.op is InsnType.LEN and insn.args[0].value % 3 == 0:
+            # Instructions after the current one are visited, and those
+            # before it are not
+            program.insertInsn(Insn(InsnType.EXTEND, [ConstantValue(f'after {insn.args[0].value}')]), insn)
+            program.insertInsn(Insn(InsnType.EXTEND, [ConstantValue(f'before {insn.args[0].value}')]), insn.prev)
+        if insn.args[0].value == 4:
+            iterator.removeInsn()
+    assert visited == [0, 'after 0', 1, 2, 3, 'after 3', 4, 5, 6, 'after 6', 7, 8, 9, 'after 9']
+    assert [insn.args[0].value for insn in program] == [
+        'before 0', 0, 'after 0', 1, 2, 'before 3', 3, 'after 3', 5, 'before 6', 6, 'after 6', 7, 8, 'before 9', 9, 'after 9']
+    checkIndex(program)
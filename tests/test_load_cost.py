@@ -0,0 +1,68 @@
+import sys
+import pickle
+import pytest
+import peekle
+from peekle.transform import load_cost
+
+class Point:
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+def deepSize(value, seen=None) -> int:
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deepSize(k, seen) + deepSize(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(deepSize(v, seen) for v in value)
+    return size
+
+def assertSizeMatches(value, protocol: int):
+    data = pickle.dumps(value, protocol)
+    cost = peekle.estimateLoadCost(data)
+    assert cost.types[type(value).__name__]['bytes'] == sys.getsizeof(pickle.loads(data))
+
+@pytest.mark.parametrize('n', [0, 1, 5, 6, 11, 100, 1000])
+def test_container_sizes_match_cpython(n):
+    for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+        assertSizeMatches({f'k{i}': i for i in range(n)}, protocol)
+        assertSizeMatches({i + 1000: i for i in range(n)}, protocol)
+        assertSizeMatches(frozenset(range(1000, 1000 + n)), protocol)
+    # Protocol 4 writes sets with ADDITEMS, which the disassembler does not handle
+    for protocol in range(4):
+        assertSizeMatches(set(range(1000, 1000 + n)), protocol)
+
+@pytest.mark.parametrize('protocol', range(pickle.HIGHEST_PROTOCOL + 1))
+def test_estimate_is_close_to_the_loaded_size(protocol):
+    value = {'names': [f'name{i}' * 3 for i in range(2000)], 'blob': b'x' * 100000,
+             'pairs': [(i * 1.5, str(i)) for i in range(500)]}
+    data = pickle.dumps(value, protocol)
+    cost = peekle.estimateLoadCost(data)
+    assert abs(cost.totalBytes - deepSize(pickle.loads(data))) / deepSize(value) < 0.05
+    assert not cost.partial
+
+def test_shared_values_are_counted_once():
+    shared = 'a shared string' * 100
+    cost = peekle.estimateLoadCost(pickle.dumps([shared] * 10, 4))
+    assert cost.types['str'] == {'objects': 1, 'builds': 0, 'bytes': sys.getsizeof(shared)}
+    assert cost.sharedReferences == 9
+
+def test_instances_are_keyed_by_class():
+    cost = peekle.estimateLoadCost(pickle.dumps([Point(1, 2), Point(3, 4)], 4))
+    entry = cost.types[f'{__name__}.Point']
+    assert (entry['objects'], entry['builds']) == (2, 2)
+    assert cost.toDict()['types'][f'{__name__}.Point']['bytes'] == 2 * load_cost.OBJECT_SIZE
+
+def test_partial_estimate():
+    cost = peekle.estimateLoadCost(pickle.dumps(list(range(1000)), 4)[:-20])
+    assert cost.partial
+    assert 'Partial estimate' in str(cost)
+
+def test_torch_storages(torchArchive):
+    with peekle.TorchArchive(torchArchive) as archive:
+        cost = peekle.estimateLoadCost(archive)
+    assert cost.types['torch.storage(float32)'] == {'objects': 1, 'builds': 0, 'bytes': 16}
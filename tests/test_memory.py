@@ -0,0 +1,39 @@
+import pickle
+import tracemalloc
+import peekle
+from peekle.memory import MemoryProfiler, ilFootprint
+
+VALUE = {'rows': [[i, str(i), (i, 'x')] for i in range(2000)]}
+
+def test_decompile_records_every_stage():
+    memory = MemoryProfiler()
+    peekle.decompile(pickle.dumps(VALUE, 4), memory=memory)
+    report = memory.report()
+    assert list(report['stages']) == ['disassemble', 'transform', 'codegen']
+    for stage in report['stages'].values():
+        assert stage['peak'] >= stage['retained']
+        assert stage['peakRss'] > 0
+        assert len(stage['topAllocations']) <= memory.topSites
+    assert report['stages']['disassemble']['retained'] > 0
+    assert len(report['ilTypes']) <= memory.topTypes
+    assert not tracemalloc.is_tracing()
+    assert 'disassemble: peak' in str(memory)
+
+def test_allocation_sites_point_into_the_package():
+    memory = MemoryProfiler()
+    with memory.stage('disassemble'):
+        program = peekle.disassemble(pickle.dumps(VALUE, 4))
+    sites = memory.stages['disassemble']['topAllocations']
+    assert sites
+    assert any(site['site'].startswith('peekle/') for site in sites)
+    assert not any('memory.py' in site['site'] for site in sites)
+    assert program is not None
+
+def test_footprint_counts_shared_values_once():
+    shared = ('shared', 1)
+    program = peekle.disassemble(pickle.dumps([shared] * 100, 4))
+    peekle.analyze(program)
+    footprint = ilFootprint(program)
+    assert footprint['ConstantTuple']['count'] == 1
+    sizes = [entry['bytes'] for entry in footprint.values()]
+    assert sizes == sorted(sizes, reverse=True)
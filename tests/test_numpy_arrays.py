@@ -0,0 +1,106 @@
+import os
+import sys
+import types
+import pickle
+import struct
+import pytest
+import peekle
+from peekle.codegen import SidecarWriter
+
+# Stand-ins for the numpy globals arrays are pickled with, so that the pickles
+# have the same shape as numpy's without numpy installed
+class ndarray:
+    pass
+
+class dtype:
+    pass
+
+def _reconstruct(*args):
+    pass
+
+def _frombuffer(*args):
+    pass
+
+MODULES = {
+    'numpy': {'ndarray': ndarray, 'dtype': dtype},
+    'numpy.core.multiarray': {'_reconstruct': _reconstruct},
+    'numpy.core.numeric': {'_frombuffer': _frombuffer},
+}
+
+class Dtype:
+    def __init__(self, typestr: str, byteorder: str = '<', names=None):
+        self.typestr = typestr
+        self.byteorder = byteorder
+        self.names = names
+
+    def __reduce__(self):
+        return dtype, (self.typestr, False, True), (3, self.byteorder, None, self.names, None, -1, -1, 0)
+
+class Array:
+    def __init__(self, dtype: Dtype, shape: tuple, data: bytes, fortran: bool = False):
+        self.dtype = dtype
+        self.shape = shape
+        self.data = data
+        self.fortran = fortran
+
+    def __reduce_ex__(self, protocol):
+        if protocol >= 5:
+            return _frombuffer, (self.data, self.dtype, self.shape, 'F' if self.fortran else 'C')
+        return _reconstruct, (ndarray, (0,), b'b'), (1, self.shape, self.dtype, self.fortran, self.data)
+
+@pytest.fixture(autouse=True)
+def numpyModules(monkeypatch):
+    for name, members in MODULES.items():
+        module = types.ModuleType(name)
+        for member, value in members.items():
+            value.__module__ = name
+            setattr(module, member, value)
+        monkeypatch.setitem(sys.modules, name, module)
+
+DATA = struct.pack('<6d', *range(6))
+
+def ndarrays(program) -> list:
+    return [insn for insn in program if insn.op == peekle.il.InsnType.NDARRAY]
+
+@pytest.mark.parametrize('protocol', range(2, pickle.HIGHEST_PROTOCOL + 1))
+def test_arrays_are_recognized(protocol):
+    program = peekle.disassemble(pickle.dumps({'w': Array(Dtype('f8'), (2, 3), DATA)}, protocol))
+    peekle.analyze(program)
+    [array] = ndarrays(program)
+    descr, shape, order, data = array.args
+    assert (descr.value, [v.value for v in shape.values], order.value, bytes(data.value)) == ('<f8', [2, 3], 'C', DATA)
+    # The dtype is no longer needed once the array is recognized
+    assert not any(isinstance(insn.args[0], peekle.il.ConstantGlobal) and insn.args[0].name == 'dtype'
+                   for insn in program if insn.op == peekle.il.InsnType.CALL)
+    source = peekle.codegen.CodeGenerator().generateSource(program)
+    assert "numpy.frombuffer(" in source
+    assert ".reshape((2, 3), order='C')" in source
+
+def test_fortran_order_and_byteorder():
+    program = peekle.disassemble(pickle.dumps(Array(Dtype('i4', '>'), (3, 2), DATA[:24], fortran=True), 4))
+    peekle.analyze(program)
+    [array] = ndarrays(program)
+    assert (array.args[0].value, array.args[2].value) == ('>i4', 'F')
+
+@pytest.mark.parametrize('dtype', [Dtype('O8', '|'), Dtype('V16', '|', names=('a', 'b'))])
+def test_unsupported_dtypes_are_left_alone(dtype):
+    program = peekle.disassemble(pickle.dumps(Array(dtype, (1,), bytes(16)), 4))
+    peekle.analyze(program)
+    assert ndarrays(program) == []
+
+def test_large_arrays_go_to_the_sidecar(tmp_path):
+    data = bytes(range(256)) * 512
+    program = peekle.disassemble(pickle.dumps(Array(Dtype('u1', '|'), (len(data),), data), 4))
+    peekle.analyze(program)
+    sidecar = SidecarWriter(str(tmp_path))
+    source = peekle.codegen.CodeGenerator(sidecar=sidecar).generateSource(program)
+    [path] = sidecar.written
+    assert f"numpy.load({path!r}, mmap_mode='c')" in source
+    with open(path, 'rb') as f:
+        npy = f.read()
+    headerSize = struct.unpack('<H', npy[8:10])[0]
+    assert npy.startswith(b'\x93NUMPY\x01\x00')
+    assert (10 + headerSize) % 64 == 0
+    assert "'descr': '|u1'" in npy[10:10 + headerSize].decode('latin-1')
+    assert npy[10 + headerSize:] == data
+    assert os.path.basename(path).endswith('.npy')
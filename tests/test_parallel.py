@@ -0,0 +1,78 @@
+import gc
+import pickle
+import multiprocessing
+import collections
+import pytest
+import peekle
+from peekle.codegen import parallel as codegenParallel
+from peekle.transform import parallel as transformParallel
+
+# Large enough to be split into several parts at the minimum sizes set below
+VALUE = {f'k{i}': [i, str(i), collections.OrderedDict(a=i)] for i in range(600)}
+
+def normalized(source: str) -> tuple[set[str], list[str]]:
+    lines = source.splitlines()
+    return set(line for line in lines if line.startswith('import ')), [line for line in lines if not line.startswith('import ')]
+
+def analyzedProgram():
+    program = peekle.disassemble(pickle.dumps(VALUE, 4))
+    peekle.analyze(program)
+    return program
+
+def test_sharded_codegen_matches_serial(monkeypatch):
+    monkeypatch.setattr(codegenParallel, 'MIN_PARALLEL_SIZE', 100)
+    serial = peekle.codegen.CodeGenerator().generateSource(analyzedProgram())
+    program = analyzedProgram()
+    assert len(codegenParallel.findShards(list(program), 200)) > 1
+    sharded = codegenParallel.generateSharded(peekle.codegen.CodeGenerator(), program, 2, shardSize=200)
+    assert normalized(sharded) == normalized(serial)
+
+def test_sharded_codegen_without_fork_is_serial(monkeypatch):
+    monkeypatch.setattr(codegenParallel, 'MIN_PARALLEL_SIZE', 100)
+    monkeypatch.setattr(multiprocessing, 'get_all_start_methods', lambda: ['spawn'])
+    serial = peekle.codegen.CodeGenerator().generateSource(analyzedProgram())
+    sharded = codegenParallel.generateSharded(peekle.codegen.CodeGenerator(), analyzedProgram(), 2, shardSize=200)
+    assert sharded == serial
+
+def opCounts(program) -> collections.Counter:
+    return collections.Counter(insn.op.name for insn in program)
+
+def test_partitioned_transform_matches_serial(monkeypatch):
+    monkeypatch.setattr(transformParallel, 'MIN_PARALLEL_SIZE', 100)
+    data = pickle.dumps(VALUE, 4)
+    serial = peekle.disassemble(data)
+    peekle.analyze(serial)
+    program = peekle.disassemble(data)
+    manager = peekle.transform.createDefaultTransformManager()
+    assert transformParallel.partitionProgram(peekle.disassemble(data), 200) is not None
+    transformParallel.runPartitioned(manager, program, maxPasses=peekle.transform.DEFAULT_MAX_PASSES, workers=2,
+                                     partitionSize=200)
+    assert opCounts(program) == opCounts(serial)
+
+def test_partitioned_transform_without_fork_is_serial(monkeypatch):
+    monkeypatch.setattr(transformParallel, 'MIN_PARALLEL_SIZE', 100)
+    monkeypatch.setattr(multiprocessing, 'get_all_start_methods', lambda: ['spawn'])
+    data = pickle.dumps(VALUE, 4)
+    serial = peekle.disassemble(data)
+    peekle.analyze(serial)
+    program = peekle.disassemble(data)
+    peekle.analyze(program, workers=2)
+    assert str(program) == str(serial)
+
+def test_decompile_parallel_stages():
+    data = pickle.dumps(VALUE, 4)
+    assert peekle.decompile(data, workers=2, parallelStages=peekle.PARALLEL_STAGES) == peekle.decompile(data)
+    with pytest.raises(ValueError):
+        peekle.decompile(data, workers=2, parallelStages=['transform'])
+
+def test_parallel_disassembly_matches_serial(monkeypatch):
+    from peekle.il import dis, parallel as ilParallel
+    monkeypatch.setattr(dis, 'MIN_PARALLEL_SIZE', 0)
+    monkeypatch.setattr(ilParallel, 'MIN_CHUNK_SIZE', 1 << 16)
+    data = pickle.dumps([str(i) * 4 for i in range(50000)], 4)
+    assert len(ilParallel.indexFrames(data, 0)) > 2
+    serial = peekle.disassemble(data)
+    parallel = peekle.disassemble(data, workers=2)
+    assert str(parallel) == str(serial)
+    # Nothing outside the workers touches the garbage collector
+    assert gc.isenabled()
@@ -0,0 +1,100 @@
+import pickle
+import pytest
+import peekle
+from peekle.codegen import parallel as codegenParallel
+
+VALUE = [{'k': i, 'v': (i, str(i))} for i in range(300)]
+DATA = pickle.dumps(VALUE, 4)
+
+# Records every event, and cancels at the first one of the given stage
+class Recorder:
+    def __init__(self, cancelStage: str | None = None):
+        self.events = []
+        self.cancelStage = cancelStage
+
+    def __call__(self, event):
+        self.events.append(event)
+        return event.stage == self.cancelStage
+
+    def stages(self) -> list[str]:
+        stages = []
+        for event in self.events:
+            if not stages or stages[-1] != event.stage:
+                stages.append(event.stage)
+        return stages
+
+def test_every_stage_is_reported():
+    recorder = Recorder()
+    source = peekle.decompile(DATA, progress=peekle.Progress(recorder, interval=50))
+    assert recorder.stages() == ['disassemble', 'transform', 'codegen']
+
+    disassembly = [event for event in recorder.events if event.stage == 'disassemble']
+    assert len(disassembly) > 1
+    assert all(event.unit == 'bytes' and event.total == len(DATA) for event in disassembly)
+    assert [event.done for event in disassembly] == sorted(event.done for event in disassembly)
+    assert disassembly[-1].done == len(DATA)
+
+    passes = [event for event in recorder.events if event.stage == 'transform']
+    assert [event.done for event in passes] == list(range(1, len(passes) + 1))
+    assert all(event.unit == 'passes' for event in passes)
+
+    codegen = [event for event in recorder.events if event.stage == 'codegen']
+    assert codegen[-1].done == codegen[-1].total
+    assert all(event.unit == 'instructions' for event in codegen)
+
+    assert source == peekle.decompile(DATA)
+
+def test_cancelled_disassembly_ends_in_poison():
+    recorder = Recorder('disassemble')
+    progress = peekle.Progress(recorder, interval=50)
+    program = peekle.disassemble(DATA, progress=progress)
+    assert progress.cancelled
+    assert program.poison
+    assert program.end.op is peekle.il.InsnType.POISON
+    assert program.end.args[0].value.startswith('Cancelled at byte')
+    # Nothing is reported after cancelling
+    assert len(recorder.events) == 1
+    assert len(list(program)) < len(list(peekle.disassemble(DATA)))
+
+@pytest.mark.parametrize('stage', ['disassemble', 'transform'])
+def test_decompile_raises_with_partial_program(stage):
+    recorder = Recorder(stage)
+    with pytest.raises(peekle.Cancelled) as info:
+        peekle.decompile(DATA, progress=peekle.Progress(recorder, interval=50))
+    program = info.value.program
+    assert program is not None
+    assert recorder.stages()[-1] == stage
+    # Only a cancelled disassembly leaves the program incomplete
+    assert program.poison == (stage == 'disassemble')
+
+def test_cancelled_codegen_ends_with_raise():
+    recorder = Recorder('codegen')
+    source = peekle.decompile(DATA, progress=peekle.Progress(recorder, interval=50))
+    assert len([event for event in recorder.events if event.stage == 'codegen']) == 1
+    assert source.rstrip().splitlines()[-1].startswith('raise pickle.UnpicklingError(')
+    with pytest.raises(pickle.UnpicklingError, match='Cancelled after 50 of'):
+        exec(source, {})
+
+def test_cancel_before_start():
+    recorder = Recorder()
+    progress = peekle.Progress(recorder)
+    progress.cancel()
+    program = peekle.disassemble(DATA, progress=progress)
+    assert not program.poison
+    assert recorder.events == []
+    with pytest.raises(peekle.Cancelled):
+        peekle.decompile(DATA, progress=progress)
+
+def test_cancelled_sharded_codegen_ends_with_raise(monkeypatch):
+    monkeypatch.setattr(codegenParallel, 'MIN_PARALLEL_SIZE', 100)
+    program = peekle.disassemble(DATA)
+    peekle.analyze(program)
+    shards = codegenParallel.findShards(list(program), 200)
+    assert len(shards) > 2
+    recorder = Recorder('codegen')
+    generator = peekle.codegen.CodeGenerator(progress=peekle.Progress(recorder))
+    source = codegenParallel.generateSharded(generator, program, 2, shardSize=200)
+    assert [event.detail for event in recorder.events] == [f'shard 1/{len(shards)}']
+    assert source.rstrip().splitlines()[-1].startswith('raise pickle.UnpicklingError(')
+    with pytest.raises(pickle.UnpicklingError, match=f'Cancelled after {len(shards[0])} of'):
+        exec(source, {})
@@ -0,0 +1,59 @@
+import pickle
+import peekle
+
+def globalOp(module: str, name: str) -> bytes:
+    return pickle.GLOBAL + f'{module}\n{name}\n'.encode()
+
+def shortString(value: str) -> bytes:
+    data = value.encode()
+    return pickle.SHORT_BINUNICODE + bytes([len(data)]) + data
+
+# Pickles that run a shell command while loading, discard the result and load
+# to 1. They are only ever decompiled here, never loaded.
+def test_map_payload_stays_visible():
+    payload = pickle.PROTO + b'\x02' + globalOp('builtins', 'list') + globalOp('builtins', 'map') + \
+        globalOp('os', 'system') + shortString('echo pwned') + pickle.TUPLE1 + pickle.TUPLE2 + pickle.REDUCE + \
+        pickle.TUPLE1 + pickle.REDUCE + pickle.POP + pickle.BININT1 + b'\x01' + pickle.STOP
+    source = peekle.decompile(payload)
+    assert 'map(os.system' in source
+    assert 'list(' in source
+
+def test_operator_call_payload_stays_visible():
+    payload = pickle.PROTO + b'\x02' + globalOp('operator', 'call') + globalOp('os', 'system') + \
+        shortString('echo pwned') + pickle.TUPLE2 + pickle.REDUCE + pickle.POP + pickle.BININT1 + b'\x01' + pickle.STOP
+    source = peekle.decompile(payload)
+    assert 'os.system' in source
+    assert 'echo pwned' in source
+
+def test_unused_constructor_is_removed():
+    payload = pickle.PROTO + b'\x02' + globalOp('builtins', 'list') + shortString('abc') + pickle.TUPLE1 + \
+        pickle.REDUCE + pickle.POP + pickle.BININT1 + b'\x01' + pickle.STOP
+    assert 'list' not in peekle.decompile(payload)
+
+def test_getitem_on_defaultdict_payload_stays_visible():
+    payload = pickle.PROTO + b'\x02' + globalOp('operator', 'getitem') + globalOp('collections', 'defaultdict') + \
+        globalOp('os', 'system') + pickle.TUPLE1 + pickle.REDUCE + shortString('echo pwned') + pickle.TUPLE2 + \
+        pickle.REDUCE + pickle.POP + pickle.BININT1 + b'\x01' + pickle.STOP
+    for analysis in (True, False):
+        source = peekle.decompile(payload, analysis=analysis)
+        assert 'defaultdict(os.system)' in source
+        assert 'echo pwned' in source
+
+def test_operator_dunder_payload_stays_visible():
+    payload = pickle.PROTO + b'\x02' + globalOp('operator', '__setitem__') + globalOp('os', 'environ') + \
+        shortString('LD_PRELOAD') + shortString('/tmp/x.so') + pickle.TUPLE3 + pickle.REDUCE + pickle.POP + \
+        pickle.BININT1 + b'\x01' + pickle.STOP
+    for analysis in (True, False):
+        source = peekle.decompile(payload, analysis=analysis)
+        assert 'os.environ' in source
+        assert 'LD_PRELOAD' in source
+
+def test_unused_pure_call_on_literals_is_removed():
+    payload = pickle.PROTO + b'\x02' + globalOp('operator', 'add') + pickle.BININT1 + b'\x01' + \
+        pickle.BININT1 + b'\x02' + pickle.TUPLE2 + pickle.REDUCE + pickle.POP + pickle.BININT1 + b'\x01' + pickle.STOP
+    assert 'operator' not in peekle.decompile(payload)
+
+def test_fingerprint_changes_with_declarations():
+    before = peekle.transform.purityFingerprint()
+    peekle.transform.declarePurity('peekle_tests.fingerprint', 'f', peekle.transform.PURE)
+    assert peekle.transform.purityFingerprint() != before
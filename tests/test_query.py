@@ -0,0 +1,49 @@
+import pickle
+import collections
+import pytest
+import peekle
+from peekle.transform import parsePath, sliceProgram
+
+class Config:
+    def __init__(self):
+        self.name = 'model'
+        self.layers = [4, 8]
+
+VALUE = {
+    'state_dict': collections.OrderedDict([('encoder.weight', [1.0, 2.0]), ('decoder.weight', [3.0])]),
+    'config': Config(),
+    'meta': (1, {'x': 'y'}),
+}
+
+def queried(path: str, protocol: int = 4) -> object:
+    program = peekle.disassemble(pickle.dumps(VALUE, protocol))
+    sliceProgram(program, path)
+    peekle.analyze(program)
+    namespace = {'__name__': __name__}
+    exec(peekle.codegen.CodeGenerator().generateBinding(program), namespace)
+    return namespace['value']
+
+def test_parse_path():
+    assert parsePath("['state_dict']['encoder.weight']") == [('item', 'state_dict'), ('item', 'encoder.weight')]
+    assert parsePath("obj['config'].name") == [('item', 'config'), ('attr', 'name')]
+    assert parsePath('.meta[0]') == [('attr', 'meta'), ('item', 0)]
+    for path in ['[', "[f()]", "['a'](1)"]:
+        with pytest.raises(ValueError):
+            parsePath(path)
+
+@pytest.mark.parametrize('protocol', range(pickle.HIGHEST_PROTOCOL + 1))
+def test_query_value(protocol):
+    assert queried("['state_dict']['encoder.weight']", protocol) == [1.0, 2.0]
+    assert queried("['config'].layers", protocol) == [4, 8]
+    assert queried("['meta'][1]['x']", protocol) == 'y'
+
+def test_query_keeps_only_the_slice():
+    source = peekle.decompile(pickle.dumps(VALUE, 4), query="['state_dict']['encoder.weight']")
+    assert '2.0' in source
+    assert '3.0' not in source
+    assert 'Config' not in source
+
+def test_unresolvable_query():
+    program = peekle.disassemble(pickle.dumps(VALUE, 4))
+    with pytest.raises(ValueError):
+        sliceProgram(program, "['missing']")
@@ -0,0 +1,63 @@
+import uuid
+import pickle
+import datetime
+import collections
+import pytest
+import peekle
+from peekle.transform import recognizers
+
+VALUES = {
+    'bytes': b'\x00\xffraw',
+    'datetime': datetime.datetime(2024, 1, 2, 3, 4, 5, 6),
+    'date': datetime.date(2024, 1, 2),
+    'time': datetime.time(3, 4, 5, 6),
+    'ordered_dict': collections.OrderedDict([('b', 1), ('a', 2)]),
+    'deque': collections.deque([1, 2, 3], maxlen=5),
+    'uuid': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+}
+
+# Literal forms the recognizers fold the values into
+LITERALS = {
+    'bytes': "b'\\x00\\xffraw'",
+    'datetime': 'datetime.datetime(2024, 1, 2, 3, 4, 5, 6)',
+    'date': 'datetime.date(2024, 1, 2)',
+    'time': 'datetime.time(3, 4, 5, 6)',
+    'ordered_dict': "collections.OrderedDict([('b', 1), ('a', 2)])",
+    'deque': 'collections.deque([1, 2, 3], 5)',
+    'uuid': "uuid.UUID('12345678-1234-5678-1234-567812345678')",
+}
+
+def evaluate(source: str) -> object:
+    namespace = {}
+    exec(source, namespace)
+    return namespace['value']
+
+@pytest.mark.parametrize('protocol', range(pickle.HIGHEST_PROTOCOL + 1))
+@pytest.mark.parametrize('name', list(VALUES))
+def test_values_are_folded_into_literals(name, protocol):
+    program = peekle.disassemble(pickle.dumps(VALUES[name], protocol))
+    peekle.analyze(program)
+    source = peekle.codegen.CodeGenerator().generateBinding(program)
+    assert evaluate(source) == VALUES[name]
+    assert LITERALS[name] in source
+    assert '_codecs' not in source
+    assert 'build(' not in source
+
+def test_python2_names_are_normalized():
+    program = peekle.disassemble(pickle.dumps(set([1]), 2))
+    peekle.analyze(program)
+    assert '__builtin__' not in str(program)
+
+def test_registered_recognizer(monkeypatch):
+    monkeypatch.setattr(recognizers, 'RECOGNIZERS', {})
+    calls = []
+
+    @recognizers.recognizer('collections', 'Counter')
+    def recognizeCounter(program, it, insn):
+        calls.append(insn)
+        return False
+
+    program = peekle.disassemble(pickle.dumps(collections.Counter('aab'), 4))
+    peekle.analyze(program)
+    assert calls and all(insn is calls[0] for insn in calls)
+    assert recognizers.RECOGNIZERS == {('collections', 'Counter'): [recognizeCounter]}
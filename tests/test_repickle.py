@@ -0,0 +1,71 @@
+import pickle
+import peekle
+
+VALUES = [
+    [(0.0,), (-0.0,)],
+    [(0j,), (-0j,), (complex(0.0, -0.0),)],
+    [(1,), (1.0,), (True,)],
+    {'a': [1, 2, (3, 'x')], 'b': (b'bytes', None, 2.5), 'c': {'nested': [(0.0, -0.0)]}},
+    [bytearray(b'abc'), frozenset([1, 2]), ('shared',) * 3],
+]
+
+def test_repickle_round_trip():
+    for value in VALUES:
+        for protocol in range(6):
+            data = pickle.dumps(value, protocol)
+            for outProtocol in (4, 5):
+                result = pickle.loads(peekle.repickle(data, protocol=outProtocol))
+                assert repr(result) == repr(pickle.loads(data)), (value, protocol, outProtocol)
+
+# Instances are pickled by reference to this module, pickle imports it again
+# when loading
+class Point:
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+class Slots:
+    __slots__ = ('a', 'b')
+
+    def __init__(self, a):
+        self.a = a
+        self.b = [a]
+
+class KeywordOnly:
+    def __new__(cls, *, name):
+        obj = super().__new__(cls)
+        obj.name = name
+        return obj
+
+    def __getnewargs_ex__(self):
+        return (), {'name': self.name}
+
+def roundTrips(value, protocols=range(6)):
+    for protocol in protocols:
+        data = pickle.dumps(value, protocol)
+        for outProtocol in (4, 5):
+            yield protocol, pickle.loads(peekle.repickle(data, protocol=outProtocol))
+
+def test_repickle_instances_without_init():
+    for protocol, point in roundTrips(Point(1, 2)):
+        assert (type(point), point.x, point.y) == (Point, 1, 2), protocol
+
+    # Classes with __slots__ can only be pickled from protocol 2
+    for protocol, slots in roundTrips(Slots('s'), range(2, 6)):
+        assert (type(slots), slots.a, slots.b) == (Slots, 's', ['s']), protocol
+
+    for protocol, result in roundTrips(KeywordOnly(name='k'), range(2, 6)):
+        assert (type(result), result.name) == (KeywordOnly, 'k'), protocol
+
+def test_repickle_shared_references_and_cycles():
+    point = Point([], None)
+    point.y = point
+    shared = [1, 2]
+    for protocol, result in roundTrips({'a': shared, 'b': shared, 'p': point}):
+        assert result['a'] is result['b'], protocol
+        assert result['p'].y is result['p'], protocol
+
+    cycle = []
+    cycle.append(cycle)
+    for protocol, result in roundTrips(cycle):
+        assert result[0] is result, protocol
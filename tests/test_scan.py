@@ -0,0 +1,55 @@
+import copyreg
+import pickle
+import peekle
+
+class Thing:
+    pass
+
+def imports(result) -> dict:
+    return {(entry['module'], entry['name']): (entry['references'], entry['calls']) for entry in result['imports']}
+
+def test_scan_counts_references_and_calls():
+    value = [Thing(), Thing(), {'d': __import__('collections').OrderedDict(a=1)}]
+    for protocol in range(6):
+        result = peekle.scanImports(pickle.dumps(value, protocol))
+        found = imports(result)
+        assert result['error'] is None, protocol
+        assert (__name__, 'Thing') in found, protocol
+        assert ('collections', 'OrderedDict') in found, protocol
+        assert found['collections', 'OrderedDict'][1] == 1, protocol
+
+def test_scan_stack_global_from_memo():
+    # STACK_GLOBAL with both names fetched back from the memo
+    payload = pickle.PROTO + b'\x04' + pickle.SHORT_BINUNICODE + b'\x02os' + pickle.MEMOIZE + \
+        pickle.SHORT_BINUNICODE + b'\x06system' + pickle.MEMOIZE + pickle.POP + pickle.POP + \
+        pickle.BINGET + b'\x00' + pickle.BINGET + b'\x01' + pickle.STACK_GLOBAL + \
+        pickle.SHORT_BINUNICODE + b'\x02id' + pickle.TUPLE1 + pickle.REDUCE + pickle.STOP
+    result = peekle.scanImports(payload)
+    assert imports(result) == {('os', 'system'): (1, 1)}
+    assert result['dynamicGlobals'] == 0
+
+def test_scan_extension_codes():
+    payload = b'\x80\x02\x82\xf0X\x07\x00\x00\x00echo hi\x85R.'
+    result = peekle.scanImports(payload)
+    assert result['imports'] == []
+    assert result['dynamicGlobals'] == 1
+
+    copyreg.add_extension('os', 'system', 0xf0)
+    try:
+        result = peekle.scanImports(payload)
+    finally:
+        copyreg.remove_extension('os', 'system', 0xf0)
+    assert imports(result) == {('os', 'system'): (1, 1)}
+    assert result['dynamicGlobals'] == 0
+
+def test_scan_reports_error_after_partial_result():
+    data = pickle.dumps([Thing()], 2)
+    result = peekle.scanImports(data[:-1])
+    assert (__name__, 'Thing') in imports(result)
+    assert result['error'] is not None
+
+def test_scan_classifies_globals():
+    payload = pickle.dumps([len, Thing], 3)
+    classes = {(entry['module'], entry['name']): entry['class'] for entry in peekle.scanImports(payload, classify=True)['imports']}
+    assert classes['builtins', 'len'] == 'pure'
+    assert classes[__name__, 'Thing'] == 'impure'
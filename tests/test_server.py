@@ -0,0 +1,85 @@
+import socket
+import pickle
+import threading
+import pytest
+import peekle
+from peekle import server
+
+VALUE = {'a': [1, 2.5, 'x'], 'b': (None, True, b'raw')}
+
+@pytest.fixture
+def serve(tmp_path):
+    servers = []
+
+    def start(**kwargs) -> str:
+        path = str(tmp_path / f'{len(servers)}.sock')
+        instance = server.DecompileServer(path, workers=1, **kwargs)
+        threading.Thread(target=instance.serve_forever, daemon=True).start()
+        servers.append(instance)
+        return path
+
+    yield start
+    for instance in servers:
+        instance.shutdown()
+        instance.server_close()
+
+def test_framing():
+    a, b = socket.socketpair()
+    with a, b:
+        server.sendMessage(a, {'output': 'il'}, b'payload')
+        server.sendMessage(a, {})
+        assert server.recvMessage(b) == ({'output': 'il'}, b'payload')
+        assert server.recvMessage(b) == ({}, b'')
+        a.sendall(server.HEADER_LENGTH.pack(server.MAX_HEADER_SIZE + 1))
+        with pytest.raises(ValueError):
+            server.recvMessage(b)
+
+def test_framing_limits_and_closed_connections():
+    a, b = socket.socketpair()
+    with b:
+        server.sendMessage(a, {}, b'0123456789')
+        with pytest.raises(ValueError):
+            server.recvMessage(b, maxPayload=4)
+    a, b = socket.socketpair()
+    with b:
+        a.sendall(server.HEADER_LENGTH.pack(10) + b'{}')
+        a.close()
+        with pytest.raises(ConnectionError):
+            server.recvMessage(b)
+    a, b = socket.socketpair()
+    with b:
+        a.close()
+        assert server.recvMessage(b) is None
+
+def test_requests(serve, tmp_path):
+    path = serve()
+    data = pickle.dumps(VALUE, 4)
+    header, payload = server.request(path, {}, data)
+    assert header['status'] == 'ok'
+    assert payload.decode('utf-8') == peekle.decompile(data)
+
+    (tmp_path / 'value.pkl').write_bytes(data)
+    header, payload = server.request(path, {'path': str(tmp_path / 'value.pkl'), 'output': 'il', 'analysis': False})
+    assert header['status'] == 'ok'
+    assert payload.decode('utf-8') == str(peekle.disassemble(data))
+
+    header, payload = server.request(path, {'output': 'stats'}, data)
+    assert header['stats']['inputSize'] == len(data)
+    assert payload == b''
+
+    header, _ = server.request(path, {}, data[:-5])
+    assert header['status'] == 'poisoned'
+    header, _ = server.request(path, {'output': 'bytecode'}, data)
+    assert header['status'] == 'error'
+
+def test_oversized_request_is_answered(serve):
+    path = serve(maxPayload=16)
+    header, payload = server.request(path, {}, pickle.dumps(VALUE, 4))
+    assert header['status'] == 'error'
+    assert 'exceeds the limit' in header['error']
+
+def test_timeout(serve):
+    path = serve(timeout=0.001)
+    data = pickle.dumps([[i, str(i)] for i in range(100000)], 4)
+    header, _ = server.request(path, {}, data)
+    assert header == {'status': 'error', 'error': 'RequestTimeout: Request exceeded the time limit'}
@@ -0,0 +1,35 @@
+import io
+import pickle
+import collections
+import pickletools
+import pytest
+from peekle.il import dis
+
+def collect(data: bytes):
+    disassembler = dis.Disassembler(io.BytesIO(data), collectStats=True)
+    disassembler.disassemble()
+    return disassembler.stats
+
+@pytest.mark.parametrize('protocol', range(pickle.HIGHEST_PROTOCOL + 1))
+def test_counts_match_pickletools(protocol):
+    shared = {'k': 'v'}
+    data = pickle.dumps([shared, shared, collections.OrderedDict(a=1), b'x' * 300, 2 ** 100], protocol)
+    stats = collect(data).toDict()
+    ops = list(pickletools.genops(data))
+    assert stats['opcodes'] == dict(collections.Counter(op.name for op, _, _ in ops))
+    assert stats['totalBytes'] == len(data)
+    assert sum(stats['familyBytes'].values()) == len(data)
+    assert stats['memoGets'] == sum(1 for op, _, _ in ops if op.name in ('GET', 'BINGET', 'LONG_BINGET'))
+    assert stats['memoGets'] >= 1
+    assert stats['largestConstant']['size'] == 300
+    assert {'module': 'collections', 'name': 'OrderedDict', 'count': 1} in stats['globals']
+
+def test_mark_depth():
+    stats = collect(pickle.dumps((((1, 2),),), 0))
+    assert stats.maxMarkDepth == 3
+    assert stats.markDepth == 0
+
+def test_stats_are_off_by_default():
+    disassembler = dis.Disassembler(io.BytesIO(pickle.dumps([1], 4)))
+    disassembler.disassemble()
+    assert disassembler.stats is None